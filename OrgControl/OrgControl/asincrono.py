@@ -0,0 +1,24 @@
+"""
+Apoyo para las vistas asíncronas.
+
+Bajo ASGI una vista asíncrona no retiene un worker mientras espera: usa el
+ORM asíncrono (aget, acount, aaggregate, aiterator, async for), cuyas
+consultas Django ejecuta en un hilo aparte, y el bucle de eventos sigue
+atendiendo otras peticiones, en especial las descargas en streaming de
+clientes lentos. Lo síncrono que toque la base de datos pasa por
+sync_to_async.
+
+LoginRequiredMixin no sirve para estas vistas porque lee request.user, que
+consulta la base de datos de forma síncrona; LoginRequiredAsyncMixin usa
+request.auser() y deja el usuario resuelto en request.user.
+"""
+from django.contrib.auth.mixins import AccessMixin
+
+
+class LoginRequiredAsyncMixin(AccessMixin):
+    async def dispatch(self, request, *args, **kwargs):
+        # El resto de la vista (y la plantilla) usan request.user sin otra consulta
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
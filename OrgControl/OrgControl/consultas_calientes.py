@@ -0,0 +1,136 @@
+"""
+Registro de las consultas más frecuentes y revisión de sus planes de
+ejecución.
+
+Cada app declara sus consultas en <app>/consultas_calientes.py con el
+decorador registrar(). La función no recibe argumentos: toma de la base de
+datos los ids de muestra que necesite y devuelve el queryset tal como lo
+ejecuta la vista, o None si no hay datos con qué armarlo.
+
+explicar() obtiene el plan con EXPLAIN (FORMAT JSON) en PostgreSQL o con
+EXPLAIN QUERY PLAN en SQLite y lista las tablas que se recorren completas.
+En SQLite cuenta todo SCAN de una tabla, también el que recorre un índice,
+salvo que sea el bucle exterior de una consulta con LIMIT que no ordena ni
+agrupa antes en un B-tree temporal: ese se detiene al completar la página.
+Con pocas filas el planificador prefiere recorrer la tabla aunque exista
+un índice, por eso el comando explicar_consultas solo falla cuando la
+tabla recorrida supera un umbral de filas.
+"""
+import json
+import re
+
+from django.db import NotSupportedError, connections
+from django.utils.module_loading import autodiscover_modules
+
+_registro = {}
+
+# Django usa alias como T6 o U0 en joins repetidos y subconsultas
+_ALIAS = re.compile(r'"(\w+)"\s+([A-Z]\d+)\b')
+_RECORRIDO_SQLITE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX \w+)?$')
+# LIMIT de la consulta exterior, siempre al final del SQL que genera Django
+_LIMITE = re.compile(r'\sLIMIT \S+(?: OFFSET \S+)?$')
+# Pasos que leen todas las filas antes de que el LIMIT pueda cortar
+_ORDEN_TEMPORAL = ('USE TEMP B-TREE FOR ORDER BY', 'USE TEMP B-TREE FOR GROUP BY', 'USE TEMP B-TREE FOR DISTINCT')
+
+
+class Consulta:
+    def __init__(self, nombre, funcion):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.descripcion = (funcion.__doc__ or '').strip().split('\n')[0]
+
+    def queryset(self):
+        return self.funcion()
+
+
+class Plan:
+    """Plan de ejecución: las líneas legibles y las tablas recorridas completas"""
+    def __init__(self, lineas, recorridas, using='default'):
+        self.lineas = lineas
+        self.recorridas = recorridas
+        self.using = using
+
+
+def registrar(nombre):
+    """Decorador que registra una consulta frecuente bajo `nombre`"""
+    def decorador(funcion):
+        _registro[nombre] = Consulta(nombre, funcion)
+        return funcion
+    return decorador
+
+
+def registradas():
+    """Consultas de todas las apps instaladas, ordenadas por nombre"""
+    autodiscover_modules('consultas_calientes')
+    return [_registro[nombre] for nombre in sorted(_registro)]
+
+
+def explicar(queryset):
+    using = queryset.db
+    conexion = connections[using]
+    sql, params = queryset.query.sql_with_params()
+    if conexion.vendor == 'postgresql':
+        explicar_sql = _explicar_postgresql
+    elif conexion.vendor == 'sqlite':
+        explicar_sql = _explicar_sqlite
+    else:
+        raise NotSupportedError(f"No se revisan planes de ejecución en {conexion.vendor}")
+    with conexion.cursor() as cursor:
+        lineas, recorridas = explicar_sql(cursor, sql, params)
+    return Plan(lineas, recorridas, using)
+
+
+def _explicar_postgresql(cursor, sql, params):
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+    resultado = cursor.fetchone()[0]
+    if isinstance(resultado, str):
+        resultado = json.loads(resultado)
+    lineas, recorridas = [], []
+
+    def recorrer(nodo, nivel):
+        tabla = nodo.get('Relation Name')
+        lineas.append('  ' * nivel + nodo['Node Type'] + (f" on {tabla}" if tabla else '')
+                      + (f" using {nodo['Index Name']}" if 'Index Name' in nodo else ''))
+        if nodo['Node Type'] == 'Seq Scan':
+            recorridas.append(tabla)
+        for hijo in nodo.get('Plans', ()):
+            recorrer(hijo, nivel + 1)
+
+    recorrer(resultado[0]['Plan'], 0)
+    return lineas, recorridas
+
+
+def _explicar_sqlite(cursor, sql, params):
+    cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    alias = {nombre: tabla for tabla, nombre in _ALIAS.findall(sql)}
+    nodos, niveles = [], {0: -1}
+    for nodo, padre, _, detalle in cursor.fetchall():
+        niveles[nodo] = niveles.get(padre, -1) + 1
+        nodos.append((niveles[nodo], detalle))
+    exteriores = [detalle for nivel, detalle in nodos if nivel == 0]
+    # Solo el primer bucle del nivel exterior se detiene con el LIMIT; los
+    # interiores se repiten por cada fila del exterior.
+    acotado = next((
+        posicion for posicion, (nivel, detalle) in enumerate(nodos)
+        if nivel == 0 and detalle.startswith(('SCAN', 'SEARCH'))
+    ), None)
+    if not _LIMITE.search(sql) or any(detalle in _ORDEN_TEMPORAL for detalle in exteriores):
+        acotado = None
+
+    lineas, recorridas = [], []
+    for posicion, (nivel, detalle) in enumerate(nodos):
+        lineas.append('  ' * nivel + detalle)
+        # "SCAN tabla USING INDEX ..." recorre el índice completo, en orden.
+        # Las subconsultas aparecen como "SCAN (subquery-1)" y no coinciden
+        # con el patrón.
+        recorrido = _RECORRIDO_SQLITE.match(detalle)
+        if recorrido and posicion != acotado:
+            recorridas.append(alias.get(recorrido.group(1), recorrido.group(1)))
+    return lineas, recorridas
+
+
+def filas(tabla, using='default'):
+    conexion = connections[using]
+    with conexion.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {conexion.ops.quote_name(tabla)}")
+        return cursor.fetchone()[0]
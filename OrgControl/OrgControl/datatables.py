@@ -0,0 +1,193 @@
+"""
+Soporte para el modo server-side de jQuery DataTables.
+
+Cada vista declara sus columnas y el queryset base; DataTablesView traduce
+los parámetros draw/start/length/search/order de DataTables en filtros,
+orden y un slice del queryset, y responde con el JSON que espera la tabla.
+Así el navegador solo recibe la página visible.
+
+En la plantilla basta con marcar la tabla con data-source y cada <th> con
+data-data (ver la inicialización en base.html). DataTables inserta los
+valores como HTML, así que fila() debe escapar los textos.
+
+Si version_cache() devuelve una versión de los datos (p. ej. la revisión
+del plan), la respuesta se guarda en la caché bajo esa versión y los
+parámetros de la petición, y se reutiliza hasta que la versión cambie.
+
+Las vistas que declaran `claves` paginan por conjunto de claves cuando la
+tabla se muestra en ese orden: cada respuesta trae en `siguiente` el cursor
+de la página que sigue y la tabla lo devuelve en `despues` al pedirla (ver
+data-cursor en base.html). Esa página se lee a partir de la última fila de
+la anterior, con el índice, en lugar de saltar filas con OFFSET; sin cursor
+(p. ej. al saltar a una página lejana) se usa start como siempre.
+"""
+import hashlib
+from functools import reduce
+from operator import and_, or_
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils.http import urlencode
+from django.views import View
+
+from . import metrics
+
+TIEMPO_CACHE = 60 * 60
+# draw solo identifica la petición y _ es el anti-caché de jQuery
+_PARAMETROS_SIN_EFECTO = ('draw', '_')
+
+LECTURAS_CACHE = metrics.contador(
+    'orgcontrol_datatables_cache_total',
+    'Lecturas de la caché de respuestas de DataTables', ('view', 'result')
+)
+
+
+class Columna:
+    """
+    `nombre` es la clave en el JSON (columns[i][data] en DataTables),
+    `orden` los campos ORM por los que se ordena y `busqueda` los lookups
+    ORM en los que se busca el texto del buscador.
+    """
+    def __init__(self, nombre, orden=(), busqueda=()):
+        self.nombre = nombre
+        self.orden = (orden,) if isinstance(orden, str) else tuple(orden)
+        self.busqueda = (busqueda,) if isinstance(busqueda, str) else tuple(busqueda)
+
+
+def despues_de(queryset, claves, cursor):
+    """Filas de `queryset` posteriores a `cursor` en el orden ascendente de `claves`"""
+    condicion = None
+    for i in reversed(range(len(claves))):
+        siguiente = Q(**{f"{claves[i]}__gt": cursor[i]})
+        if condicion is not None:
+            siguiente |= Q(**{claves[i]: cursor[i]}) & condicion
+        condicion = siguiente
+    return queryset.filter(condicion)
+
+
+class DataTablesView(View):
+    columnas = ()
+    longitud_por_defecto = 10
+    longitud_maxima = 100
+    # Campos enteros del orden por conjunto de claves, ascendentes y
+    # terminados en 'pk'; también es el orden de la tabla si no se pide otro
+    claves = ()
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def fila(self, obj):
+        """Diccionario con una clave por columna para `obj`"""
+        raise NotImplementedError
+
+    def version_cache(self):
+        """Versión de los datos que muestra la vista; None para no cachear"""
+        return None
+
+    def get(self, request, *args, **kwargs):
+        parametros = request.GET
+        draw = self._entero(parametros.get('draw'), 0)
+        version = self.version_cache()
+        if version is None:
+            return JsonResponse({'draw': draw, **self.datos(parametros)})
+
+        vista = f"{type(self).__module__}.{type(self).__qualname__}"
+        clave = self.clave_cache(vista, version, parametros)
+        datos = cache.get(clave)
+        if datos is None:
+            LECTURAS_CACHE.incrementar(vista, 'miss')
+            datos = self.datos(parametros)
+            cache.set(clave, datos, TIEMPO_CACHE)
+        else:
+            LECTURAS_CACHE.incrementar(vista, 'hit')
+        return JsonResponse({'draw': draw, **datos})
+
+    def clave_cache(self, vista, version, parametros):
+        pares = sorted(
+            (nombre, valor)
+            for nombre, valores in parametros.lists() if nombre not in _PARAMETROS_SIN_EFECTO
+            for valor in valores
+        )
+        resumen = hashlib.sha256(
+            f"{sorted(self.kwargs.items())}?{urlencode(pares)}".encode()
+        ).hexdigest()
+        return f"datatables:{vista}:{version}:{resumen}"
+
+    def datos(self, parametros):
+        queryset = self.get_queryset()
+
+        total = queryset.count()
+        texto = parametros.get('search[value]', '').strip()
+        if texto:
+            queryset = self.filtrar(queryset, texto)
+            filtrados = queryset.count()
+        else:
+            filtrados = total
+
+        orden = [*self.campos_orden(parametros), 'pk']
+        if orden == ['pk'] and self.claves:
+            orden = list(self.claves)
+        queryset = queryset.order_by(*orden)
+        inicio = max(self._entero(parametros.get('start'), 0), 0)
+        longitud = self._entero(parametros.get('length'), self.longitud_por_defecto)
+        if longitud <= 0 or longitud > self.longitud_maxima:
+            longitud = self.longitud_maxima
+
+        por_claves = bool(self.claves) and orden == list(self.claves)
+        cursor = self.leer_cursor(parametros.get('despues')) if por_claves and inicio else None
+        if cursor:
+            filas = list(despues_de(queryset, self.claves, cursor)[:longitud])
+        else:
+            filas = list(queryset[inicio:inicio + longitud])
+
+        datos = {
+            'recordsTotal': total,
+            'recordsFiltered': filtrados,
+            'data': [self.fila(obj) for obj in filas],
+        }
+        if por_claves and filas and inicio + longitud < filtrados:
+            datos['siguiente'] = {'inicio': inicio + longitud, 'cursor': self.cursor(filas[-1])}
+        return datos
+
+    def cursor(self, obj):
+        return '-'.join(str(getattr(obj, campo)) for campo in self.claves)
+
+    def leer_cursor(self, texto):
+        """Valores de `claves` a partir del texto de cursor(); None si no es válido"""
+        try:
+            valores = tuple(int(parte) for parte in (texto or '').split('-'))
+        except ValueError:
+            return None
+        return valores if len(valores) == len(self.claves) else None
+
+    def filtrar(self, queryset, texto):
+        """Cada palabra debe aparecer en alguna de las columnas con búsqueda"""
+        lookups = [lookup for columna in self.columnas for lookup in columna.busqueda]
+        if not lookups:
+            return queryset
+        condiciones = [
+            reduce(or_, (Q(**{lookup: palabra}) for lookup in lookups))
+            for palabra in texto.split()
+        ]
+        return queryset.filter(reduce(and_, condiciones))
+
+    def campos_orden(self, parametros):
+        por_nombre = {columna.nombre: columna for columna in self.columnas}
+        campos = []
+        i = 0
+        while f'order[{i}][column]' in parametros:
+            indice = parametros[f'order[{i}][column]']
+            columna = por_nombre.get(parametros.get(f'columns[{indice}][data]'))
+            descendente = parametros.get(f'order[{i}][dir]') == 'desc'
+            if columna:
+                campos += [f"-{campo}" if descendente else campo for campo in columna.orden]
+            i += 1
+        return campos
+
+    @staticmethod
+    def _entero(valor, defecto):
+        try:
+            return int(valor)
+        except (TypeError, ValueError):
+            return defecto
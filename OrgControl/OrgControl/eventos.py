@@ -0,0 +1,248 @@
+"""
+Publicación y suscripción de eventos para las respuestas server-sent events
+(SSE).
+
+El código síncrono publica con publicar(canal, evento, datos); las vistas
+asíncronas se suscriben a uno o más canales y reenvían lo que llega con
+transmitir(). El backend se elige con EVENTOS_BACKEND:
+
+- MemoriaBackend (por defecto): colas en memoria del proceso. Solo llegan
+  los eventos publicados en el mismo proceso que atiende la conexión SSE,
+  así que sirve con un único proceso ASGI que también atienda las escrituras.
+- PostgresBackend: LISTEN/NOTIFY de PostgreSQL, para varios procesos o
+  cuando las escrituras las atienden workers WSGI. Requiere psycopg 3. Un
+  mensaje que no cabe en un NOTIFY se publica como DESBORDE en su canal.
+
+Las conexiones SSE solo tienen sentido bajo ASGI: bajo WSGI Django
+acumularía la respuesta asíncrona completa antes de enviarla, así que
+respuesta_sse() responde 204, que le indica a EventSource que no reintente.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import namedtuple
+from contextlib import asynccontextmanager
+from functools import cache
+from time import monotonic
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+BACKEND = 'OrgControl.eventos.MemoriaBackend'
+# Mensajes en espera por suscriptor; si se llena, el flujo recibe DESBORDE
+COLA_MAXIMA = 100
+# Comentario periódico para que proxies y balanceadores no corten la conexión
+LATIDO_SEGUNDOS = 25
+# Cada conexión se cierra pasado este tiempo y EventSource se reconecta sola
+DURACION_MAXIMA = 10 * 60
+REINTENTO_MS = 5000
+
+Mensaje = namedtuple('Mensaje', 'canal evento datos')
+
+# Se entrega en lugar de los mensajes descartados: el suscriptor debe releer todo
+DESBORDE = Mensaje(None, 'desborde', {})
+
+
+class Suscripcion:
+    def __init__(self, canales):
+        self.canales = frozenset(canales)
+        self._bucle = asyncio.get_running_loop()
+        self._cola = asyncio.Queue(COLA_MAXIMA)
+        self._desbordada = False
+
+    def entregar(self, mensaje):
+        # Se puede llamar desde cualquier hilo; la cola solo se toca desde su bucle
+        try:
+            self._bucle.call_soon_threadsafe(self._poner, mensaje)
+        except RuntimeError:
+            # Bucle ya cerrado: la conexión terminó
+            pass
+
+    def _poner(self, mensaje):
+        try:
+            self._cola.put_nowait(mensaje)
+        except asyncio.QueueFull:
+            self._desbordada = True
+
+    async def recibir(self, espera):
+        """Todos los mensajes en cola, esperando hasta `espera` segundos al primero; [] si no llegó ninguno"""
+        try:
+            mensajes = [await asyncio.wait_for(self._cola.get(), espera)]
+        except asyncio.TimeoutError:
+            return []
+        while not self._cola.empty():
+            mensajes.append(self._cola.get_nowait())
+        if self._desbordada:
+            self._desbordada = False
+            mensajes.append(DESBORDE)
+        return mensajes
+
+
+class MemoriaBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {canal: {suscripciones}}
+        self._suscripciones = {}
+
+    def publicar(self, mensaje):
+        with self._lock:
+            destinos = list(self._suscripciones.get(mensaje.canal, ()))
+        for suscripcion in destinos:
+            suscripcion.entregar(mensaje)
+
+    def _desbordar_todas(self):
+        """Avisa a todos los suscriptores que pudieron perderse mensajes"""
+        with self._lock:
+            destinos = {s for suscripciones in self._suscripciones.values() for s in suscripciones}
+        for suscripcion in destinos:
+            suscripcion.entregar(DESBORDE)
+
+    @asynccontextmanager
+    async def suscribir(self, canales):
+        suscripcion = Suscripcion(canales)
+        with self._lock:
+            for canal in suscripcion.canales:
+                self._suscripciones.setdefault(canal, set()).add(suscripcion)
+        try:
+            yield suscripcion
+        finally:
+            with self._lock:
+                for canal in suscripcion.canales:
+                    suscriptores = self._suscripciones.get(canal, set())
+                    suscriptores.discard(suscripcion)
+                    if not suscriptores:
+                        self._suscripciones.pop(canal, None)
+
+
+class PostgresBackend(MemoriaBackend):
+    """
+    Publica con pg_notify() y cada proceso mantiene una sola conexión en
+    LISTEN que reparte los mensajes a sus suscriptores locales. NOTIFY dentro
+    de una transacción se entrega al confirmarla.
+    """
+    CANAL = 'orgcontrol_eventos'
+    ESPERA_RECONEXION = 5
+    # PostgreSQL rechaza cargas de NOTIFY de 8000 bytes o más
+    CARGA_MAXIMA = 7999
+
+    def __init__(self):
+        super().__init__()
+        self._escucha = None
+
+    def publicar(self, mensaje):
+        carga = self.serializar(mensaje)
+        tamano = len(carga.encode())
+        if tamano > self.CARGA_MAXIMA:
+            # P. ej. una decisión en lote sobre cientos de actividades de un plan:
+            # los suscriptores del canal vuelven a leer todo en lugar de perder el aviso
+            logger.info('Mensaje de %s bytes en %s publicado como desborde', tamano, mensaje.canal)
+            carga = self.serializar(DESBORDE._replace(canal=mensaje.canal))
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.CANAL, carga])
+
+    @staticmethod
+    def serializar(mensaje):
+        return json.dumps([mensaje.canal, mensaje.evento, mensaje.datos], cls=DjangoJSONEncoder)
+
+    @asynccontextmanager
+    async def suscribir(self, canales):
+        if self._escucha is None or self._escucha.done():
+            self._escucha = asyncio.get_running_loop().create_task(self._escuchar())
+        async with super().suscribir(canales) as suscripcion:
+            yield suscripcion
+
+    async def _escuchar(self):
+        import psycopg
+
+        ajustes = connections[DEFAULT_DB_ALIAS].settings_dict
+        while True:
+            try:
+                conexion = await psycopg.AsyncConnection.connect(
+                    dbname=ajustes['NAME'],
+                    user=ajustes['USER'],
+                    password=ajustes['PASSWORD'],
+                    host=ajustes['HOST'] or None,
+                    port=ajustes['PORT'] or None,
+                    autocommit=True
+                )
+                async with conexion:
+                    await conexion.execute(f'LISTEN {self.CANAL}')
+                    # Lo publicado mientras no había escucha se perdió
+                    self._desbordar_todas()
+                    async for aviso in conexion.notifies():
+                        super().publicar(Mensaje(*json.loads(aviso.payload)))
+            except psycopg.Error:
+                logger.exception('Se perdió la conexión de LISTEN; reintentando')
+                await asyncio.sleep(self.ESPERA_RECONEXION)
+
+
+@cache
+def backend():
+    return import_string(getattr(settings, 'EVENTOS_BACKEND', BACKEND))()
+
+
+def publicar(canal, evento, datos=None):
+    backend().publicar(Mensaje(canal, evento, datos or {}))
+
+
+def suscribir(*canales):
+    """async with suscribir(...) as suscripcion: mensajes con suscripcion.recibir(espera)"""
+    return backend().suscribir(canales)
+
+
+def formato_sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos, cls=DjangoJSONEncoder)}\n\n"
+
+
+def leer(funcion):
+    """
+    Como sync_to_async, pero cierra después las conexiones a la base de
+    datos del hilo: un flujo SSE pasa casi todo el tiempo esperando y no debe
+    retener una conexión por cliente.
+    """
+    def leer_y_cerrar(*args, **kwargs):
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            connections.close_all()
+    return sync_to_async(leer_y_cerrar)
+
+
+async def transmitir(canales, al_conectar, al_recibir, duracion=DURACION_MAXIMA):
+    """
+    Flujo SSE. `al_conectar()` y `al_recibir(mensajes)` son corrutinas que
+    devuelven los eventos [(nombre, datos)] a enviar al conectarse y tras
+    cada lote de mensajes. La suscripción empieza antes de `al_conectar()`,
+    así que no se pierde nada publicado entre la lectura inicial y la espera.
+    """
+    async with suscribir(*canales) as suscripcion:
+        yield f"retry: {REINTENTO_MS}\n\n"
+        for evento, datos in await al_conectar():
+            yield formato_sse(evento, datos)
+
+        limite = monotonic() + duracion
+        while (restante := limite - monotonic()) > 0:
+            mensajes = await suscripcion.recibir(min(LATIDO_SEGUNDOS, restante))
+            if not mensajes:
+                yield ': latido\n\n'
+                continue
+            for evento, datos in await al_recibir(mensajes):
+                yield formato_sse(evento, datos)
+
+
+def respuesta_sse(request, flujo):
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(flujo, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Que nginx no acumule la respuesta
+    response['X-Accel-Buffering'] = 'no'
+    return response
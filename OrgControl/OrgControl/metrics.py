@@ -0,0 +1,111 @@
+"""
+Métricas en memoria del proceso con exportación en formato de texto de
+Prometheus.
+
+Cada proceso (worker) acumula sus propios valores; Prometheus los suma al
+consultar cada instancia. Los histogramas y contadores se identifican por
+nombre y por el valor de sus etiquetas, p. ej. la vista.
+"""
+import threading
+from bisect import bisect_left
+
+_lock = threading.Lock()
+_metricas = {}
+
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_BYTES = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2)
+
+
+class Histograma:
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas, buckets):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        # {valores de etiquetas: [conteos por bucket..., suma, total]}
+        self.series = {}
+
+    def observar(self, valor, *etiquetas):
+        with _lock:
+            serie = self.series.get(etiquetas)
+            if serie is None:
+                serie = self.series[etiquetas] = [0] * (len(self.buckets) + 2)
+            # Conteo no acumulado; exportar() suma los buckets al escribir
+            indice = bisect_left(self.buckets, valor)
+            if indice < len(self.buckets):
+                serie[indice] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def lineas(self):
+        for etiquetas, serie in sorted(self.series.items()):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, serie):
+                acumulado += conteo
+                yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, etiquetas, le=limite)} {acumulado}"
+            yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, etiquetas, le='+Inf')} {serie[-1]}"
+            yield f"{self.nombre}_sum{_etiquetas(self.etiquetas, etiquetas)} {_numero(serie[-2])}"
+            yield f"{self.nombre}_count{_etiquetas(self.etiquetas, etiquetas)} {serie[-1]}"
+
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.series = {}
+
+    def incrementar(self, *etiquetas, cantidad=1):
+        with _lock:
+            self.series[etiquetas] = self.series.get(etiquetas, 0) + cantidad
+
+    def lineas(self):
+        for etiquetas, valor in sorted(self.series.items()):
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {_numero(valor)}"
+
+
+def _registrar(metrica):
+    with _lock:
+        return _metricas.setdefault(metrica.nombre, metrica)
+
+
+def histograma(nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+    """Devuelve el histograma `nombre`, creándolo la primera vez"""
+    return _registrar(Histograma(nombre, ayuda, etiquetas, buckets))
+
+
+def contador(nombre, ayuda, etiquetas=()):
+    """Devuelve el contador `nombre`, creándolo la primera vez"""
+    return _registrar(Contador(nombre, ayuda, etiquetas))
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _etiquetas(nombres, valores, **extra):
+    pares = list(zip(nombres, valores)) + list(extra.items())
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + '}'
+
+
+def exportar():
+    """Todas las métricas en formato de texto de Prometheus (versión 0.0.4)"""
+    lineas = []
+    with _lock:
+        metricas = [_metricas[nombre] for nombre in sorted(_metricas)]
+        for metrica in metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.lineas())
+    return '\n'.join(lineas) + '\n'
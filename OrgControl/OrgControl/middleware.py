@@ -0,0 +1,248 @@
+"""
+Instrumentación por vista: número de consultas SQL, tiempo en SQL, tiempo
+de renderizado de plantillas, tiempo total y tamaño de la respuesta.
+
+Cada conexión recibe al abrirse un execute_wrapper permanente que anota la
+consulta en el registro de la petición en curso, guardado en una variable
+de contexto. Así se cuentan también las consultas de las vistas asíncronas,
+que el ORM ejecuta en otro hilo con su propia conexión. Si una misma forma
+de SQL (la sentencia sin parámetros) se repite más de
+METRICAS_UMBRAL_REPETICIONES veces en una petición se registra un aviso con
+la vista y la sentencia: suele ser un N+1. Las métricas se consultan en
+/metricas/ (ver OrgControl/views.py).
+
+Las respuestas en streaming (CSV, SSE) consultan mientras se envían, ya
+fuera de la vista: su contenido se envuelve para que cada parte se produzca
+dentro del registro de la petición, y la petición se observa al terminar
+el envío, con los bytes enviados como tamaño. FileResponse queda fuera: no
+consulta y envolverla impediría el envío con wsgi.file_wrapper.
+"""
+import contextvars
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import FileResponse
+
+from . import metrics
+
+logger = logging.getLogger('OrgControl.metricas')
+
+UMBRAL_REPETICIONES = 10
+# Las listas de parámetros de IN (...) cambian de largo sin cambiar la forma
+_LISTA_PARAMETROS = re.compile(r'\((?:%s|\?)(?:\s*,\s*(?:%s|\?))*\)')
+
+CONSULTAS = metrics.histograma(
+    'orgcontrol_request_queries', 'Consultas SQL por petición',
+    ('view',), metrics.BUCKETS_CONSULTAS
+)
+SEGUNDOS_SQL = metrics.histograma(
+    'orgcontrol_request_sql_seconds', 'Tiempo total en SQL por petición', ('view',)
+)
+SEGUNDOS_RENDER = metrics.histograma(
+    'orgcontrol_request_render_seconds', 'Tiempo de renderizado de TemplateResponse', ('view',)
+)
+SEGUNDOS_PETICION = metrics.histograma(
+    'orgcontrol_request_duration_seconds', 'Tiempo total de la petición', ('view', 'method')
+)
+BYTES_RESPUESTA = metrics.histograma(
+    'orgcontrol_response_bytes', 'Tamaño del cuerpo de la respuesta', ('view',), metrics.BUCKETS_BYTES
+)
+REPETIDAS = metrics.contador(
+    'orgcontrol_repeated_query_shapes_total',
+    'Peticiones con una forma de SQL repetida por encima del umbral', ('view',)
+)
+
+
+class RegistroConsultas:
+    """Cuenta y cronometra las consultas de una petición"""
+    def __init__(self):
+        self.total = 0
+        self.segundos = 0.0
+        self.formas = Counter()
+
+    def anotar(self, sql, segundos):
+        self.segundos += segundos
+        self.total += 1
+        self.formas[_LISTA_PARAMETROS.sub('(...)', sql)] += 1
+
+
+# Registros activos; pueden anidarse (p. ej. un benchmark alrededor del middleware)
+_registros = contextvars.ContextVar('orgcontrol_registros_consultas', default=())
+
+
+def _interceptar(execute, sql, params, many, context):
+    registros = _registros.get()
+    if not registros:
+        return execute(sql, params, many, context)
+    inicio = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        segundos = perf_counter() - inicio
+        for registro in registros:
+            registro.anotar(sql, segundos)
+
+
+def _instalar(conexion):
+    if _interceptar not in conexion.execute_wrappers:
+        conexion.execute_wrappers.insert(0, _interceptar)
+
+
+@receiver(connection_created)
+def instalar_registro(sender, connection, **kwargs):
+    _instalar(connection)
+
+
+@contextmanager
+def _en_registro(registro):
+    token = _registros.set((*_registros.get(), registro))
+    try:
+        yield registro
+    finally:
+        _registros.reset(token)
+
+
+@contextmanager
+def registrar_consultas():
+    """Anota en un RegistroConsultas las consultas hechas dentro del bloque"""
+    # Las conexiones abiertas antes de importar este módulo no recibieron la señal
+    for conexion in connections.all(initialized_only=True):
+        _instalar(conexion)
+    with _en_registro(RegistroConsultas()) as registro:
+        yield registro
+
+
+class _ContenidoContado:
+    """
+    Contenido de una respuesta en streaming que produce cada parte dentro de
+    `registro` y llama una sola vez a `al_terminar(bytes enviados)` al
+    agotarse o al cerrarse la respuesta.
+    """
+    def __init__(self, contenido, registro, al_terminar):
+        self._contenido = contenido
+        self._registro = registro
+        self._al_terminar = al_terminar
+        self.enviados = 0
+
+    def _terminar(self):
+        al_terminar, self._al_terminar = self._al_terminar, None
+        if al_terminar is not None:
+            al_terminar(self.enviados)
+
+    def close(self):
+        self._terminar()
+
+
+class _ContenidoContadoSync(_ContenidoContado):
+    def __iter__(self):
+        self._iterador = iter(self._contenido)
+        return self
+
+    def __next__(self):
+        with _en_registro(self._registro):
+            try:
+                parte = next(self._iterador)
+            except StopIteration:
+                self._terminar()
+                raise
+        self.enviados += len(parte)
+        return parte
+
+
+class _ContenidoContadoAsync(_ContenidoContado):
+    def __aiter__(self):
+        self._iterador = aiter(self._contenido)
+        return self
+
+    async def __anext__(self):
+        with _en_registro(self._registro):
+            try:
+                parte = await anext(self._iterador)
+            except StopAsyncIteration:
+                self._terminar()
+                raise
+        self.enviados += len(parte)
+        return parte
+
+
+class MetricasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.umbral = getattr(settings, 'METRICAS_UMBRAL_REPETICIONES', UMBRAL_REPETICIONES)
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.es_async:
+            return self.__acall__(request)
+        request._metricas_render = 0.0
+        inicio = perf_counter()
+        with registrar_consultas() as registro:
+            response = self.get_response(request)
+        return self.terminar(request, response, registro, inicio)
+
+    async def __acall__(self, request):
+        request._metricas_render = 0.0
+        inicio = perf_counter()
+        with registrar_consultas() as registro:
+            response = await self.get_response(request)
+        return self.terminar(request, response, registro, inicio)
+
+    def terminar(self, request, response, registro, inicio):
+        """Observa la petición ahora o, si la respuesta es en streaming, al terminar de enviarla"""
+        if not response.streaming or isinstance(response, FileResponse):
+            self.observar(request, response, registro, perf_counter() - inicio, _tamano(response))
+            return response
+
+        def al_terminar(enviados):
+            self.observar(request, response, registro, perf_counter() - inicio, enviados)
+
+        contado = _ContenidoContadoAsync if response.is_async else _ContenidoContadoSync
+        response.streaming_content = contado(response.streaming_content, registro, al_terminar)
+        return response
+
+    def observar(self, request, response, registro, duracion, tamano):
+        match = getattr(request, 'resolver_match', None)
+        vista = match.view_name if match else '<sin ruta>'
+        CONSULTAS.observar(registro.total, vista)
+        SEGUNDOS_SQL.observar(registro.segundos, vista)
+        SEGUNDOS_PETICION.observar(duracion, vista, request.method)
+        if request._metricas_render:
+            SEGUNDOS_RENDER.observar(request._metricas_render, vista)
+        if tamano is not None:
+            BYTES_RESPUESTA.observar(tamano, vista)
+
+        repetidas = [(sql, veces) for sql, veces in registro.formas.items() if veces > self.umbral]
+        if repetidas:
+            REPETIDAS.incrementar(vista)
+            for sql, veces in sorted(repetidas, key=lambda par: -par[1]):
+                logger.warning('%s: la misma consulta se ejecutó %s veces: %s', vista, veces, sql)
+
+    def process_template_response(self, request, response):
+        # Se llama justo antes de renderizar; el callback marca el final
+        inicio = perf_counter()
+
+        def fin_render(rendered):
+            request._metricas_render += perf_counter() - inicio
+
+        response.add_post_render_callback(fin_render)
+        return response
+
+
+def _tamano(response):
+    if response.streaming:
+        largo = response.get('Content-Length')
+        return int(largo) if largo and largo.isdigit() else None
+    return len(response.content)
@@ -0,0 +1,167 @@
+"""
+Lecturas en la réplica de solo lectura.
+
+Solo van a la réplica las lecturas marcadas: las vistas decoradas con
+@usar_replica o que heredan de ReplicaMixin (durante toda la petición,
+incluido el renderizado de la plantilla) y el código dentro de
+`with en_replica():`. Lo demás y toda escritura van a 'default', así que
+nada lee por accidente datos atrasados.
+
+Si el usuario escribió hace menos de REPLICA_VENTANA_SEGUNDOS, sus vistas
+marcadas siguen leyendo de la primaria, porque la réplica podría no tener
+aún sus cambios. ReplicaMiddleware detecta las escrituras de cada petición
+(pasan por db_for_write) y deja la marca en una cookie firmada con la hora
+de la firma: la siguiente petición puede atenderla otro proceso, que no ve
+la memoria de este.
+
+Sin un alias REPLICA_ALIAS en DATABASES todo sigue en 'default'.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_ALIAS = 'replica'
+VENTANA_SEGUNDOS = 5
+COOKIE_ESCRITURA = 'orgcontrol_escritura'
+_SAL_ESCRITURA = 'OrgControl.routers.escritura'
+
+# Alias de lectura en curso; None es 'default'
+_lectura = contextvars.ContextVar('orgcontrol_alias_lectura', default=None)
+# Estado de la petición en curso; se muta en lugar de reasignarse para que
+# las escrituras hechas en hilos de sync_to_async también queden registradas
+_peticion = contextvars.ContextVar('orgcontrol_peticion_replica', default=None)
+
+
+class _EstadoPeticion:
+    def __init__(self):
+        self.escribio = False
+
+
+def alias_replica():
+    alias = getattr(settings, 'REPLICA_ALIAS', REPLICA_ALIAS)
+    return alias if alias in settings.DATABASES else None
+
+
+def alias_lectura():
+    """Alias al que van ahora las lecturas, para fijarlo con .using() en respuestas en streaming"""
+    return _lectura.get() or DEFAULT_DB_ALIAS
+
+
+def _ventana():
+    return getattr(settings, 'REPLICA_VENTANA_SEGUNDOS', VENTANA_SEGUNDOS)
+
+
+def escribio_hace_poco(request):
+    """True si la cookie de escritura es del usuario actual y no ha vencido la ventana"""
+    if not request.user.is_authenticated:
+        return False
+    marca = request.get_signed_cookie(
+        COOKIE_ESCRITURA, default=None, salt=_SAL_ESCRITURA, max_age=_ventana()
+    )
+    return marca == str(request.user.pk)
+
+
+def _marcar_escritura(response, user):
+    response.set_signed_cookie(
+        COOKIE_ESCRITURA, user.pk, salt=_SAL_ESCRITURA, max_age=_ventana(),
+        httponly=True, samesite='Lax'
+    )
+
+
+@contextmanager
+def en_replica():
+    """Envía a la réplica las lecturas del bloque (si hay réplica configurada)"""
+    token = _lectura.set(alias_replica())
+    try:
+        yield
+    finally:
+        _lectura.reset(token)
+
+
+def usar_replica(vista):
+    """Marca una vista de función (síncrona o asíncrona) para leer de la réplica"""
+    vista.usar_replica = True
+    return vista
+
+
+class ReplicaMixin:
+    """Marca una vista basada en clases para leer de la réplica"""
+    usar_replica = True
+
+
+def _marcada(vista):
+    return getattr(vista, 'usar_replica', False) or getattr(
+        getattr(vista, 'view_class', None), 'usar_replica', False
+    )
+
+
+class RouterReplica:
+    def db_for_read(self, model, **hints):
+        return _lectura.get()
+
+    def db_for_write(self, model, **hints):
+        estado = _peticion.get()
+        if estado is not None:
+            estado.escribio = True
+        # Explícito: si no, Django escribiría en la base de la que se leyó la instancia
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # La réplica tiene los mismos datos que la primaria
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == alias_replica():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.es_async:
+            return self.__acall__(request)
+        estado = _EstadoPeticion()
+        token_peticion = _peticion.set(estado)
+        token_lectura = _lectura.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _lectura.reset(token_lectura)
+            _peticion.reset(token_peticion)
+        if estado.escribio and request.user.is_authenticated:
+            _marcar_escritura(response, request.user)
+        return response
+
+    async def __acall__(self, request):
+        estado = _EstadoPeticion()
+        token_peticion = _peticion.set(estado)
+        token_lectura = _lectura.set(None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _lectura.reset(token_lectura)
+            _peticion.reset(token_peticion)
+        if estado.escribio:
+            user = await request.auser()
+            if user.is_authenticated:
+                _marcar_escritura(response, user)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        alias = alias_replica()
+        if alias and _marcada(view_func) and not escribio_hace_poco(request):
+            # Se restablece en __call__ al terminar la petición
+            _lectura.set(alias)
+        return None
@@ -51,6 +51,10 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
 
 MIDDLEWARE = [
+    # Primero, para contar también las consultas de sesión y autenticación
+    'OrgControl.middleware.MetricasMiddleware',
+    # Antes de la sesión, para registrar también sus escrituras (ver OrgControl/routers.py)
+    'OrgControl.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -91,9 +95,43 @@ DATABASES = {
         'PASSWORD': '987654321',
         'HOST': 'localhost',
         'PORT': '5433',
+        # Conexiones persistentes, verificadas antes de reutilizarse en cada petición
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Réplica de solo lectura opcional para tableros, listados y reportes
+# (ver OrgControl/routers.py). Sin ORGCONTROL_REPLICA_HOST todo va a 'default'.
+if os.environ.get('ORGCONTROL_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['ORGCONTROL_REPLICA_HOST'],
+        'PORT': os.environ.get('ORGCONTROL_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Caché compartida por todos los procesos: las versiones de users/cache.py
+# (cadenas de aprobadores y alcance de visibilidad) solo se invalidan en los
+# demás procesos si la ven. LocMemCache es por proceso y solo sirve con
+# DEBUG; fuera de él la aplicación no arranca con ella (ver users/apps.py).
+if os.environ.get('ORGCONTROL_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['ORGCONTROL_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+DATABASE_ROUTERS = ['OrgControl.routers.RouterReplica']
+REPLICA_VENTANA_SEGUNDOS = 5  # tras escribir, el usuario lee de la primaria durante este tiempo
+
 AUTH_USER_MODEL = 'users.CustomUser'
 
 # Password validation
@@ -141,6 +179,9 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# PDF de planes ya generados; fuera de MEDIA_ROOT para no publicarlos
+REPORTES_ROOT = BASE_DIR / 'reportes'
+
 # Añadir al final del archivo
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -151,4 +192,17 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'tu@email.com'
 EMAIL_HOST_PASSWORD = 'tupassword'
 DEFAULT_FROM_EMAIL = 'notificaciones@tuempresa.com'
+DOMAIN = 'http://localhost:8000'  # Usado en los enlaces de los correos
+
+# Bandeja de salida de notificaciones (ver actividades/notificaciones.py)
+NOTIFICACIONES_MAX_INTENTOS = 5
+NOTIFICACIONES_BACKOFF_BASE = 60  # segundos; se duplica en cada reintento
+
+
+# Eventos en vivo (SSE) de bandejas y planes (ver OrgControl/eventos.py). Con
+# más de un proceso, o con escrituras atendidas por WSGI, usar
+# 'OrgControl.eventos.PostgresBackend'
+EVENTOS_BACKEND = 'OrgControl.eventos.MemoriaBackend'
 
+# Instrumentación por vista (ver OrgControl/middleware.py)
+METRICAS_UMBRAL_REPETICIONES = 10  # avisa si una misma consulta se repite más veces
@@ -0,0 +1,253 @@
+import json
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from actividades import sinteticos
+from users.cache import get_approver_ids
+from users.models import ApprovalFlow
+from users.scope import visible_level_ids
+from . import eventos
+from .middleware import BYTES_RESPUESTA, CONSULTAS
+from .routers import COOKIE_ESCRITURA, REPLICA_ALIAS, RouterReplica, en_replica
+
+User = get_user_model()
+
+CLAVE = 'clave-de-prueba'
+
+
+class ReplicaTests(TransactionTestCase):
+    """
+    Enrutado a la réplica con un alias real. Si la configuración no define
+    uno, se registra durante la clase una segunda conexión a la misma base de
+    pruebas, como haría TEST['MIRROR']. TransactionTestCase confirma los
+    datos para que esa conexión los vea.
+    """
+    # Se resuelve en setUpClass, cuando el alias ya existe
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls._alias_agregado = REPLICA_ALIAS not in connections.settings
+        if cls._alias_agregado:
+            # connections.settings es settings.DATABASES, que alias_replica() consulta
+            connections.settings[REPLICA_ALIAS] = {**connections[DEFAULT_DB_ALIAS].settings_dict}
+        cls._ajustes = override_settings(REPLICA_ALIAS=REPLICA_ALIAS)
+        cls._ajustes.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._ajustes.disable()
+        if cls._alias_agregado:
+            connections[REPLICA_ALIAS].close()
+            del connections[REPLICA_ALIAS]
+            del connections.settings[REPLICA_ALIAS]
+
+    def setUp(self):
+        cache.clear()
+        organizacion = sinteticos.generar(arcs=1, uebs=0, especialistas=2, actividades=2, prefijo='replica')
+        self.nivel = organizacion.niveles[0]
+        self.director = organizacion.directores[self.nivel.pk]
+        self.director.set_password(CLAVE)
+        self.director.save(update_fields=['password'])
+
+    def _consultas(self, url, **parametros):
+        """(consultas a la primaria, consultas a la réplica) de un GET a `url`"""
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as primaria, \
+                CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica:
+            respuesta = self.client.get(url, parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        return len(primaria), len(replica)
+
+    def test_vistas_marcadas_leen_de_la_replica(self):
+        self.client.force_login(self.director)
+        _primaria, replica = self._consultas(reverse('plan_anual_list'))
+        self.assertGreater(replica, 0)
+        _primaria, replica = self._consultas(reverse('aprobaciones_pendientes'))
+        self.assertEqual(replica, 0)
+
+    def test_sin_alias_de_replica_todo_va_a_la_primaria(self):
+        self.client.force_login(self.director)
+        with override_settings(REPLICA_ALIAS=None):
+            _primaria, replica = self._consultas(reverse('plan_anual_list'))
+        self.assertEqual(replica, 0)
+
+    def test_quien_acaba_de_escribir_lee_de_la_primaria(self):
+        # El inicio de sesión escribe last_login y deja la marca
+        respuesta = self.client.post(reverse('login'), {'username': self.director.username, 'password': CLAVE})
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertIn(COOKIE_ESCRITURA, respuesta.cookies)
+        _primaria, replica = self._consultas(reverse('plan_anual_list'))
+        self.assertEqual(replica, 0)
+
+        # Vencida la ventana vuelve a la réplica
+        despues = time.time() + settings.REPLICA_VENTANA_SEGUNDOS + 1
+        with mock.patch('django.core.signing.time.time', return_value=despues):
+            _primaria, replica = self._consultas(reverse('plan_anual_list'))
+        self.assertGreater(replica, 0)
+
+    def test_la_marca_es_del_usuario_que_escribio(self):
+        self.client.post(reverse('login'), {'username': self.director.username, 'password': CLAVE})
+        marca = self.client.cookies[COOKIE_ESCRITURA].value
+        otro = User.objects.filter(organization_level=self.nivel).exclude(pk=self.director.pk).first()
+        self.client.force_login(otro)
+        self.client.cookies[COOKIE_ESCRITURA] = marca
+        _primaria, replica = self._consultas(reverse('plan_anual_list'))
+        self.assertGreater(replica, 0)
+
+        # Una cookie sin firma válida no cuenta
+        self.client.force_login(self.director)
+        self.client.cookies[COOKIE_ESCRITURA] = str(self.director.pk)
+        _primaria, replica = self._consultas(reverse('plan_anual_list'))
+        self.assertGreater(replica, 0)
+
+    def test_escrituras_van_a_la_primaria(self):
+        with en_replica():
+            self.assertEqual(RouterReplica().db_for_read(User), REPLICA_ALIAS)
+            self.assertEqual(RouterReplica().db_for_write(User), DEFAULT_DB_ALIAS)
+        self.assertIsNone(RouterReplica().db_for_read(User))
+
+    def test_alcance_y_aprobadores_se_resuelven_en_la_primaria(self):
+        director = User.objects.get(pk=self.director.pk)
+        with en_replica(), CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica:
+            self.assertEqual(visible_level_ids(director), {self.nivel.pk})
+            self.assertIn(director.pk, get_approver_ids(ApprovalFlow.Module.ANNUAL_PLAN, self.nivel.pk))
+        self.assertEqual(len(replica), 0)
+
+
+class PostgresBackendTests(SimpleTestCase):
+
+    def _publicar(self, mensaje):
+        """Carga que PostgresBackend pasa a pg_notify()"""
+        conexion = mock.MagicMock()
+        cursor = conexion.cursor.return_value.__enter__.return_value
+        with mock.patch.object(eventos, 'connections', {DEFAULT_DB_ALIAS: conexion}):
+            eventos.PostgresBackend().publicar(mensaje)
+        (_sql, (canal, carga)), _kwargs = cursor.execute.call_args
+        self.assertEqual(canal, eventos.PostgresBackend.CANAL)
+        return carga
+
+    def test_mensaje_pequeno(self):
+        mensaje = eventos.Mensaje('plan:1', 'actividades', {'actividades': [{'id': 1, 'estado': 'A'}]})
+        self.assertEqual(json.loads(self._publicar(mensaje)), list(mensaje))
+
+    def test_mensaje_que_no_cabe_en_un_notify(self):
+        # Una decisión en lote sobre cientos de actividades de un mismo plan
+        cambios = [{'id': pk, 'estado': 'A', 'estado_display': 'Aprobada', 'avance': 0} for pk in range(500)]
+        mensaje = eventos.Mensaje('plan:1', 'actividades', {'actividades': cambios})
+        self.assertGreater(len(eventos.PostgresBackend.serializar(mensaje).encode()), 8000)
+
+        with self.assertLogs('OrgControl.eventos', 'INFO'):
+            carga = self._publicar(mensaje)
+        self.assertLessEqual(len(carga.encode()), eventos.PostgresBackend.CARGA_MAXIMA)
+        self.assertEqual(json.loads(carga), ['plan:1', eventos.DESBORDE.evento, {}])
+
+
+class TransmitirTests(SimpleTestCase):
+
+    async def _conectar(self, canales, duracion=5):
+        async def al_conectar():
+            return [('hola', {})]
+
+        async def al_recibir(mensajes):
+            return [('recibidos', {'eventos': [mensaje.evento for mensaje in mensajes]})]
+
+        flujo = eventos.transmitir(canales, al_conectar, al_recibir, duracion)
+        self.assertEqual(await anext(flujo), f"retry: {eventos.REINTENTO_MS}\n\n")
+        self.assertEqual(await anext(flujo), eventos.formato_sse('hola', {}))
+        return flujo
+
+    async def test_reenvia_los_mensajes_de_sus_canales(self):
+        flujo = await self._conectar(['prueba:1'])
+        eventos.publicar('prueba:1', 'uno')
+        eventos.publicar('prueba:2', 'ajeno')
+        eventos.publicar('prueba:1', 'dos')
+        self.assertEqual(await anext(flujo), eventos.formato_sse('recibidos', {'eventos': ['uno', 'dos']}))
+        await flujo.aclose()
+        self.assertNotIn('prueba:1', eventos.backend()._suscripciones)
+
+    async def test_cola_llena_entrega_desborde(self):
+        with mock.patch.object(eventos, 'COLA_MAXIMA', 2):
+            flujo = await self._conectar(['prueba:3'])
+        for numero in range(4):
+            eventos.publicar('prueba:3', f"m{numero}")
+        self.assertEqual(await anext(flujo), eventos.formato_sse(
+            'recibidos', {'eventos': ['m0', 'm1', eventos.DESBORDE.evento]}
+        ))
+        await flujo.aclose()
+
+    async def test_latido_y_cierre(self):
+        with mock.patch.object(eventos, 'LATIDO_SEGUNDOS', 0.01):
+            flujo = await self._conectar(['prueba:4'], duracion=0.05)
+            self.assertEqual(await anext(flujo), ': latido\n\n')
+            restantes = [parte async for parte in flujo]
+        self.assertTrue(all(parte == ': latido\n\n' for parte in restantes))
+
+
+async def _agotar(contenido):
+    return b''.join([parte async for parte in contenido])
+
+
+@override_settings(REPLICA_ALIAS=None)
+class MetricasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        organizacion = sinteticos.generar(arcs=1, uebs=0, especialistas=2, actividades=5, prefijo='metricas')
+        cls.plan = organizacion.planes[0]
+        cls.admin = User.objects.create(username='metricas_admin', is_superuser=True, is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def _serie(self, histograma, vista):
+        """[total, suma] observados para `vista`"""
+        serie = histograma.series.get((vista,), [0, 0])
+        return [serie[-1], serie[-2]]
+
+    def test_consultas_de_la_peticion(self):
+        antes = self._serie(CONSULTAS, 'plan_anual_list')
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as consultas:
+            self.assertEqual(self.client.get(reverse('plan_anual_list')).status_code, 200)
+        total, suma = self._serie(CONSULTAS, 'plan_anual_list')
+        self.assertEqual((total, suma), (antes[0] + 1, antes[1] + len(consultas)))
+
+    def test_consultas_al_enviar_una_respuesta_en_streaming(self):
+        vista = 'generar_reporte_csv'
+        antes = self._serie(CONSULTAS, vista)
+        bytes_antes = self._serie(BYTES_RESPUESTA, vista)
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as consultas:
+            respuesta = self.client.get(reverse(vista, args=[self.plan.pk]))
+            # Se observa al terminar el envío, no al salir de la vista
+            self.assertEqual(self._serie(CONSULTAS, vista), antes)
+            contenido = async_to_sync(_agotar)(respuesta.streaming_content)
+            respuesta.close()
+        self.assertEqual(self._serie(CONSULTAS, vista), [antes[0] + 1, antes[1] + len(consultas)])
+        self.assertEqual(self._serie(BYTES_RESPUESTA, vista), [bytes_antes[0] + 1, bytes_antes[1] + len(contenido)])
+
+    def test_respuesta_cerrada_sin_enviar(self):
+        vista = 'generar_reporte_csv'
+        antes = self._serie(CONSULTAS, vista)
+        self.client.get(reverse(vista, args=[self.plan.pk])).close()
+        self.assertEqual(self._serie(CONSULTAS, vista)[0], antes[0] + 1)
+
+    def test_exportacion(self):
+        self.client.get(reverse('plan_anual_list'))
+        respuesta = self.client.get(reverse('metricas'))
+        self.assertEqual(respuesta['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertContains(respuesta, '# TYPE orgcontrol_request_queries histogram')
+        self.assertContains(respuesta, 'orgcontrol_request_queries_count{view="plan_anual_list"}')
+
+        self.client.force_login(User.objects.filter(is_staff=False).first())
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 302)
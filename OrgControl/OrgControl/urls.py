@@ -31,8 +31,10 @@ urlpatterns = [
     # Redirige la raíz a la página de login o al módulo principal
     path('', views.home, name='home'),
     path('admin/', admin.site.urls),
-    path('panel/', views.vista_panel, name='dashboard'),
+    path('metricas/', views.metricas, name='metricas'),
+    path('panel/', include('actividades.dashboard.urls')),
     path('', include('users.urls')),
+    path('', include('actividades.urls')),
     path('users/', include('django.contrib.auth.urls')),
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
@@ -1,7 +1,17 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse
 from django.shortcuts import render
 
+from . import metrics
+
 def home(request):
     return render(request, 'home.html')
 
 def vista_panel(request):
-    return render(request, 'OrgCOntrol/dashboard.html')
\ No newline at end of file
+    return render(request, 'OrgCOntrol/dashboard.html')
+
+
+@staff_member_required
+def metricas(request):
+    # Formato de exposición de texto de Prometheus
+    return HttpResponse(metrics.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,3 +1,40 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.utils import timezone
+from .models import NotificacionCorreo, PlanAnual
+from .renovacion import renovar
 
-# Register your models here.
+
+@admin.register(PlanAnual)
+class PlanAnualAdmin(admin.ModelAdmin):
+    list_display = ('id', 'year', 'organization_level', 'approved', 'created_by', 'created_at')
+    list_filter = ('year', 'approved')
+    list_select_related = ('organization_level', 'created_by')
+    readonly_fields = ('revision',)
+    actions = ['renovar_siguiente_anio']
+
+    @admin.action(description='Renovar para el año siguiente')
+    def renovar_siguiente_anio(self, request, queryset):
+        resultado = renovar(queryset.select_related('organization_level'), request.user)
+        self.message_user(request, (
+            f"Renovados {len(resultado.planes)} planes con {resultado.actividades} actividades "
+            f"y {resultado.aprobaciones} aprobaciones"
+        ))
+        for plan, motivo in resultado.omitidos:
+            self.message_user(request, f"Omitido {plan}: {motivo}", messages.WARNING)
+        if resultado.actividades_omitidas:
+            self.message_user(request, (
+                f"{resultado.actividades_omitidas} actividades sin copiar: su responsable está "
+                f"inactivo o ya no pertenece al nivel del plan"
+            ), messages.WARNING)
+
+
+@admin.register(NotificacionCorreo)
+class NotificacionCorreoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'aprobacion', 'estado', 'intentos', 'proximo_intento', 'fecha_envio')
+    list_filter = ('estado',)
+    readonly_fields = ('ultimo_error', 'fecha_creacion', 'fecha_envio')
+    actions = ['reintentar']
+
+    @admin.action(description='Reintentar envío')
+    def reintentar(self, request, queryset):
+        queryset.exclude(estado='E').update(estado='P', intentos=0, proximo_intento=timezone.now())
@@ -0,0 +1,43 @@
+"""
+Bandeja de aprobaciones pendientes.
+
+Solo aparecen las aprobaciones a las que ya les toca el turno: las del paso
+que la actividad tiene en `orden_pendiente` (ver actividades/flujo.py).
+
+En el orden de los turnos la paginación es por conjunto de claves (orden,
+id), apoyada en el índice parcial de pendientes (aprobador, orden), así que
+cada página cuesta lo mismo sin importar cuántas pendientes tenga el
+aprobador. La tabla pagina con AprobacionesPendientesDataView (ver
+OrgControl/datatables.py); consulta() da la misma página para los avisos en
+vivo (ver actividades/eventos.py) y explicar_consultas.
+"""
+from django.db.models import F
+
+from OrgControl.datatables import despues_de
+from .models import Aprobacion
+
+TAMANO_PAGINA = 25
+CLAVES = ('orden', 'pk')
+
+
+def pendientes_en_turno(usuario):
+    return Aprobacion.objects.filter(
+        aprobador=usuario,
+        estado='P',
+        actividad__orden_pendiente=F('orden')
+    )
+
+
+def consulta(usuario, despues=None, tamano=TAMANO_PAGINA):
+    """
+    Queryset de la página que sigue a `despues` (valores de CLAVES de la
+    última fila de la anterior, o None para la primera); se pide un elemento
+    de más para saber si hay otra.
+    """
+    queryset = pendientes_en_turno(usuario).select_related(
+        'actividad__plan__organization_level',
+        'actividad__responsable'
+    ).order_by(*CLAVES)
+    if despues:
+        queryset = despues_de(queryset, CLAVES, despues)
+    return queryset[:tamano + 1]
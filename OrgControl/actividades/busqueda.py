@@ -0,0 +1,159 @@
+"""
+Búsqueda de texto completo en el nombre y la descripción de las actividades
+de todos los planes y años visibles para el usuario.
+
+El índice lo mantiene la base de datos con triggers (ver la migración 0009):
+
+- PostgreSQL: columna tsvector `search_vector` (nombre con peso A,
+  descripción con peso B, configuración 'spanish') con índice GIN; el orden
+  es ts_rank.
+- SQLite: tabla virtual FTS5 actividades_busqueda_fts con contenido externo,
+  sin distinguir tildes; el orden es bm25, con el nombre pesando más que la
+  descripción.
+
+Cada término se busca como prefijo y deben aparecer todos; a igual
+relevancia van primero las actividades más recientes. Ni la columna ni la
+tabla FTS forman parte del modelo, así que las consultas las usan con RawSQL.
+"""
+import re
+
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+from django.utils.text import Truncator
+from django.utils.translation import gettext_lazy as _
+
+from users import scope
+from .models import ActividadPlanAnual
+
+FTS_TABLE = 'actividades_busqueda_fts'
+TABLA = ActividadPlanAnual._meta.db_table
+CONFIGURACION = 'spanish'
+# Peso del nombre frente a la descripción en bm25 (SQLite)
+PESO_NOMBRE = 10.0
+TAMANO_PAGINA = 25
+# Más allá de aquí conviene afinar la búsqueda que seguir paginando
+RESULTADOS_MAXIMOS = 500
+_TERMINO = re.compile(r'\w+')
+
+
+class Consulta:
+    def __init__(self, usuario, texto, filtros=None, desde=0):
+        self.usuario = usuario
+        self.texto = texto
+        self.terminos = _TERMINO.findall(texto)
+        # {'year'|'nivel'|'responsable': id, 'estado': letra}
+        self.filtros = filtros or {}
+        self.desde = desde
+
+    def filtradas(self):
+        """Actividades visibles que cumplen los filtros, sin mirar el texto"""
+        actividades = scope.restrict(
+            ActividadPlanAnual.objects.all(), self.usuario, 'plan__organization_level'
+        )
+        if 'year' in self.filtros:
+            actividades = actividades.filter(plan__year=self.filtros['year'])
+        if 'nivel' in self.filtros:
+            actividades = actividades.filter(plan__organization_level_id=self.filtros['nivel'])
+        if 'estado' in self.filtros:
+            actividades = actividades.filter(estado=self.filtros['estado'])
+        if 'responsable' in self.filtros:
+            actividades = actividades.filter(responsable_id=self.filtros['responsable'])
+        return actividades
+
+    def queryset(self):
+        """
+        Actividades de la página que empieza en `desde`, de más a menos
+        relevante, con una de más para saber si hay otra página.
+        """
+        fin = self.desde + TAMANO_PAGINA + 1
+        if connection.vendor == 'postgresql':
+            consulta = ' & '.join(f"{termino}:*" for termino in self.terminos)
+            return self.filtradas().filter(RawSQL(
+                f'"{TABLA}"."search_vector" @@ to_tsquery(%s, %s)',
+                (CONFIGURACION, consulta), output_field=BooleanField()
+            )).annotate(rango=RawSQL(
+                f'-ts_rank("{TABLA}"."search_vector", to_tsquery(%s, %s))',
+                (CONFIGURACION, consulta), output_field=FloatField()
+            )).order_by('rango', '-pk')[self.desde:fin]
+
+        # La página se ordena dentro de la tabla FTS unida a las actividades
+        # filtradas, que SQLite recorre una sola vez calculando bm25; con
+        # rowid IN (...) o bm25 en una subconsulta correlacionada sobre la
+        # tabla FTS repetiría el MATCH por cada actividad. La consulta externa
+        # toma los ids de la página y su rango de esa misma subconsulta, que
+        # SQLite materializa una vez
+        consulta = ' '.join('"{}"*'.format(termino.replace('"', '""')) for termino in self.terminos)
+        try:
+            filtradas, parametros = self.filtradas().order_by().values('pk').query.sql_with_params()
+        except EmptyResultSet:
+            # Sin niveles visibles el filtro es IN () y no hay SQL que compilar
+            return ActividadPlanAnual.objects.none()
+        pagina = (
+            f'SELECT {FTS_TABLE}.rowid AS id, bm25({FTS_TABLE}, %s, 1.0) AS rango FROM {FTS_TABLE} '
+            f'JOIN ({filtradas}) AS filtradas ON filtradas.pk = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s ORDER BY rango, {FTS_TABLE}.rowid DESC LIMIT %s OFFSET %s'
+        )
+        parametros_pagina = (PESO_NOMBRE, *parametros, consulta, fin - self.desde, self.desde)
+        return ActividadPlanAnual.objects.filter(
+            pk__in=RawSQL(f'SELECT id FROM ({pagina})', parametros_pagina)
+        ).annotate(rango=RawSQL(
+            f'SELECT pagina.rango FROM ({pagina}) AS pagina WHERE pagina.id = "{TABLA}"."id"',
+            parametros_pagina, output_field=FloatField()
+        )).order_by('rango', '-pk')
+
+    def pagina(self):
+        """(actividades, hay_mas) de la página que empieza en `desde`"""
+        actividades = list(self.queryset().select_related('plan__organization_level', 'responsable'))
+        return actividades[:TAMANO_PAGINA], len(actividades) > TAMANO_PAGINA
+
+    def siguiente(self, hay_mas):
+        """`desde` de la página siguiente, o None si no hay otra que mostrar"""
+        desde = self.desde + TAMANO_PAGINA
+        return desde if hay_mas and desde < RESULTADOS_MAXIMOS else None
+
+
+def resultado(actividad):
+    """Actividad de pagina() como diccionario para la respuesta JSON"""
+    return {
+        'id': actividad.pk,
+        'nombre': actividad.nombre,
+        'descripcion': Truncator(actividad.descripcion).words(30),
+        'plan': actividad.plan_id,
+        'year': actividad.plan.year,
+        'nivel': actividad.plan.organization_level.name,
+        'responsable': actividad.responsable.get_full_name(),
+        'estado': actividad.estado,
+        'estado_display': str(actividad.get_estado_display()),
+        'avance': actividad.avance,
+        'inicio': actividad.fecha_inicio,
+        'fin': actividad.fecha_fin,
+        'url': reverse('plan_anual_detail', args=[actividad.plan_id]),
+    }
+
+
+def leer(request):
+    """Consulta a partir de los parámetros GET; lanza ValidationError si no son válidos"""
+    texto = request.GET.get('q', '').strip()
+    if not _TERMINO.search(texto):
+        raise ValidationError(_('Escriba al menos una palabra para buscar'))
+    try:
+        filtros = {
+            nombre: int(request.GET[nombre])
+            for nombre in ('year', 'nivel', 'responsable') if request.GET.get(nombre)
+        }
+        desde = int(request.GET.get('desde') or 0)
+    except ValueError:
+        raise ValidationError(_('Filtros no válidos'))
+    estado = request.GET.get('estado')
+    if estado:
+        if estado not in dict(ActividadPlanAnual.ESTADO_CHOICES):
+            raise ValidationError(_('Estado no válido'))
+        filtros['estado'] = estado
+    if not 0 <= desde < RESULTADOS_MAXIMOS:
+        raise ValidationError(
+            _('Solo se muestran los primeros %(maximo)s resultados') % {'maximo': RESULTADOS_MAXIMOS}
+        )
+    return Consulta(request.user, texto, filtros, desde)
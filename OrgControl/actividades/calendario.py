@@ -0,0 +1,122 @@
+"""
+Actividades que se superponen con un rango de fechas, para vistas de
+calendario y Gantt.
+
+La respuesta va por columnas: una lista por campo en lugar de un objeto
+por actividad, con las fechas como días desde `desde` y los responsables
+por id, con sus nombres una sola vez en un diccionario aparte. Así el JSON
+ocupa una fracción de lo que ocuparía fila por fila.
+
+La ETag sale de los ids y revisiones (PlanAnual.revision) de los planes
+consultados: mientras ninguno cambie, el sondeo del navegador recibe un 304
+sin que se lea ninguna actividad.
+"""
+import hashlib
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db.models import Exists, OuterRef
+from django.utils.translation import gettext_lazy as _
+
+from users import scope
+from .models import ActividadPlanAnual, PlanAnual
+
+User = get_user_model()
+
+DIAS_MAXIMOS = 400
+FILTROS = ('plan', 'nivel', 'responsable')
+
+
+class Consulta:
+    def __init__(self, usuario, desde, hasta, filtros):
+        self.usuario = usuario
+        self.desde = desde
+        self.hasta = hasta
+        # {'plan'|'nivel'|'responsable': id}
+        self.filtros = filtros
+        self._revisiones = None
+
+    def planes(self):
+        planes = scope.restrict(PlanAnual.objects.all(), self.usuario)
+        if 'plan' in self.filtros:
+            planes = planes.filter(pk=self.filtros['plan'])
+        if 'nivel' in self.filtros:
+            planes = planes.filter(organization_level_id=self.filtros['nivel'])
+        if 'responsable' in self.filtros:
+            planes = planes.filter(Exists(ActividadPlanAnual.objects.filter(
+                plan=OuterRef('pk'), responsable_id=self.filtros['responsable']
+            )))
+        return planes
+
+    def revisiones(self):
+        """[(id, revisión)] de los planes consultados, leídos una sola vez"""
+        if self._revisiones is None:
+            self._revisiones = sorted(self.planes().values_list('pk', 'revision'))
+        return self._revisiones
+
+    def actividades(self):
+        actividades = ActividadPlanAnual.objects.filter(
+            plan_id__in=[pk for pk, _revision in self.revisiones()],
+            fecha_inicio__lte=self.hasta,
+            fecha_fin__gte=self.desde
+        )
+        if 'responsable' in self.filtros:
+            actividades = actividades.filter(responsable_id=self.filtros['responsable'])
+        return actividades.order_by('fecha_inicio', 'pk')
+
+
+def leer(request):
+    """Consulta a partir de los parámetros GET; lanza ValidationError si no son válidos"""
+    try:
+        desde = date.fromisoformat(request.GET['desde'])
+        hasta = date.fromisoformat(request.GET['hasta'])
+        filtros = {nombre: int(request.GET[nombre]) for nombre in FILTROS if request.GET.get(nombre)}
+    except KeyError:
+        raise ValidationError(_('Se requieren las fechas desde y hasta'))
+    except ValueError:
+        raise ValidationError(_('Fechas o identificadores no válidos'))
+    if desde > hasta:
+        raise ValidationError(_('La fecha desde no puede ser posterior a la fecha hasta'))
+    if (hasta - desde).days > DIAS_MAXIMOS:
+        raise ValidationError(_('El rango no puede superar %(dias)s días') % {'dias': DIAS_MAXIMOS})
+    return Consulta(request.user, desde, hasta, filtros)
+
+
+def etag(consulta):
+    firma = repr((consulta.desde, consulta.hasta, sorted(consulta.filtros.items()), consulta.revisiones()))
+    return hashlib.sha256(firma.encode()).hexdigest()
+
+
+def datos(consulta):
+    columnas = {nombre: [] for nombre in (
+        'id', 'plan', 'nombre', 'responsable', 'inicio', 'fin', 'estado', 'avance'
+    )}
+    filas = consulta.actividades().values_list(
+        'pk', 'plan_id', 'nombre', 'responsable_id', 'fecha_inicio', 'fecha_fin', 'estado', 'avance'
+    )
+    for pk, plan_id, nombre, responsable_id, inicio, fin, estado, avance in filas:
+        columnas['id'].append(pk)
+        columnas['plan'].append(plan_id)
+        columnas['nombre'].append(nombre)
+        columnas['responsable'].append(responsable_id)
+        columnas['inicio'].append((inicio - consulta.desde).days)
+        columnas['fin'].append((fin - consulta.desde).days)
+        columnas['estado'].append(estado)
+        columnas['avance'].append(avance)
+
+    responsables = {
+        pk: f"{first_name} {last_name}".strip()
+        for pk, first_name, last_name in User.objects.filter(
+            pk__in=set(columnas['responsable'])
+        ).values_list('pk', 'first_name', 'last_name')
+    } if columnas['id'] else {}
+
+    return {
+        'desde': consulta.desde.isoformat(),
+        'hasta': consulta.hasta.isoformat(),
+        'total': len(columnas['id']),
+        'columnas': columnas,
+        'responsables': responsables,
+        'estados': dict(ActividadPlanAnual.ESTADO_CHOICES),
+    }
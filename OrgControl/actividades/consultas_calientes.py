@@ -0,0 +1,110 @@
+"""
+Consultas frecuentes de actividades, revisadas por explicar_consultas.
+
+Cada función arma el queryset tal como lo ejecuta la vista correspondiente,
+con ids de muestra tomados de la base de datos.
+"""
+from datetime import timedelta
+
+from django.db.models import Count
+
+from OrgControl.consultas_calientes import registrar
+from users.models import CustomUser
+from . import bandeja, busqueda, calendario
+from .dashboard.views import actividades_por_vencer
+from .models import ActividadPlanAnual, Aprobacion, PlanAnual
+from .reportes import consulta_reporte
+
+
+def _plan_id():
+    return PlanAnual.objects.values_list('pk', flat=True).first()
+
+
+@registrar('actividades.bandeja')
+def bandeja_pendientes():
+    """Primera página de la bandeja de un aprobador (índice parcial de pendientes)"""
+    aprobador_id = Aprobacion.objects.filter(estado='P').values_list('aprobador_id', flat=True).first()
+    if aprobador_id is None:
+        return None
+    return bandeja.consulta(CustomUser(pk=aprobador_id))
+
+
+@registrar('actividades.bandeja_siguiente')
+def bandeja_siguiente():
+    """Página siguiente de la bandeja, a partir del cursor (orden, id) de la anterior"""
+    ultima = Aprobacion.objects.filter(estado='P').values('aprobador_id', 'orden', 'pk').first()
+    if ultima is None:
+        return None
+    return bandeja.consulta(CustomUser(pk=ultima['aprobador_id']), (ultima['orden'], ultima['pk']))
+
+
+@registrar('actividades.por_vencer')
+def por_vencer():
+    """Actividades abiertas de un responsable por fecha de fin (tablero)"""
+    responsable_id = ActividadPlanAnual.objects.filter(
+        estado__in=ActividadPlanAnual.ESTADOS_ABIERTOS
+    ).values_list('responsable_id', flat=True).first()
+    if responsable_id is None:
+        return None
+    return actividades_por_vencer(CustomUser(pk=responsable_id))
+
+
+@registrar('actividades.plan_estadisticas')
+def plan_estadisticas():
+    """Conteo por estado de las actividades de un plan (detalle y resumen)"""
+    plan_id = _plan_id()
+    if plan_id is None:
+        return None
+    return ActividadPlanAnual.objects.filter(plan_id=plan_id).values('estado').annotate(
+        total=Count('pk')
+    ).order_by()
+
+
+@registrar('actividades.plan_tabla')
+def plan_tabla():
+    """Primera página de la tabla de actividades de un plan, por fecha de inicio"""
+    plan_id = _plan_id()
+    if plan_id is None:
+        return None
+    return ActividadPlanAnual.objects.filter(plan_id=plan_id).select_related(
+        'responsable'
+    ).order_by('fecha_inicio', 'fecha_fin', 'pk')[:25]
+
+
+@registrar('actividades.reporte')
+def reporte():
+    """Filas del reporte Excel/PDF de un plan"""
+    plan_id = _plan_id()
+    if plan_id is None:
+        return None
+    return consulta_reporte(PlanAnual(pk=plan_id))
+
+
+@registrar('actividades.planes_por_nivel')
+def planes_por_nivel():
+    """Planes de los niveles visibles para un usuario, del año más reciente"""
+    nivel_ids = list(PlanAnual.objects.values_list('organization_level_id', flat=True)[:5])
+    if not nivel_ids:
+        return None
+    return PlanAnual.objects.filter(organization_level_id__in=nivel_ids).order_by('-year')
+
+
+@registrar('actividades.calendario')
+def calendario_rango():
+    """Actividades de todos los planes que se superponen con un mes (superusuario)"""
+    fecha = ActividadPlanAnual.objects.values_list('fecha_inicio', flat=True).first()
+    if fecha is None:
+        return None
+    consulta = calendario.Consulta(CustomUser(is_superuser=True), fecha, fecha + timedelta(days=30), {})
+    return consulta.actividades()
+
+
+@registrar('actividades.busqueda')
+def busqueda_texto():
+    """Primera página de una búsqueda por la primera palabra de una actividad (superusuario)"""
+    nombre = ActividadPlanAnual.objects.values_list('nombre', flat=True).first()
+    terminos = busqueda._TERMINO.findall(nombre or '')
+    if not terminos:
+        return None
+    consulta = busqueda.Consulta(CustomUser(is_superuser=True), terminos[0])
+    return consulta.queryset().select_related('plan__organization_level', 'responsable')
@@ -1,9 +1,6 @@
-from tkinter.font import names
-
-from django.conf.urls.i18n import urlpatterns
 from django.urls import path
 from . import views
 
 urlpatterns = [
-    path('dashboard/', views.dashboard_view, name='dashboard'),
-]
\ No newline at end of file
+    path('', views.DashboardView.as_view(), name='dashboard'),
+]
@@ -1,31 +1,60 @@
-from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import TemplateView
-from django.db.models import Count, Q
-from actividades.models import PlanAnual, ActividadPlanAnual
+from django.db.models import Count, Q, Sum
+from OrgControl.asincrono import LoginRequiredAsyncMixin
+from OrgControl.routers import ReplicaMixin
+from actividades.models import ActividadPlanAnual, PlanAnual, ResumenActividades
 
+LIMITE_MIS_ACTIVIDADES = 10
 
-class DashboardView(LoginRequiredMixin, TemplateView):
-    template_name = 'dashboard/executive.html'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        user = self.request.user
+def actividades_por_vencer(usuario, limite=LIMITE_MIS_ACTIVIDADES):
+    """Actividades abiertas de `usuario`, primero las que vencen antes"""
+    return ActividadPlanAnual.objects.filter(
+        responsable=usuario,
+        estado__in=ActividadPlanAnual.ESTADOS_ABIERTOS
+    ).order_by('fecha_fin')[:limite]
+
+
+class DashboardView(LoginRequiredAsyncMixin, ReplicaMixin, TemplateView):
+    template_name = 'dashboard.html'
+
+    async def get(self, request, *args, **kwargs):
+        context = await self.aget_context_data(**kwargs)
+        return self.render_to_response(context)
+
+    async def aget_context_data(self, **kwargs):
+        context = self.get_context_data(**kwargs)
+        context['mis_actividades'] = [
+            actividad async for actividad in actividades_por_vencer(self.request.user)
+        ]
 
         # Estadísticas clave
-        context['total_planes'] = PlanAnual.objects.count()
-        context['planes_aprobados'] = PlanAnual.objects.filter(approved=True).count()
-
-        context['actividades_estado'] = ActividadPlanAnual.objects.values(
-            'estado'
-        ).annotate(
-            total=Count('id')
-        ).order_by('estado')
-
-        # Gráfico de avance por nivel organizacional
-        context['avance_niveles'] = ActividadPlanAnual.objects.values(
-            'plan__organization_level__name'
-        ).annotate(
-            promedio_avance=models.Avg('avance')
-        ).order_by('-promedio_avance')
-
-        return context
\ No newline at end of file
+        context.update(await PlanAnual.objects.aaggregate(
+            total_planes=Count('id'),
+            planes_aprobados=Count('id', filter=Q(approved=True))
+        ))
+
+        # Los totales por estado y nivel salen de la tabla de resumen precalculada
+        resumen = ResumenActividades.objects.filter(total__gt=0)
+        context['actividades_estado'] = [
+            fila async for fila in resumen.values('estado').annotate(total=Sum('total')).order_by('estado')
+        ]
+
+        # Gráfico de avance por nivel organizacional; se agrupa por id porque
+        # niveles de distintas ramas pueden llamarse igual
+        avance_niveles = [
+            {
+                'id': fila['organization_level_id'],
+                'nombre': fila['organization_level__name'],
+                'promedio_avance': fila['suma_avance'] / fila['total']
+            }
+            async for fila in resumen.values('organization_level_id', 'organization_level__name').annotate(
+                total=Sum('total'),
+                suma_avance=Sum('suma_avance')
+            ).order_by()
+        ]
+        context['avance_niveles'] = sorted(
+            avance_niveles, key=lambda nivel: nivel['promedio_avance'], reverse=True
+        )
+
+        return context
@@ -0,0 +1,140 @@
+"""
+Avisos en vivo de la bandeja de aprobaciones y de las actividades de cada
+plan (ver OrgControl/eventos.py).
+
+Canales:
+- bandeja:<id de usuario>: cambiaron las aprobaciones en turno del usuario.
+  El mensaje no lleva datos; el flujo vuelve a leer el total y las primeras
+  pendientes, así que varios avisos seguidos cuestan una sola lectura.
+- plan:<id>: cambió el estado o el avance de actividades del plan; el
+  mensaje lleva los valores nuevos y el flujo los reenvía sin consultar.
+  Las altas, bajas e importaciones se anuncian como 'recargar'.
+
+Todo se publica con transaction.on_commit: quien recibe el aviso ya puede
+leer los cambios, y nada se anuncia si la transacción se revierte.
+"""
+from django.db import transaction
+from django.urls import reverse
+
+from OrgControl import eventos
+from . import bandeja
+from .models import Aprobacion, PlanAnual
+
+# Pendientes que se envían con cada actualización de la bandeja
+LIMITE_BANDEJA = 10
+
+
+def canal_bandeja(usuario_id):
+    return f"bandeja:{usuario_id}"
+
+
+def canal_plan(plan_id):
+    return f"plan:{plan_id}"
+
+
+def avisar_bandejas(aprobador_ids):
+    aprobador_ids = set(aprobador_ids)
+    if not aprobador_ids:
+        return
+
+    def publicar():
+        for aprobador_id in aprobador_ids:
+            eventos.publicar(canal_bandeja(aprobador_id), 'bandeja')
+    transaction.on_commit(publicar, robust=True)
+
+
+def avisar_turnos(turnos):
+    """
+    `turnos` es {id de actividad: órdenes que cambiaron de estado}, p. ej. el
+    paso que se cerró y el que se abrió; se avisa a los aprobadores de esos
+    pasos.
+    """
+    if not turnos:
+        return
+    filas = Aprobacion.objects.filter(actividad_id__in=list(turnos)).values_list(
+        'actividad_id', 'orden', 'aprobador_id'
+    )
+    avisar_bandejas(
+        aprobador_id for actividad_id, orden, aprobador_id in filas if orden in turnos[actividad_id]
+    )
+
+
+def avisar_actividades(actividades):
+    por_plan = {}
+    for actividad in actividades:
+        por_plan.setdefault(actividad.plan_id, []).append({
+            'id': actividad.pk,
+            'estado': actividad.estado,
+            'estado_display': str(actividad.get_estado_display()),
+            'avance': actividad.avance,
+        })
+    if not por_plan:
+        return
+
+    def publicar():
+        for plan_id, cambios in por_plan.items():
+            eventos.publicar(canal_plan(plan_id), 'actividades', {'actividades': cambios})
+    transaction.on_commit(publicar, robust=True)
+
+
+def avisar_recarga(plan_id):
+    transaction.on_commit(lambda: eventos.publicar(canal_plan(plan_id), 'recargar'), robust=True)
+
+
+@eventos.leer
+def estado_bandeja(usuario):
+    elementos = list(bandeja.consulta(usuario, tamano=LIMITE_BANDEJA)[:LIMITE_BANDEJA])
+    return bandeja.pendientes_en_turno(usuario).count(), [
+        {
+            'id': aprobacion.pk,
+            'actividad': aprobacion.actividad.nombre,
+            'plan': str(aprobacion.actividad.plan),
+            'responsable': aprobacion.actividad.responsable.get_full_name(),
+            'url': reverse('aprobar_actividad', args=[aprobacion.pk]),
+        }
+        for aprobacion in elementos
+    ]
+
+
+def flujo_bandeja(usuario):
+    """Eventos 'bandeja' con el total en turno, las primeras pendientes y las que son nuevas"""
+    enviadas = None
+
+    async def actualizar(mensajes=()):
+        nonlocal enviadas
+        pendientes, elementos = await estado_bandeja(usuario)
+        # En la primera lectura de la conexión nada cuenta como nuevo
+        nuevas = [] if enviadas is None else [
+            elemento for elemento in elementos if elemento['id'] not in enviadas
+        ]
+        enviadas = {elemento['id'] for elemento in elementos}
+        return [('bandeja', {'pendientes': pendientes, 'elementos': elementos, 'nuevas': nuevas})]
+
+    return eventos.transmitir([canal_bandeja(usuario.pk)], actualizar, actualizar)
+
+
+@eventos.leer
+def revision_plan(plan_id):
+    return PlanAnual.objects.filter(pk=plan_id).values_list('revision', flat=True).first()
+
+
+def flujo_plan(plan_id):
+    """
+    Al conectar, evento 'plan' con la revisión actual para que el navegador
+    recargue si cambió mientras estaba desconectado; luego 'actividades' con
+    los cambios de estado y avance, o 'recargar'.
+    """
+    async def al_conectar():
+        return [('plan', {'revision': await revision_plan(plan_id)})]
+
+    async def al_recibir(mensajes):
+        if any(mensaje.evento in ('recargar', eventos.DESBORDE.evento) for mensaje in mensajes):
+            return [('recargar', {})]
+        # Si la misma actividad cambió varias veces en el lote basta el último valor
+        cambios = {}
+        for mensaje in mensajes:
+            for actividad in mensaje.datos['actividades']:
+                cambios[actividad['id']] = actividad
+        return [('actividades', {'actividades': list(cambios.values())})]
+
+    return eventos.transmitir([canal_plan(plan_id)], al_conectar, al_recibir)
@@ -0,0 +1,223 @@
+"""
+Motor de estados del flujo de aprobación de actividades.
+
+Cada actividad guarda su propio avance en el flujo: aprobaciones y rechazos
+acumulados, el `orden` del paso en curso y cuántas aprobaciones le faltan a
+ese paso. Registrar una decisión solo toca la aprobación, la actividad y, al
+cerrar un paso, las filas del paso siguiente (índice aprobacion_paso_idx),
+así que su costo no depende de la longitud de la cadena. decidir_en_lote()
+aplica una misma decisión a cientos de aprobaciones con escrituras en
+bloque.
+
+Un paso son todas las aprobaciones con el mismo `orden`. Hoy cada paso tiene
+un solo aprobador (approval_order es único por flujo), pero el motor admite
+pasos paralelos: el paso se cierra al reunir requeridas() aprobaciones. Un
+rechazo de cualquier aprobador en turno rechaza la actividad.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from . import eventos, resumen
+from .models import PlanAnual, ActividadPlanAnual, Aprobacion, NotificacionCorreo
+
+# Límite de aprobaciones por decisión en lote
+LOTE_MAXIMO = 500
+
+CAMPOS_FLUJO = ('aprobaciones_aprobadas', 'aprobaciones_rechazadas', 'orden_pendiente', 'faltan_en_paso')
+
+
+def requeridas(total_paso):
+    """Aprobaciones necesarias para cerrar un paso con `total_paso` aprobadores (unanimidad)"""
+    return total_paso
+
+
+def preparar(actividad, aprobaciones):
+    """Fija el estado inicial del flujo en `actividad` a partir de sus aprobaciones sin guardar"""
+    actividad.aprobaciones_aprobadas = 0
+    actividad.aprobaciones_rechazadas = 0
+    if not aprobaciones:
+        actividad.orden_pendiente = None
+        actividad.faltan_en_paso = 0
+        return
+    primero = min(aprobacion.orden for aprobacion in aprobaciones)
+    actividad.orden_pendiente = primero
+    actividad.faltan_en_paso = requeridas(sum(1 for a in aprobaciones if a.orden == primero))
+
+
+def iniciar(actividad, aprobaciones):
+    """Como preparar(), para una actividad ya guardada; no dispara señales"""
+    preparar(actividad, aprobaciones)
+    ActividadPlanAnual.objects.filter(pk=actividad.pk).update(
+        **{campo: getattr(actividad, campo) for campo in CAMPOS_FLUJO}
+    )
+
+
+def _aplicar(actividad, estado):
+    """Suma la decisión a los contadores; devuelve True si cerró el paso en curso"""
+    if estado == 'R':
+        actividad.aprobaciones_rechazadas += 1
+        actividad.orden_pendiente = None
+        actividad.faltan_en_paso = 0
+        actividad.estado = 'R'
+        return False
+    actividad.aprobaciones_aprobadas += 1
+    actividad.faltan_en_paso -= 1
+    return actividad.faltan_en_paso <= 0
+
+
+def _avanzar(actividades):
+    """
+    Pasa al paso siguiente las actividades cuyo paso se cerró o, si no queda
+    ninguno, las aprueba. Debe llamarse antes de guardarlas: el paso
+    siguiente se busca a partir del `orden_pendiente` aún guardado.
+    """
+    if not actividades:
+        return
+    primer_orden_siguiente = Aprobacion.objects.filter(
+        actividad=OuterRef('actividad'),
+        orden__gt=OuterRef('actividad__orden_pendiente')
+    ).order_by('orden').values('orden')[:1]
+    pasos = {
+        fila['actividad_id']: (fila['orden'], fila['total'])
+        for fila in Aprobacion.objects.filter(
+            actividad_id__in=[actividad.pk for actividad in actividades],
+            orden=Subquery(primer_orden_siguiente)
+        ).values('actividad_id', 'orden').annotate(total=Count('pk')).order_by()
+    }
+    for actividad in actividades:
+        if actividad.pk in pasos:
+            actividad.orden_pendiente, total = pasos[actividad.pk]
+            actividad.faltan_en_paso = requeridas(total)
+        else:
+            actividad.orden_pendiente = None
+            actividad.faltan_en_paso = 0
+            actividad.estado = 'A'
+
+
+def registrar_decision(aprobacion, aprobador, estado, comentarios=''):
+    """
+    Aplica la decisión (A o R) de `aprobador` sobre `aprobacion` y avanza el flujo.
+
+    La actividad se bloquea durante la transacción para que dos aprobadores
+    del mismo paso no cierren el paso dos veces. Lanza ValidationError si la
+    aprobación no le corresponde o no está en turno. Devuelve la actividad
+    actualizada.
+    """
+    if estado not in ('A', 'R'):
+        raise ValidationError(_('Decisión no válida'))
+
+    with transaction.atomic():
+        actividad = ActividadPlanAnual.objects.select_for_update().get(pk=aprobacion.actividad_id)
+        aprobacion = Aprobacion.objects.get(pk=aprobacion.pk)
+        if aprobacion.aprobador_id != aprobador.pk:
+            raise ValidationError(_('Esta aprobación está asignada a otro usuario'))
+        if aprobacion.estado != 'P' or actividad.orden_pendiente != aprobacion.orden:
+            raise ValidationError(_('La aprobación no está en turno o ya fue resuelta'))
+
+        aprobacion.estado = estado
+        aprobacion.comentarios = comentarios
+        aprobacion.save()
+
+        orden_anterior = actividad.orden_pendiente
+        if _aplicar(actividad, estado):
+            _avanzar([actividad])
+        actividad.save(update_fields=[*CAMPOS_FLUJO, 'estado'])
+        eventos.avisar_turnos({actividad.pk: {orden_anterior, actividad.orden_pendiente}})
+    return actividad
+
+
+class ResultadoLote:
+    def __init__(self):
+        self.aplicadas = []
+        # {id de aprobación: motivo}
+        self.omitidas = {}
+
+
+def decidir_en_lote(ids, aprobador, estado, comentarios=''):
+    """
+    Aplica la misma decisión a varias aprobaciones de `aprobador` en una
+    sola transacción.
+
+    Las actividades se bloquean con SKIP LOCKED: las que otro proceso está
+    decidiendo en ese momento se omiten en lugar de esperar. Las
+    aprobaciones ajenas, inexistentes o fuera de turno también se omiten.
+    Las escrituras se hacen en bloque, por lo que aquí se replica lo que
+    Aprobacion.save() y las señales de la actividad harían fila por fila.
+    """
+    if estado not in ('A', 'R'):
+        raise ValidationError(_('Decisión no válida'))
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > LOTE_MAXIMO:
+        raise ValidationError(
+            _('No se pueden decidir más de %(maximo)s aprobaciones a la vez') % {'maximo': LOTE_MAXIMO}
+        )
+
+    resultado = ResultadoLote()
+    with transaction.atomic():
+        actividad_ids = Aprobacion.objects.filter(
+            pk__in=ids, aprobador=aprobador
+        ).values_list('actividad_id', flat=True)
+        actividades = {
+            actividad.pk: actividad
+            for actividad in ActividadPlanAnual.objects.select_for_update(skip_locked=True).filter(
+                pk__in=list(actividad_ids)
+            ).order_by('pk')
+        }
+        # Se releen tras el bloqueo para no decidir sobre un estado ya superado
+        aprobaciones = {
+            aprobacion.pk: aprobacion
+            for aprobacion in Aprobacion.objects.filter(pk__in=ids, aprobador=aprobador)
+        }
+
+        ahora = timezone.now()
+        decididas, originales, cerradas = [], {}, []
+        # {id de actividad: pasos cuyos aprobadores ven cambiar su bandeja}
+        turnos = {}
+        for pk in ids:
+            aprobacion = aprobaciones.get(pk)
+            if aprobacion is None:
+                resultado.omitidas[pk] = 'no_encontrada'
+                continue
+            actividad = actividades.get(aprobacion.actividad_id)
+            if actividad is None:
+                resultado.omitidas[pk] = 'bloqueada'
+                continue
+            if aprobacion.estado != 'P' or actividad.orden_pendiente != aprobacion.orden:
+                resultado.omitidas[pk] = 'fuera_de_turno'
+                continue
+
+            aprobacion.estado = estado
+            aprobacion.comentarios = comentarios
+            aprobacion.fecha_aprobacion = ahora
+            decididas.append(aprobacion)
+            originales[actividad.pk] = actividad.valores_originales()
+            turnos.setdefault(actividad.pk, {actividad.orden_pendiente})
+            if _aplicar(actividad, estado):
+                cerradas.append(actividad)
+            resultado.aplicadas.append(pk)
+
+        if not decididas:
+            return resultado
+
+        _avanzar(cerradas)
+        Aprobacion.objects.bulk_update(decididas, ['estado', 'comentarios', 'fecha_aprobacion'])
+        NotificacionCorreo.objects.bulk_create(
+            [NotificacionCorreo(aprobacion=aprobacion) for aprobacion in decididas]
+        )
+
+        modificadas = [actividades[pk] for pk in originales]
+        ActividadPlanAnual.objects.bulk_update(modificadas, [*CAMPOS_FLUJO, 'estado'])
+        resumen.registrar_guardados([(actividad, originales[actividad.pk]) for actividad in modificadas])
+        PlanAnual.incrementar_revision(*{actividad.plan_id for actividad in modificadas})
+        for actividad in modificadas:
+            turnos[actividad.pk].add(actividad.orden_pendiente)
+        eventos.avisar_turnos(turnos)
+        eventos.avisar_actividades(
+            actividad for actividad in modificadas if actividad.estado != originales[actividad.pk]['estado']
+        )
+        for actividad in modificadas:
+            actividad.guardar_originales()
+    return resultado
@@ -1,7 +1,7 @@
 from django import forms
 
 from users.models import OrganizationLevel
-from .models import PlanAnual, ActividadPlanAnual
+from .models import PlanAnual, ActividadPlanAnual, Aprobacion
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -36,11 +36,37 @@ class ActividadPlanAnualForm(forms.ModelForm):
         }
 
     def __init__(self, *args, **kwargs):
-        plan_id = kwargs.pop('plan_id', None)
+        plan = kwargs.pop('plan', None)
         super().__init__(*args, **kwargs)
 
-        if plan_id:
-            plan = PlanAnual.objects.get(id=plan_id)
+        if plan:
+            # clean() del modelo necesita el plan antes de validar
+            self.instance.plan = plan
             self.fields['responsable'].queryset = User.objects.filter(
-                profile__organizational_level=plan.organization_level
-            )
\ No newline at end of file
+                organization_level_id=plan.organization_level_id
+            )
+
+class DecisionAprobacionForm(forms.ModelForm):
+    # El estado llega del botón pulsado (Aprobar o Rechazar)
+    estado = forms.ChoiceField(choices=[('A', 'Aprobado'), ('R', 'Rechazado')])
+
+    class Meta:
+        model = Aprobacion
+        fields = ['estado', 'comentarios']
+        widgets = {
+            'comentarios': forms.Textarea(attrs={'rows': 3, 'class': 'form-control'})
+        }
+
+
+class ImportarActividadesForm(forms.Form):
+    archivo = forms.FileField(
+        label='Archivo CSV o XLSX',
+        help_text='Columnas: nombre, descripcion, responsable (usuario o correo), fecha_inicio, fecha_fin',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'})
+    )
+
+    def clean_archivo(self):
+        archivo = self.cleaned_data['archivo']
+        if not archivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Solo se admiten archivos CSV o XLSX')
+        return archivo
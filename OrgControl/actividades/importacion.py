@@ -0,0 +1,194 @@
+"""
+Importación masiva de actividades de un plan anual desde CSV o XLSX.
+
+Las filas se validan completas en memoria antes de escribir nada; si todo es
+correcto las actividades y sus aprobaciones se insertan con bulk_create dentro
+de una sola transacción, generando las mismas aprobaciones y el mismo estado
+inicial del flujo que la señal configurar_flujo_aprobacion.
+"""
+import csv
+import io
+import os
+import zipfile
+from datetime import date, datetime
+from xml.etree.ElementTree import ParseError
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from users.models import ApprovalFlow
+from . import eventos, flujo, resumen
+from .models import PlanAnual, ActividadPlanAnual, Aprobacion
+
+User = get_user_model()
+
+COLUMNAS = ('nombre', 'descripcion', 'responsable', 'fecha_inicio', 'fecha_fin')
+COLUMNAS_OBLIGATORIAS = ('nombre', 'responsable', 'fecha_inicio', 'fecha_fin')
+FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y')
+TAMANO_LOTE = 500
+# Archivos dañados o que no son lo que dice su extensión: un XLSX que no es
+# un ZIP, un ZIP sin las partes de un libro, XML ilegible o un CSV mal formado
+ERRORES_ARCHIVO = (zipfile.BadZipFile, InvalidFileException, KeyError, ParseError, csv.Error)
+
+
+class ResultadoImportacion:
+    def __init__(self):
+        self.actividades = 0
+        self.aprobaciones = 0
+        self.errores = []
+
+    @property
+    def correcto(self):
+        return not self.errores
+
+    def agregar_error(self, fila, mensaje):
+        self.errores.append((fila, mensaje))
+
+
+def leer_filas(archivo, nombre=None):
+    """
+    Devuelve las filas del archivo (abierto en modo binario) como diccionarios
+    con las cabeceras en minúsculas.
+    """
+    nombre = nombre or getattr(archivo, 'name', '')
+    extension = os.path.splitext(nombre)[1].lower()
+
+    if extension == '.xlsx':
+        libro = load_workbook(archivo, read_only=True, data_only=True)
+        filas = libro.active.iter_rows(values_only=True)
+        cabecera = [str(celda or '').strip().lower() for celda in next(filas, ())]
+        for fila in filas:
+            if any(celda not in (None, '') for celda in fila):
+                yield dict(zip(cabecera, fila))
+        libro.close()
+    elif extension == '.csv':
+        lector = csv.DictReader(io.StringIO(archivo.read().decode('utf-8-sig'), newline=''))
+        lector.fieldnames = [campo.strip().lower() for campo in lector.fieldnames or []]
+        yield from lector
+    else:
+        raise ValueError(f"Formato no soportado: '{extension}'. Use CSV o XLSX.")
+
+
+def _convertir_fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor or '').strip()
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def validar_filas(plan, filas, resultado):
+    """Convierte las filas en instancias de ActividadPlanAnual sin guardar, acumulando errores"""
+    filas = list(filas)
+    identificadores = {str(fila.get('responsable') or '').strip() for fila in filas}
+    identificadores.discard('')
+    responsables = {}
+    for usuario in User.objects.filter(
+        Q(username__in=identificadores) | Q(email__in=identificadores)
+    ).only('pk', 'username', 'email', 'organization_level'):
+        responsables[usuario.username] = usuario
+        if usuario.email:
+            responsables.setdefault(usuario.email, usuario)
+
+    actividades = []
+    # La fila 1 es la cabecera
+    for numero, fila in enumerate(filas, start=2):
+        faltantes = [c for c in COLUMNAS_OBLIGATORIAS if not str(fila.get(c) or '').strip()]
+        if faltantes:
+            resultado.agregar_error(numero, f"Faltan columnas obligatorias: {', '.join(faltantes)}")
+            continue
+
+        nombre = str(fila['nombre']).strip()
+        if len(nombre) > ActividadPlanAnual._meta.get_field('nombre').max_length:
+            resultado.agregar_error(numero, 'El nombre supera los 200 caracteres')
+            continue
+
+        responsable = responsables.get(str(fila['responsable']).strip())
+        if responsable is None:
+            resultado.agregar_error(numero, f"Responsable desconocido: {fila['responsable']}")
+            continue
+        if responsable.organization_level_id != plan.organization_level_id:
+            resultado.agregar_error(numero, 'El responsable no pertenece al nivel organizacional del plan')
+            continue
+
+        fecha_inicio = _convertir_fecha(fila['fecha_inicio'])
+        fecha_fin = _convertir_fecha(fila['fecha_fin'])
+        if fecha_inicio is None or fecha_fin is None:
+            resultado.agregar_error(numero, 'Fecha con formato inválido (use AAAA-MM-DD o DD/MM/AAAA)')
+            continue
+        if fecha_inicio > fecha_fin:
+            resultado.agregar_error(numero, 'La fecha de inicio no puede ser posterior a la fecha de finalización')
+            continue
+
+        actividades.append(ActividadPlanAnual(
+            plan=plan,
+            nombre=nombre,
+            descripcion=str(fila.get('descripcion') or '').strip(),
+            responsable=responsable,
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin
+        ))
+    return actividades
+
+
+def importar_filas(plan, filas, tamano_lote=TAMANO_LOTE, progreso=None):
+    """
+    Valida e inserta las filas en `plan`.
+
+    Si alguna fila es inválida no se inserta nada. `progreso(hechas, total)`
+    se invoca después de cada lote de actividades insertado.
+    """
+    resultado = ResultadoImportacion()
+    actividades = validar_filas(plan, filas, resultado)
+    if not resultado.correcto or not actividades:
+        return resultado
+
+    aprobadores = plan.organization_level.get_approver_ids(ApprovalFlow.Module.ANNUAL_PLAN)
+    aprobaciones = []
+    for actividad in actividades:
+        propias = actividad.construir_aprobaciones(aprobadores)
+        flujo.preparar(actividad, propias)
+        aprobaciones += propias
+
+    with transaction.atomic():
+        for inicio in range(0, len(actividades), tamano_lote):
+            ActividadPlanAnual.objects.bulk_create(actividades[inicio:inicio + tamano_lote])
+            if progreso:
+                progreso(min(inicio + tamano_lote, len(actividades)), len(actividades))
+
+        # Las aprobaciones toman el id de su actividad al insertarse
+        Aprobacion.objects.bulk_create(aprobaciones, batch_size=tamano_lote)
+        # bulk_create no dispara señales
+        PlanAnual.incrementar_revision(plan.pk)
+        resumen.registrar_nuevas(plan, actividades)
+        eventos.avisar_recarga(plan.pk)
+        eventos.avisar_bandejas(
+            aprobacion.aprobador_id for aprobacion in aprobaciones
+            if aprobacion.orden == aprobacion.actividad.orden_pendiente
+        )
+
+    resultado.actividades = len(actividades)
+    resultado.aprobaciones = len(aprobaciones)
+    return resultado
+
+
+def importar_archivo(plan, archivo, nombre=None, tamano_lote=TAMANO_LOTE, progreso=None):
+    resultado_lectura = ResultadoImportacion()
+    try:
+        filas = list(leer_filas(archivo, nombre))
+    except (ValueError, UnicodeDecodeError) as exc:
+        resultado_lectura.agregar_error(0, str(exc))
+        return resultado_lectura
+    except ERRORES_ARCHIVO as exc:
+        resultado_lectura.agregar_error(0, f"No se pudo leer el archivo, está dañado o no es CSV/XLSX válido ({exc})")
+        return resultado_lectura
+    return importar_filas(plan, filas, tamano_lote, progreso)
@@ -0,0 +1,68 @@
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from actividades.importacion import importar_filas
+from actividades.models import ActividadPlanAnual, PlanAnual
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Compara la importación masiva con la creación actividad por actividad. '
+            'Ambas pasadas se revierten al terminar.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan_id', type=int)
+        parser.add_argument('--filas', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            plan = PlanAnual.objects.select_related('organization_level').get(pk=options['plan_id'])
+        except PlanAnual.DoesNotExist:
+            raise CommandError(f"No existe el plan {options['plan_id']}")
+        responsable = User.objects.filter(organization_level=plan.organization_level).first()
+        if responsable is None:
+            raise CommandError('El nivel del plan no tiene usuarios que puedan ser responsables')
+
+        inicio = date(plan.year, 1, 1)
+        filas = [
+            {
+                'nombre': f"Actividad de prueba {i}",
+                'descripcion': 'Generada por benchmark_importacion',
+                'responsable': responsable.username,
+                'fecha_inicio': inicio + timedelta(days=i % 300),
+                'fecha_fin': inicio + timedelta(days=i % 300 + 30),
+            }
+            for i in range(options['filas'])
+        ]
+
+        def por_fila():
+            for fila in filas:
+                ActividadPlanAnual.objects.create(plan=plan, responsable=responsable, **{
+                    k: v for k, v in fila.items() if k != 'responsable'
+                })
+
+        def masiva():
+            resultado = importar_filas(plan, filas)
+            if not resultado.correcto:
+                raise CommandError(f"Filas inválidas: {resultado.errores[:3]}")
+
+        for nombre, funcion in (('Por fila', por_fila), ('Masiva', masiva)):
+            segundos, consultas = self._medir(funcion)
+            self.stdout.write(
+                f"{nombre:<10} {len(filas)} actividades: {segundos:8.2f} s  {consultas:7d} consultas"
+            )
+
+    def _medir(self, funcion):
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as consultas:
+                inicio = time.perf_counter()
+                funcion()
+                segundos = time.perf_counter() - inicio
+            transaction.set_rollback(True)
+        return segundos, len(consultas)
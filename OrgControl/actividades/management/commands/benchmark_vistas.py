@@ -0,0 +1,230 @@
+import statistics
+import tempfile
+import time
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from OrgControl.middleware import registrar_consultas
+from actividades import sinteticos
+from actividades.models import Aprobacion
+from users.cache import invalidate_approvers
+from users.scope import invalidate_scopes
+
+User = get_user_model()
+
+PARAMETROS_DATATABLES = {
+    'draw': 1, 'start': 0, 'length': 25,
+    'order[0][column]': 0, 'order[0][dir]': 'asc', 'columns[0][data]': 'nombre',
+}
+
+# vista: (consultas máximas, milisegundos máximos). Las consultas no deben
+# crecer con el volumen de datos; el tiempo se escala con --factor-latencia.
+PRESUPUESTOS = {
+    'home': (3, 100),
+    'dashboard': (9, 200),
+    'plan_anual_list': (5, 200),
+    'plan_anual_detail': (4, 200),
+    'plan_actividades_data': (4, 250),
+    'aprobaciones_pendientes': (4, 100),
+    'aprobaciones_pendientes_data': (6, 250),
+    'aprobar_actividad': (5, 200),
+    'calendario_actividades': (5, 200),
+    'buscar_actividades': (6, 200),
+    'buscar_actividades_data': (4, 100),
+    'generar_reporte_excel': (6, 2000),
+    'generar_reporte_pdf': (5, 2000),
+    'generar_reporte_csv': (5, 2000),
+    'users:user_list': (4, 100),
+    'users:user_list_data': (6, 250),
+    'users:organization_structure': (5, 250),
+    'users:staff_directory': (5, 200),
+}
+
+# La primera petición de cada vista, con la caché vacía: incluye resolver el
+# alcance del usuario y generar lo que después se sirve desde la caché
+PRESUPUESTOS_EN_FRIO = {
+    'home': (3, 150),
+    'dashboard': (9, 300),
+    'plan_anual_list': (6, 300),
+    'plan_anual_detail': (7, 300),
+    'plan_actividades_data': (8, 350),
+    'aprobaciones_pendientes': (4, 150),
+    'aprobaciones_pendientes_data': (6, 300),
+    'aprobar_actividad': (5, 300),
+    'calendario_actividades': (8, 250),
+    'buscar_actividades': (8, 250),
+    'buscar_actividades_data': (6, 150),
+    'generar_reporte_excel': (7, 2000),
+    'generar_reporte_pdf': (7, 3000),
+    'generar_reporte_csv': (7, 2000),
+    'users:user_list': (4, 150),
+    'users:user_list_data': (6, 300),
+    'users:organization_structure': (5, 300),
+    'users:staff_directory': (5, 250),
+}
+
+
+def escenarios(organizacion, admin):
+    """
+    (vista, usuario, url, parámetros GET) de cada vista medida sobre una
+    organización de sinteticos.generar(); también los usan las pruebas de
+    consultas por vista.
+    """
+    director_general = organizacion.directores[organizacion.central.pk]
+    nivel = organizacion.niveles[0]
+    director = organizacion.directores[nivel.pk]
+    plan = organizacion.planes[0]
+    aprobacion = Aprobacion.objects.filter(aprobador=director, estado='P', actividad__plan=plan).first()
+
+    vistas = [
+        ('home', admin, reverse('home'), {}),
+        ('dashboard', director_general, reverse('dashboard'), {}),
+        ('plan_anual_list', director_general, reverse('plan_anual_list'), {}),
+        ('plan_anual_detail', director, reverse('plan_anual_detail', args=[plan.pk]), {}),
+        ('plan_actividades_data', director, reverse('plan_actividades_data', args=[plan.pk]),
+         PARAMETROS_DATATABLES),
+        ('aprobaciones_pendientes', director, reverse('aprobaciones_pendientes'), {}),
+        ('aprobaciones_pendientes_data', director, reverse('aprobaciones_pendientes_data'),
+         {**PARAMETROS_DATATABLES, 'columns[0][data]': 'actividad'}),
+        ('calendario_actividades', director, reverse('calendario_actividades'),
+         {'desde': f"{plan.year}-03-01", 'hasta': f"{plan.year}-03-31", 'nivel': nivel.pk}),
+        ('buscar_actividades', director_general, reverse('buscar_actividades'), {'q': 'revisar'}),
+        ('buscar_actividades_data', director_general, reverse('buscar_actividades_data'),
+         {'q': 'revisar', 'year': plan.year}),
+        ('generar_reporte_excel', director, reverse('generar_reporte_excel', args=[plan.pk]), {}),
+        ('generar_reporte_pdf', director, reverse('generar_reporte_pdf', args=[plan.pk]), {}),
+        ('generar_reporte_csv', director, reverse('generar_reporte_csv', args=[plan.pk]), {}),
+        ('users:user_list', admin, reverse('users:user_list'), {}),
+        ('users:user_list_data', admin, reverse('users:user_list_data'), PARAMETROS_DATATABLES),
+        ('users:organization_structure', admin, reverse('users:organization_structure'), {}),
+        ('users:staff_directory', director, reverse('users:staff_directory'), {'q': 'ana'}),
+    ]
+    if aprobacion:
+        vistas.append(
+            ('aprobar_actividad', director, reverse('aprobar_actividad', args=[aprobacion.pk]), {})
+        )
+    return vistas
+
+
+async def _agotar(contenido):
+    async for _parte in contenido:
+        pass
+
+
+class Command(BaseCommand):
+    help = ('Mide latencia y número de consultas de cada vista sobre organizaciones sintéticas '
+            'de distintos tamaños y falla si se excede algún presupuesto. '
+            'Los datos generados se revierten al terminar.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanos', default='10,100,500',
+                            help='Actividades por plan en cada pasada, separadas por comas')
+        parser.add_argument('--arcs', type=int, default=3)
+        parser.add_argument('--uebs', type=int, default=10)
+        parser.add_argument('--especialistas', type=int, default=10)
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--factor-latencia', type=float, default=1.0,
+                            help='Multiplica los presupuestos de tiempo (p. ej. en equipos lentos)')
+        parser.add_argument('--sin-presupuesto', action='store_true',
+                            help='Solo informa, sin fallar por presupuestos excedidos')
+
+    def handle(self, *args, **options):
+        try:
+            tamanos = [int(valor) for valor in options['tamanos'].split(',')]
+        except ValueError:
+            raise CommandError('--tamanos debe ser una lista de enteros separados por comas')
+
+        excedidos = []
+        # Los datos sembrados no se confirman, así que una réplica no los vería
+        with tempfile.TemporaryDirectory() as reportes, override_settings(
+            REPORTES_ROOT=reportes, ALLOWED_HOSTS=['localhost'], REPLICA_ALIAS=None
+        ):
+            for tamano in tamanos:
+                excedidos += self._medir_tamano(tamano, options)
+
+        if excedidos and not options['sin_presupuesto']:
+            raise CommandError('Presupuestos excedidos:\n' + '\n'.join(excedidos))
+        self.stdout.write(self.style.SUCCESS('Todas las vistas dentro del presupuesto')
+                          if not excedidos else self.style.WARNING(f"{len(excedidos)} presupuestos excedidos"))
+
+    def _medir_tamano(self, tamano, options):
+        excedidos = []
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{tamano} actividades por plan"))
+        try:
+            with transaction.atomic():
+                for vista, frio, caliente in self._pasada(tamano, options):
+                    self.stdout.write(
+                        f"  {vista:<32} {caliente[0]:9.1f} ms {caliente[1]:6d} consultas"
+                        f"   en frío {frio[0]:9.1f} ms {frio[1]:6d} consultas"
+                    )
+                    excedidos += self._comparar(vista, tamano, *caliente, PRESUPUESTOS.get(vista), options)
+                    excedidos += self._comparar(
+                        f"{vista} en frío", tamano, *frio, PRESUPUESTOS_EN_FRIO.get(vista), options
+                    )
+                transaction.set_rollback(True)
+        finally:
+            # Las cachés compartidas pueden conservar ids de filas revertidas
+            invalidate_approvers()
+            invalidate_scopes()
+        return excedidos
+
+    def _pasada(self, tamano, options):
+        organizacion = sinteticos.generar(
+            arcs=options['arcs'],
+            uebs=options['uebs'],
+            especialistas=options['especialistas'],
+            actividades=tamano,
+            prefijo=f"bench{tamano}",
+        )
+        admin = User.objects.create(username=f"bench{tamano}_admin", is_superuser=True, is_staff=True)
+        clientes = {}
+        for vista, usuario, url, parametros in escenarios(organizacion, admin):
+            if usuario.pk not in clientes:
+                clientes[usuario.pk] = Client(HTTP_HOST='localhost')
+                clientes[usuario.pk].force_login(usuario)
+            yield (vista, *self._medir(clientes[usuario.pk], url, parametros, options['repeticiones']))
+
+    def _medir(self, cliente, url, parametros, repeticiones):
+        """
+        ((milisegundos, consultas) de la primera petición con la caché vacía,
+        (mediana en milisegundos, consultas de la última repetición) de las
+        siguientes). La primera recorre los caminos que las demás sirven desde
+        la caché: fragmentos, respuestas de DataTables, aprobadores y alcances.
+        """
+        cache.clear()
+        tiempos = []
+        for repeticion in range(repeticiones + 1):
+            with registrar_consultas() as registro:
+                inicio = time.perf_counter()
+                respuesta = cliente.get(url, parametros)
+                if respuesta.streaming and respuesta.is_async:
+                    async_to_sync(_agotar)(respuesta.streaming_content)
+                elif respuesta.streaming:
+                    # El cliente de pruebas cierra la respuesta al agotar el iterador
+                    b''.join(respuesta.streaming_content)
+                transcurrido = time.perf_counter() - inicio
+            if respuesta.status_code != 200:
+                raise CommandError(f"{url} respondió {respuesta.status_code}")
+            if repeticion:
+                tiempos.append(transcurrido * 1000)
+            else:
+                frio = (transcurrido * 1000, registro.total)
+        return frio, (statistics.median(tiempos), registro.total)
+
+    def _comparar(self, vista, tamano, milisegundos, consultas, presupuesto, options):
+        if presupuesto is None:
+            return []
+        maximo_consultas, maximo_ms = presupuesto
+        maximo_ms *= options['factor_latencia']
+        excedidos = []
+        if consultas > maximo_consultas:
+            excedidos.append(f"{vista} ({tamano}): {consultas} consultas > {maximo_consultas}")
+        if milisegundos > maximo_ms:
+            excedidos.append(f"{vista} ({tamano}): {milisegundos:.1f} ms > {maximo_ms:.0f} ms")
+        return excedidos
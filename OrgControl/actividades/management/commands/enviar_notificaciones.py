@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from actividades.notificaciones import MAX_INTENTOS, calcular_espera, despachar_lote
+
+
+class Command(BaseCommand):
+    help = 'Envía por lotes los correos pendientes de la bandeja de salida de notificaciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50,
+                            help='Cantidad máxima de correos por lote')
+        parser.add_argument('--max-intentos', type=int, default=MAX_INTENTOS,
+                            help='Intentos antes de marcar un correo como fallido')
+        parser.add_argument('--continuo', action='store_true',
+                            help='Seguir vaciando la cola indefinidamente')
+        parser.add_argument('--intervalo', type=float, default=5,
+                            help='Segundos de espera cuando la cola está vacía (modo continuo)')
+
+    def handle(self, *args, **options):
+        sin_conexion = 0
+        while True:
+            resultado = despachar_lote(options['lote'], options['max_intentos'])
+            if resultado['aplazadas']:
+                # Servidor de correo caído: esperar cada vez más antes de volver a intentar
+                sin_conexion += 1
+                espera = calcular_espera(sin_conexion)
+                self.stderr.write(
+                    f"Sin conexión con el servidor de correo; {resultado['aplazadas']} correos "
+                    f"aplazados. Nuevo intento en {espera} s"
+                )
+                if not options['continuo']:
+                    break
+                time.sleep(espera)
+                continue
+            sin_conexion = 0
+            procesadas = sum(resultado.values())
+            if procesadas:
+                self.stdout.write(
+                    f"Enviadas: {resultado['enviadas']}  "
+                    f"Reintentos: {resultado['reintentos']}  "
+                    f"Fallidas: {resultado['fallidas']}"
+                )
+            if procesadas == options['lote']:
+                continue
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
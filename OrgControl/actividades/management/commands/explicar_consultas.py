@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import NotSupportedError, connections
+
+from OrgControl import consultas_calientes
+
+# Filas a partir de las cuales recorrer completa una tabla es un fallo
+UMBRAL = 1000
+
+
+class Command(BaseCommand):
+    help = ('Obtiene el plan de ejecución de cada consulta frecuente registrada (EXPLAIN en '
+            'PostgreSQL, EXPLAIN QUERY PLAN en SQLite) y falla si alguna recorre completa una '
+            'tabla con más filas que el umbral')
+
+    def add_arguments(self, parser):
+        parser.add_argument('consultas', nargs='*',
+                            help='Nombres de las consultas a revisar; por defecto todas')
+        parser.add_argument('--umbral', type=int, default=UMBRAL,
+                            help='Filas a partir de las cuales un recorrido completo es un fallo')
+        parser.add_argument('--analizar', action='store_true',
+                            help='Ejecutar ANALYZE antes, para que el planificador tenga estadísticas')
+        parser.add_argument('--planes', action='store_true',
+                            help='Mostrar el plan de todas las consultas, no solo el de las que fallan')
+
+    def handle(self, *args, **options):
+        consultas = consultas_calientes.registradas()
+        if options['consultas']:
+            desconocidas = set(options['consultas']) - {consulta.nombre for consulta in consultas}
+            if desconocidas:
+                raise CommandError(f"Consultas no registradas: {', '.join(sorted(desconocidas))}")
+            consultas = [consulta for consulta in consultas if consulta.nombre in options['consultas']]
+
+        if options['analizar']:
+            for conexion in connections.all():
+                with conexion.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+        fallos = []
+        filas = {}
+        for consulta in consultas:
+            queryset = consulta.queryset()
+            if queryset is None:
+                self.stdout.write(f"{consulta.nombre:<32} {self.style.WARNING('sin datos de muestra')}")
+                continue
+            try:
+                plan = consultas_calientes.explicar(queryset)
+            except NotSupportedError as error:
+                raise CommandError(str(error))
+
+            grandes = []
+            for tabla in plan.recorridas:
+                if (plan.using, tabla) not in filas:
+                    filas[plan.using, tabla] = consultas_calientes.filas(tabla, plan.using)
+                if filas[plan.using, tabla] > options['umbral']:
+                    grandes.append(f"{tabla} ({filas[plan.using, tabla]} filas)")
+
+            if grandes:
+                fallos.append(consulta.nombre)
+                estado = self.style.ERROR(f"recorre {', '.join(grandes)}")
+            elif plan.recorridas:
+                estado = self.style.SUCCESS(f"ok (recorre tablas pequeñas: {', '.join(plan.recorridas)})")
+            else:
+                estado = self.style.SUCCESS('ok')
+            self.stdout.write(f"{consulta.nombre:<32} {estado}")
+            if grandes or options['planes']:
+                self.stdout.write(f"    {consulta.descripcion}")
+                for linea in plan.lineas:
+                    self.stdout.write(f"    {linea}")
+
+        if fallos:
+            raise CommandError(f"Consultas con recorridos completos: {', '.join(fallos)}")
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from actividades import sinteticos
+
+
+class Command(BaseCommand):
+    help = ('Crea una organización sintética (niveles, usuarios, flujos, planes, actividades '
+            'y aprobaciones) para pruebas de carga')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--arcs', type=int, default=5)
+        parser.add_argument('--uebs', type=int, default=20)
+        parser.add_argument('--especialistas', type=int, default=10, help='Especialistas por nivel')
+        parser.add_argument('--actividades', type=int, default=100, help='Actividades por plan')
+        parser.add_argument('--year', type=int, default=None, help='Año de los planes (por defecto, el actual)')
+        parser.add_argument('--aprobadas', type=float, default=0.3,
+                            help='Fracción de actividades ya aprobadas por el director del nivel')
+        parser.add_argument('--prefijo', default='sint', help='Prefijo de usuarios y niveles creados')
+        parser.add_argument('--semilla', type=int, default=1)
+
+    def handle(self, *args, **options):
+        organizacion = sinteticos.generar(
+            arcs=options['arcs'],
+            uebs=options['uebs'],
+            especialistas=options['especialistas'],
+            actividades=options['actividades'],
+            year=options['year'],
+            proporcion_aprobada=options['aprobadas'],
+            prefijo=options['prefijo'],
+            semilla=options['semilla'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(organizacion.niveles) + 1} niveles, {len(organizacion.usuarios)} usuarios, "
+            f"{len(organizacion.planes)} planes, {organizacion.actividades} actividades, "
+            f"{organizacion.aprobaciones} aprobaciones ({organizacion.decididas} ya decididas)"
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from actividades.importacion import TAMANO_LOTE, importar_archivo
+from actividades.models import PlanAnual
+
+
+class Command(BaseCommand):
+    help = 'Importa actividades a un plan anual desde un archivo CSV o XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan_id', type=int)
+        parser.add_argument('archivo')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE,
+                            help='Actividades insertadas por lote')
+
+    def handle(self, *args, **options):
+        try:
+            plan = PlanAnual.objects.select_related('organization_level').get(pk=options['plan_id'])
+        except PlanAnual.DoesNotExist:
+            raise CommandError(f"No existe el plan {options['plan_id']}")
+
+        def progreso(hechas, total):
+            self.stdout.write(f"  {hechas}/{total} actividades insertadas")
+
+        with open(options['archivo'], 'rb') as archivo:
+            resultado = importar_archivo(plan, archivo, options['archivo'], options['lote'], progreso)
+
+        if not resultado.correcto:
+            for fila, mensaje in resultado.errores:
+                self.stderr.write(f"Fila {fila}: {mensaje}" if fila else mensaje)
+            raise CommandError(f"Importación cancelada: {len(resultado.errores)} filas con errores")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Importadas {resultado.actividades} actividades y {resultado.aprobaciones} aprobaciones en {plan}"
+        ))
@@ -0,0 +1,108 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+User = get_user_model()
+
+RUTAS = ['/panel/', '/planes/']
+
+
+class Command(BaseCommand):
+    help = ('Prueba de carga contra uno o más servidores en marcha: lanza peticiones concurrentes '
+            'y muestra peticiones por segundo y percentiles de latencia de cada uno. Sirve para '
+            'comparar el mismo proyecto bajo WSGI (p. ej. gunicorn OrgControl.wsgi) y bajo ASGI '
+            '(p. ej. uvicorn OrgControl.asgi:application) con la misma base de datos.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', dest='urls', required=True,
+                            help='Servidor a probar (http://host:puerto); se puede repetir para comparar')
+        parser.add_argument('--rutas', nargs='+', default=RUTAS,
+                            help='Rutas que se piden por turnos')
+        parser.add_argument('--concurrencia', type=int, default=20,
+                            help='Peticiones simultáneas')
+        parser.add_argument('--peticiones', type=int, default=500,
+                            help='Peticiones totales por servidor')
+        parser.add_argument('--usuario',
+                            help='Usuario con el que se inicia sesión; sin él las vistas redirigen al login')
+
+    def handle(self, *args, **options):
+        if options['concurrencia'] < 1 or options['peticiones'] < 1:
+            raise CommandError('La concurrencia y el número de peticiones deben ser positivos')
+        cookie = self._cookie_sesion(options['usuario']) if options['usuario'] else None
+
+        for url in options['urls']:
+            partes = urlsplit(url)
+            if partes.scheme != 'http' or not partes.hostname:
+                raise CommandError(f"URL no válida (solo http://host:puerto): {url}")
+            resultado = asyncio.run(self._cargar(
+                partes.hostname, partes.port or 80, options['rutas'], cookie,
+                options['concurrencia'], options['peticiones']
+            ))
+            self._informar(url, resultado)
+
+    def _cookie_sesion(self, username):
+        try:
+            usuario = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"No existe el usuario {username}")
+        # Crea la sesión en el backend configurado, el mismo que leen los servidores
+        cliente = Client()
+        cliente.force_login(usuario)
+        return f"{settings.SESSION_COOKIE_NAME}={cliente.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+    async def _cargar(self, host, puerto, rutas, cookie, concurrencia, total):
+        pendientes = iter(range(total))
+        latencias = []
+        errores = {}
+
+        async def trabajador():
+            for numero in pendientes:
+                ruta = rutas[numero % len(rutas)]
+                inicio = time.perf_counter()
+                try:
+                    estado = await _pedir(host, puerto, ruta, cookie)
+                except OSError as error:
+                    estado = type(error).__name__
+                if estado == 200:
+                    latencias.append((time.perf_counter() - inicio) * 1000)
+                else:
+                    errores[estado] = errores.get(estado, 0) + 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+        return latencias, errores, time.perf_counter() - inicio
+
+    def _informar(self, url, resultado):
+        latencias, errores, duracion = resultado
+        self.stdout.write(self.style.MIGRATE_HEADING(url))
+        self.stdout.write(f"  {len(latencias) / duracion:8.1f} peticiones/s en {duracion:.1f} s")
+        if len(latencias) > 1:
+            cuantiles = statistics.quantiles(latencias, n=100)
+            self.stdout.write(f"  p50 {cuantiles[49]:8.1f} ms   p95 {cuantiles[94]:8.1f} ms")
+        if errores:
+            detalle = ', '.join(f"{estado}: {cantidad}" for estado, cantidad in sorted(errores.items(), key=str))
+            self.stdout.write(self.style.WARNING(f"  respuestas distintas de 200: {detalle}"))
+
+
+async def _pedir(host, puerto, ruta, cookie):
+    """Petición HTTP/1.1 con una conexión nueva; devuelve el código de estado tras leer toda la respuesta"""
+    lector, escritor = await asyncio.open_connection(host, puerto)
+    try:
+        cabeceras = [f"GET {ruta} HTTP/1.1", f"Host: {host}:{puerto}", 'Connection: close']
+        if cookie:
+            cabeceras.append(f"Cookie: {cookie}")
+        escritor.write(('\r\n'.join(cabeceras) + '\r\n\r\n').encode('latin-1'))
+        await escritor.drain()
+        linea_estado = await lector.readline()
+        # Connection: close, así que el cuerpo termina cuando el servidor cierra
+        while await lector.read(65536):
+            pass
+    finally:
+        escritor.close()
+    return int(linea_estado.split()[1]) if linea_estado else 'sin respuesta'
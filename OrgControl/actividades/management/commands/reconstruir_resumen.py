@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from actividades import resumen
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero la tabla de resumen de actividades del dashboard'
+
+    def handle(self, *args, **options):
+        diferencias = resumen.reconstruir()
+        if diferencias:
+            self.stdout.write(self.style.WARNING(f"Se corrigieron {diferencias} totales desviados"))
+        else:
+            self.stdout.write(self.style.SUCCESS('El resumen ya estaba al día'))
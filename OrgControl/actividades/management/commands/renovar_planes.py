@@ -0,0 +1,64 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from actividades.models import PlanAnual
+from actividades.renovacion import TAMANO_LOTE, renovar
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Copia planes anuales al año siguiente (o a --destino) con sus actividades: fechas '
+            'desplazadas, estado Pendiente, avance 0 y flujo de aprobación nuevo')
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan_ids', nargs='*', type=int,
+                            help='Planes a renovar; sin ids se usan todos los de --origen')
+        parser.add_argument('--origen', type=int,
+                            help='Año cuyos planes se renuevan (todos los niveles)')
+        parser.add_argument('--destino', type=int,
+                            help='Año de los planes nuevos; por defecto el siguiente al de cada plan')
+        parser.add_argument('--usuario', required=True,
+                            help='Usuario que figura como creador de los planes nuevos')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE,
+                            help='Actividades insertadas por lote')
+        parser.add_argument('--simular', action='store_true',
+                            help='Hace la renovación y la revierte, para ver qué se copiaría')
+
+    def handle(self, *args, **options):
+        if not options['plan_ids'] and options['origen'] is None:
+            raise CommandError('Indique los ids de los planes o --origen')
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f"No existe el usuario {options['usuario']}")
+
+        planes = PlanAnual.objects.select_related('organization_level').order_by('pk')
+        if options['plan_ids']:
+            planes = planes.filter(pk__in=options['plan_ids'])
+            faltantes = set(options['plan_ids']) - set(planes.values_list('pk', flat=True))
+            if faltantes:
+                raise CommandError(f"No existen los planes {', '.join(map(str, sorted(faltantes)))}")
+        if options['origen'] is not None:
+            planes = planes.filter(year=options['origen'])
+
+        def progreso(plan, actividades):
+            self.stdout.write(f"  {plan}: {actividades} actividades")
+
+        with transaction.atomic():
+            resultado = renovar(planes, usuario, options['destino'], options['lote'], progreso)
+            if options['simular']:
+                transaction.set_rollback(True)
+
+        for plan, motivo in resultado.omitidos:
+            self.stderr.write(f"Omitido {plan}: {motivo}")
+        if resultado.actividades_omitidas:
+            self.stderr.write(self.style.WARNING(
+                f"{resultado.actividades_omitidas} actividades sin copiar: su responsable está "
+                f"inactivo o ya no pertenece al nivel del plan"
+            ))
+        mensaje = (f"Renovados {len(resultado.planes)} planes con {resultado.actividades} actividades "
+                   f"y {resultado.aprobaciones} aprobaciones")
+        self.stdout.write(self.style.SUCCESS(f"{mensaje} (simulación, no se guardó nada)"
+                                             if options['simular'] else mensaje))
@@ -0,0 +1,99 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:24
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('users', '0003_organizationlevel_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActividadPlanAnual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=200, verbose_name='Nombre de la actividad')),
+                ('descripcion', models.TextField(blank=True, verbose_name='Descripción detallada')),
+                ('fecha_inicio', models.DateField(verbose_name='Fecha de inicio')),
+                ('fecha_fin', models.DateField(verbose_name='Fecha de finalización')),
+                ('estado', models.CharField(choices=[('P', 'Pendiente'), ('E', 'En progreso'), ('C', 'Completado'), ('A', 'Aprobado'), ('R', 'Rechazado')], default='P', max_length=1, verbose_name='Estado')),
+                ('avance', models.PositiveIntegerField(default=0, validators=[django.core.validators.MaxLengthValidator(100)], verbose_name='Porcentaje de avance')),
+                ('responsable', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='actividades_asignadas', to=settings.AUTH_USER_MODEL, verbose_name='Responsable')),
+            ],
+            options={
+                'verbose_name': 'Actividad del Plan Anual',
+                'verbose_name_plural': 'Actividades del Plan Anual',
+                'ordering': ['fecha_inicio'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Aprobacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('P', 'Pendiente'), ('A', 'Aprobado'), ('R', 'Rechazado')], default='P', max_length=1)),
+                ('fecha_aprobacion', models.DateTimeField(blank=True, null=True)),
+                ('comentarios', models.TextField(blank=True)),
+                ('orden', models.PositiveIntegerField()),
+                ('actividad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aprobaciones', to='actividades.actividadplananual')),
+                ('aprobador', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='aprobaciones_pendientes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['orden'],
+                'unique_together': {('actividad', 'aprobador')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PlanAnual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(choices=[(2023, '2023'), (2024, '2024'), (2025, '2025'), (2026, '2026'), (2027, '2027'), (2028, '2028'), (2029, '2029'), (2030, '2030')], unique=True, verbose_name='Año')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('approved', models.BooleanField(default=False, verbose_name='Aprobado')),
+                ('approved_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='planes_aprobados', to=settings.AUTH_USER_MODEL, verbose_name='Aprobado por')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='planes_creados', to=settings.AUTH_USER_MODEL, verbose_name='Creado por')),
+                ('organization_level', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='users.organizationlevel', verbose_name='Nivel organizacional')),
+            ],
+            options={
+                'verbose_name': 'Plan Anual',
+                'verbose_name_plural': 'Planes Anuales',
+                'ordering': ['-year'],
+            },
+        ),
+        migrations.AddField(
+            model_name='actividadplananual',
+            name='plan',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actividades', to='actividades.plananual', verbose_name='Plan Anual'),
+        ),
+        migrations.CreateModel(
+            name='NotificacionCorreo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('P', 'Pendiente'), ('E', 'Enviado'), ('F', 'Fallido')], default='P', max_length=1, verbose_name='Estado')),
+                ('intentos', models.PositiveIntegerField(default=0, verbose_name='Intentos')),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próximo intento')),
+                ('ultimo_error', models.TextField(blank=True, verbose_name='Último error')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('fecha_envio', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de envío')),
+                ('aprobacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificaciones', to='actividades.aprobacion')),
+            ],
+            options={
+                'verbose_name': 'Notificación por correo',
+                'verbose_name_plural': 'Notificaciones por correo',
+                'ordering': ['proximo_intento'],
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='notificacion_pendiente_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='plananual',
+            constraint=models.UniqueConstraint(fields=('year', 'organization_level'), name='unique_plan_anual'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actividades', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plananual',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Se incrementa con cada cambio del plan o de sus actividades', verbose_name='Revisión'),
+        ),
+    ]
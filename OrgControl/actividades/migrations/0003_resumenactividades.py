@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actividades', '0002_plananual_revision'),
+        ('users', '0003_organizationlevel_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenActividades',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(verbose_name='Año')),
+                ('estado', models.CharField(choices=[('P', 'Pendiente'), ('E', 'En progreso'), ('C', 'Completado'), ('A', 'Aprobado'), ('R', 'Rechazado')], max_length=1, verbose_name='Estado')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Actividades')),
+                ('suma_avance', models.PositiveBigIntegerField(default=0, verbose_name='Suma de avance')),
+                ('organization_level', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumen_actividades', to='users.organizationlevel', verbose_name='Nivel organizacional')),
+            ],
+            options={
+                'verbose_name': 'Resumen de actividades',
+                'verbose_name_plural': 'Resúmenes de actividades',
+                'constraints': [models.UniqueConstraint(fields=('organization_level', 'year', 'estado'), name='unique_resumen_actividades')],
+            },
+        ),
+    ]
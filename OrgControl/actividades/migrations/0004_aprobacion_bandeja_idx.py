@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actividades', '0003_resumenactividades'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aprobacion',
+            index=models.Index(fields=['aprobador', 'estado', 'orden'], name='aprobacion_bandeja_idx'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:36
+
+from django.conf import settings
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def calcular_estado_flujo(apps, schema_editor):
+    """Estado del flujo de las actividades existentes a partir de sus aprobaciones"""
+    ActividadPlanAnual = apps.get_model('actividades', 'ActividadPlanAnual')
+    Aprobacion = apps.get_model('actividades', 'Aprobacion')
+
+    por_actividad = defaultdict(list)
+    for actividad_id, orden, estado in Aprobacion.objects.values_list(
+        'actividad_id', 'orden', 'estado'
+    ).order_by('actividad_id', 'orden').iterator():
+        por_actividad[actividad_id].append((orden, estado))
+
+    cambios = []
+    for actividad in ActividadPlanAnual.objects.filter(pk__in=por_actividad).iterator():
+        filas = por_actividad[actividad.pk]
+        actividad.aprobaciones_aprobadas = sum(1 for _, estado in filas if estado == 'A')
+        actividad.aprobaciones_rechazadas = sum(1 for _, estado in filas if estado == 'R')
+        pendientes = [orden for orden, estado in filas if estado == 'P']
+        if actividad.aprobaciones_rechazadas or not pendientes:
+            actividad.orden_pendiente = None
+            actividad.faltan_en_paso = 0
+        else:
+            actividad.orden_pendiente = min(pendientes)
+            actividad.faltan_en_paso = pendientes.count(actividad.orden_pendiente)
+        cambios.append(actividad)
+
+    ActividadPlanAnual.objects.bulk_update(cambios, [
+        'aprobaciones_aprobadas', 'aprobaciones_rechazadas', 'orden_pendiente', 'faltan_en_paso'
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actividades', '0004_aprobacion_bandeja_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actividadplananual',
+            name='aprobaciones_aprobadas',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Aprobaciones concedidas'),
+        ),
+        migrations.AddField(
+            model_name='actividadplananual',
+            name='aprobaciones_rechazadas',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Aprobaciones rechazadas'),
+        ),
+        migrations.AddField(
+            model_name='actividadplananual',
+            name='faltan_en_paso',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Aprobaciones faltantes del paso'),
+        ),
+        migrations.AddField(
+            model_name='actividadplananual',
+            name='orden_pendiente',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Orden de las aprobaciones en turno; vacío si el flujo terminó', null=True, verbose_name='Paso pendiente'),
+        ),
+        migrations.AddIndex(
+            model_name='aprobacion',
+            index=models.Index(fields=['actividad', 'orden'], name='aprobacion_paso_idx'),
+        ),
+        migrations.RunPython(calcular_estado_flujo, migrations.RunPython.noop),
+    ]
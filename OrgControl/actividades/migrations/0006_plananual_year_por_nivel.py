@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actividades', '0005_flujo_aprobacion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='plananual',
+            name='year',
+            field=models.IntegerField(choices=[(2023, '2023'), (2024, '2024'), (2025, '2025'), (2026, '2026'), (2027, '2027'), (2028, '2028'), (2029, '2029'), (2030, '2030')], verbose_name='Año'),
+        ),
+    ]
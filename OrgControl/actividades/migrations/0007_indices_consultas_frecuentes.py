@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actividades', '0006_plananual_year_por_nivel'),
+        ('users', '0005_userprofile_image_renditions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Primero los índices nuevos, para no dejar consultas sin índice entre pasos
+        migrations.AddIndex(
+            model_name='actividadplananual',
+            index=models.Index(fields=['plan', 'estado'], name='actividad_plan_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actividadplananual',
+            index=models.Index(fields=['plan', 'fecha_inicio'], name='actividad_plan_inicio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='actividadplananual',
+            index=models.Index(condition=models.Q(('estado__in', ['P', 'E'])), fields=['responsable', 'fecha_fin'], name='actividad_abierta_vence_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aprobacion',
+            index=models.Index(condition=models.Q(('estado', 'P')), fields=['aprobador', 'orden'], name='aprobacion_pendiente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plananual',
+            index=models.Index(fields=['organization_level', '-year'], name='plan_nivel_year_idx'),
+        ),
+        migrations.AlterField(
+            model_name='actividadplananual',
+            name='plan',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='actividades', to='actividades.plananual', verbose_name='Plan Anual'),
+        ),
+        migrations.AlterField(
+            model_name='aprobacion',
+            name='actividad',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='aprobaciones', to='actividades.actividadplananual'),
+        ),
+        migrations.AlterField(
+            model_name='plananual',
+            name='organization_level',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='users.organizationlevel', verbose_name='Nivel organizacional'),
+        ),
+        migrations.RemoveIndex(
+            model_name='aprobacion',
+            name='aprobacion_bandeja_idx',
+        ),
+    ]
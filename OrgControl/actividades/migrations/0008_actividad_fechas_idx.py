@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actividades', '0007_indices_consultas_frecuentes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='actividadplananual',
+            index=models.Index(fields=['fecha_inicio', 'fecha_fin'], name='actividad_fechas_idx'),
+        ),
+    ]
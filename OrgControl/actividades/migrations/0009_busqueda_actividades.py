@@ -0,0 +1,103 @@
+from django.db import migrations
+
+# Ver actividades/busqueda.py
+
+SQLITE_FTS = [
+    """
+    CREATE VIRTUAL TABLE actividades_busqueda_fts USING fts5(
+        nombre, descripcion,
+        content='actividades_actividadplananual', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER actividades_busqueda_fts_ai AFTER INSERT ON actividades_actividadplananual BEGIN
+        INSERT INTO actividades_busqueda_fts(rowid, nombre, descripcion)
+        VALUES (new.id, new.nombre, new.descripcion);
+    END
+    """,
+    """
+    CREATE TRIGGER actividades_busqueda_fts_ad AFTER DELETE ON actividades_actividadplananual BEGIN
+        INSERT INTO actividades_busqueda_fts(actividades_busqueda_fts, rowid, nombre, descripcion)
+        VALUES ('delete', old.id, old.nombre, old.descripcion);
+    END
+    """,
+    """
+    CREATE TRIGGER actividades_busqueda_fts_au AFTER UPDATE OF nombre, descripcion
+    ON actividades_actividadplananual BEGIN
+        INSERT INTO actividades_busqueda_fts(actividades_busqueda_fts, rowid, nombre, descripcion)
+        VALUES ('delete', old.id, old.nombre, old.descripcion);
+        INSERT INTO actividades_busqueda_fts(rowid, nombre, descripcion)
+        VALUES (new.id, new.nombre, new.descripcion);
+    END
+    """,
+    "INSERT INTO actividades_busqueda_fts(actividades_busqueda_fts) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_DROP = [
+    'DROP TRIGGER IF EXISTS actividades_busqueda_fts_ai',
+    'DROP TRIGGER IF EXISTS actividades_busqueda_fts_ad',
+    'DROP TRIGGER IF EXISTS actividades_busqueda_fts_au',
+    'DROP TABLE IF EXISTS actividades_busqueda_fts',
+]
+
+POSTGRES_TSVECTOR = [
+    'ALTER TABLE actividades_actividadplananual ADD COLUMN search_vector tsvector',
+    """
+    CREATE FUNCTION actividades_busqueda_documento() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('spanish', coalesce(NEW.nombre, '')), 'A') ||
+            setweight(to_tsvector('spanish', coalesce(NEW.descripcion, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER actividades_busqueda_documento_trg
+    BEFORE INSERT OR UPDATE OF nombre, descripcion ON actividades_actividadplananual
+    FOR EACH ROW EXECUTE FUNCTION actividades_busqueda_documento()
+    """,
+    # Dispara el trigger en las filas existentes
+    'UPDATE actividades_actividadplananual SET nombre = nombre',
+    'CREATE INDEX actividad_busqueda_idx ON actividades_actividadplananual USING gin (search_vector)',
+]
+
+POSTGRES_TSVECTOR_DROP = [
+    'DROP INDEX IF EXISTS actividad_busqueda_idx',
+    'DROP TRIGGER IF EXISTS actividades_busqueda_documento_trg ON actividades_actividadplananual',
+    'DROP FUNCTION IF EXISTS actividades_busqueda_documento()',
+    'ALTER TABLE actividades_actividadplananual DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_FTS)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_TSVECTOR)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_FTS_DROP)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_TSVECTOR_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('actividades', '0008_actividad_fechas_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,22 +1,52 @@
-from datetime import timezone
 from django.core.validators import MaxLengthValidator
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from users.models import OrganizationLevel
-from django.core.mail import send_mail
+from users.cache import get_approver_ids
+from users.models import ApprovalFlow, OrganizationLevel
+from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 
 
-class PlanAnual(models.Model):
+class SeguimientoCambiosMixin:
+    """
+    Conserva los valores con que se cargaron los campos de CAMPOS_SEGUIDOS,
+    para que las señales puedan calcular diferencias sin volver a consultar.
+    """
+    CAMPOS_SEGUIDOS = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.guardar_originales()
+        return instance
+
+    def guardar_originales(self):
+        # Solo los campos cargados: leer uno diferido provocaría otra consulta
+        self._originales = {
+            campo: self.__dict__[campo] for campo in self.CAMPOS_SEGUIDOS if campo in self.__dict__
+        }
+
+    def valores_originales(self):
+        """Valores de CAMPOS_SEGUIDOS tal como están en la base de datos"""
+        originales = dict(getattr(self, '_originales', {}))
+        faltantes = [campo for campo in self.CAMPOS_SEGUIDOS if campo not in originales]
+        if faltantes and self.pk is not None:
+            fila = type(self)._base_manager.filter(pk=self.pk).values(*faltantes).first()
+            originales.update(fila or {})
+        return originales
+
+
+class PlanAnual(SeguimientoCambiosMixin, models.Model):
     """Modelo para los planes anuales de la organización"""
+    CAMPOS_SEGUIDOS = ('organization_level_id', 'year')
     YEAR_CHOICES = [(y, str(y)) for y in range(2023, 2031)]
 
     year = models.IntegerField(
         _('Año'),
-        choices=YEAR_CHOICES,
-        unique=True
+        choices=YEAR_CHOICES
     )
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -43,8 +73,15 @@ class PlanAnual(models.Model):
     organization_level = models.ForeignKey(
         OrganizationLevel,
         on_delete=models.PROTECT,
+        db_index=False,  # cubierto por plan_nivel_year_idx
         verbose_name=_('Nivel organizacional')
     )
+    revision = models.PositiveIntegerField(
+        _('Revisión'),
+        default=0,
+        editable=False,
+        help_text=_('Se incrementa con cada cambio del plan o de sus actividades')
+    )
 
     class Meta:
         verbose_name = _('Plan Anual')
@@ -56,13 +93,35 @@ class PlanAnual(models.Model):
                 name='unique_plan_anual'
             )
         ]
+        indexes = [
+            models.Index(fields=['organization_level', '-year'], name='plan_nivel_year_idx')
+        ]
+
+    def save(self, *args, **kwargs):
+        # Se incrementa en la base de datos para no pisar incrementos concurrentes
+        if not self._state.adding:
+            self.revision = models.F('revision') + 1
+        super().save(*args, **kwargs)
+        if hasattr(self.revision, 'resolve_expression'):
+            self.refresh_from_db(fields=['revision'])
+
+    @classmethod
+    def incrementar_revision(cls, *plan_ids):
+        cls.objects.filter(pk__in=plan_ids).update(revision=models.F('revision') + 1)
 
     def __str__(self):
         return f"Plan Anual {self.year} - {self.organization_level}"
 
 
-class ActividadPlanAnual(models.Model):
+# Estados en los que la actividad sigue en manos del responsable. A nivel de
+# módulo para que Meta.indexes use la misma tupla que las consultas
+ESTADOS_ABIERTOS = ('P', 'E')
+
+
+class ActividadPlanAnual(SeguimientoCambiosMixin, models.Model):
     """Actividades específicas dentro de un plan anual"""
+    CAMPOS_SEGUIDOS = ('plan_id', 'estado', 'avance')
+
     ESTADO_CHOICES = [
         ('P', _('Pendiente')),
         ('E', _('En progreso')),
@@ -70,10 +129,12 @@ class ActividadPlanAnual(models.Model):
         ('A', _('Aprobado')),
         ('R', _('Rechazado'))
     ]
+    ESTADOS_ABIERTOS = ESTADOS_ABIERTOS
 
     plan = models.ForeignKey(
         PlanAnual,
         on_delete=models.CASCADE,
+        db_index=False,  # cubierto por los índices compuestos que empiezan por plan
         related_name='actividades',
         verbose_name=_('Plan Anual')
     )
@@ -108,11 +169,47 @@ class ActividadPlanAnual(models.Model):
         default=0,
         validators=[MaxLengthValidator(100)]
     )
+    # Estado del flujo de aprobación, mantenido por actividades/flujo.py
+    aprobaciones_aprobadas = models.PositiveIntegerField(
+        _('Aprobaciones concedidas'),
+        default=0,
+        editable=False
+    )
+    aprobaciones_rechazadas = models.PositiveIntegerField(
+        _('Aprobaciones rechazadas'),
+        default=0,
+        editable=False
+    )
+    orden_pendiente = models.PositiveIntegerField(
+        _('Paso pendiente'),
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=_('Orden de las aprobaciones en turno; vacío si el flujo terminó')
+    )
+    faltan_en_paso = models.PositiveIntegerField(
+        _('Aprobaciones faltantes del paso'),
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = _('Actividad del Plan Anual')
         verbose_name_plural = _('Actividades del Plan Anual')
         ordering = ['fecha_inicio']
+        indexes = [
+            models.Index(fields=['plan', 'estado'], name='actividad_plan_estado_idx'),
+            models.Index(fields=['plan', 'fecha_inicio'], name='actividad_plan_inicio_idx'),
+            # Superposición con un rango (calendario): fecha_inicio <= hasta y fecha_fin >= desde
+            models.Index(fields=['fecha_inicio', 'fecha_fin'], name='actividad_fechas_idx'),
+            # Solo las abiertas: las completadas y decididas no vuelven a
+            # buscarse por vencimiento
+            models.Index(
+                fields=['responsable', 'fecha_fin'],
+                condition=models.Q(estado__in=ESTADOS_ABIERTOS),
+                name='actividad_abierta_vence_idx'
+            )
+        ]
 
     def clean(self):
         # Validar que las fechas sean coherentes
@@ -120,66 +217,176 @@ class ActividadPlanAnual(models.Model):
             raise ValidationError(_('La fecha de inicio no puede ser posterior a la fecha de finalización'))
 
         # Validar que el responsable pertenezca al mismo nivel organizacional
-        if (self.responsable.profile.organizational_level !=
-                self.plan.organization_level):
+        if (self.responsable_id and self.plan_id and
+                self.responsable.organization_level_id != self.plan.organization_level_id):
             raise ValidationError(_('El responsable debe pertenecer al mismo nivel organizacional que el plan'))
 
+    def construir_aprobaciones(self, aprobadores=None):
+        """
+        Filas de Aprobacion (sin guardar) que corresponden a esta actividad.
+
+        `aprobadores` permite reutilizar la cadena ya resuelta cuando se
+        procesan muchas actividades del mismo plan.
+        """
+        if aprobadores is None:
+            aprobadores = get_approver_ids(
+                ApprovalFlow.Module.ANNUAL_PLAN,
+                self.plan.organization_level_id
+            )
+        return [
+            Aprobacion(actividad=self, aprobador_id=aprobador_id, orden=orden)
+            for orden, aprobador_id in enumerate(aprobadores, start=1)
+        ]
+
     def __str__(self):
         return f"{self.nombre} ({self.get_estado_display()})"
 
-    class Aprobacion(models.Model):
-        ESTADOS = (
-            ('P', 'Pendiente'),
-            ('A', 'Aprobado'),
-            ('R', 'Rechazado')
-        )
 
-        actividad = models.ForeignKey(
-            'ActividadPlanAnual',
-            on_delete=models.CASCADE,
-            related_name='aprobaciones'
-        )
-        aprobador = models.ForeignKey(
-            settings.AUTH_USER_MODEL,
-            on_delete=models.PROTECT,
-            related_name='aprobaciones_pendientes'
-        )
-        estado = models.CharField(
-            max_length=1,
-            choices=ESTADOS,
-            default='P'
-        )
-        fecha_aprobacion = models.DateTimeField(null=True, blank=True)
-        comentarios = models.TextField(blank=True)
-        orden = models.PositiveIntegerField()
-
-        class Meta:
-            ordering = ['orden']
-            unique_together = [['actividad', 'aprobador']]
-
-        def save(self, *args, **kwargs):
-            if self.estado in ['A', 'R'] and not self.fecha_aprobacion:
-                self.fecha_aprobacion = timezone.now()
-                self._enviar_notificacion()
+class Aprobacion(models.Model):
+    ESTADOS = (
+        ('P', 'Pendiente'),
+        ('A', 'Aprobado'),
+        ('R', 'Rechazado')
+    )
+
+    actividad = models.ForeignKey(
+        'ActividadPlanAnual',
+        on_delete=models.CASCADE,
+        db_index=False,  # cubierto por aprobacion_paso_idx
+        related_name='aprobaciones'
+    )
+    aprobador = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.PROTECT,
+        related_name='aprobaciones_pendientes'
+    )
+    estado = models.CharField(
+        max_length=1,
+        choices=ESTADOS,
+        default='P'
+    )
+    fecha_aprobacion = models.DateTimeField(null=True, blank=True)
+    comentarios = models.TextField(blank=True)
+    orden = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['orden']
+        unique_together = [['actividad', 'aprobador']]
+        indexes = [
+            # Solo las pendientes: las decididas se acumulan y la bandeja nunca las lee
+            models.Index(
+                fields=['aprobador', 'orden'],
+                condition=models.Q(estado='P'),
+                name='aprobacion_pendiente_idx'
+            ),
+            models.Index(fields=['actividad', 'orden'], name='aprobacion_paso_idx')
+        ]
+
+    def save(self, *args, **kwargs):
+        notificar = self.estado in ['A', 'R'] and not self.fecha_aprobacion
+        if notificar:
+            self.fecha_aprobacion = timezone.now()
+        # La notificación se encola en la misma transacción; el envío lo hace
+        # el comando enviar_notificaciones
+        with transaction.atomic():
             super().save(*args, **kwargs)
+            if notificar:
+                NotificacionCorreo.objects.create(aprobacion=self)
+
+    def __str__(self):
+        return f"Aprobación #{self.id} - {self.get_estado_display()}"
+
+
+class ResumenActividades(models.Model):
+    """
+    Totales de actividades por nivel organizacional, año y estado.
+
+    Se mantiene de forma incremental desde las señales de ActividadPlanAnual
+    (ver actividades/resumen.py) y alimenta el dashboard ejecutivo.
+    """
+    organization_level = models.ForeignKey(
+        OrganizationLevel,
+        on_delete=models.CASCADE,
+        related_name='resumen_actividades',
+        verbose_name=_('Nivel organizacional')
+    )
+    year = models.IntegerField(_('Año'))
+    estado = models.CharField(
+        _('Estado'),
+        max_length=1,
+        choices=ActividadPlanAnual.ESTADO_CHOICES
+    )
+    total = models.PositiveIntegerField(_('Actividades'), default=0)
+    suma_avance = models.PositiveBigIntegerField(_('Suma de avance'), default=0)
+
+    class Meta:
+        verbose_name = _('Resumen de actividades')
+        verbose_name_plural = _('Resúmenes de actividades')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['organization_level', 'year', 'estado'],
+                name='unique_resumen_actividades'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.organization_level_id}/{self.year}/{self.estado}: {self.total}"
 
-        def _enviar_notificacion(self):
-            context = {
-                'actividad': self.actividad,
-                'aprobador': self.aprobador,
-                'estado': self.get_estado_display(),
-                'comentarios': self.comentarios,
-                'dominio': settings.DOMAIN  # Asegúrate de definir DOMAIN en settings.py
-            }
 
-            send_mail(
-        subject=f"Actividad {self.get_estado_display()} - {self.actividad.nombre}",
-        message=render_to_string('emails/notificacion_aprobacion.txt', context),
-        html_message=render_to_string('emails/notificacion_aprobacion.html', context),
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[self.actividad.responsable.email],
-        fail_silently=True
+class NotificacionCorreo(models.Model):
+    """Bandeja de salida de correos de aprobación, despachada por lotes fuera de la petición"""
+    ESTADOS = (
+        ('P', _('Pendiente')),
+        ('E', _('Enviado')),
+        ('F', _('Fallido'))
     )
 
+    aprobacion = models.ForeignKey(
+        Aprobacion,
+        on_delete=models.CASCADE,
+        related_name='notificaciones'
+    )
+    estado = models.CharField(
+        _('Estado'),
+        max_length=1,
+        choices=ESTADOS,
+        default='P'
+    )
+    intentos = models.PositiveIntegerField(_('Intentos'), default=0)
+    proximo_intento = models.DateTimeField(_('Próximo intento'), default=timezone.now)
+    ultimo_error = models.TextField(_('Último error'), blank=True)
+    fecha_creacion = models.DateTimeField(_('Fecha de creación'), auto_now_add=True)
+    fecha_envio = models.DateTimeField(_('Fecha de envío'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('Notificación por correo')
+        verbose_name_plural = _('Notificaciones por correo')
+        ordering = ['proximo_intento']
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento'], name='notificacion_pendiente_idx')
+        ]
+
+    def construir_mensaje(self, connection=None):
+        aprobacion = self.aprobacion
+        actividad = aprobacion.actividad
+        context = {
+            'actividad': actividad,
+            'aprobador': aprobacion.aprobador,
+            'estado': aprobacion.get_estado_display(),
+            'comentarios': aprobacion.comentarios,
+            'dominio': settings.DOMAIN
+        }
+        mensaje = EmailMultiAlternatives(
+            subject=f"Actividad {aprobacion.get_estado_display()} - {actividad.nombre}",
+            body=render_to_string('emails/notificacion_aprobacion.txt', context),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[actividad.responsable.email],
+            connection=connection
+        )
+        mensaje.attach_alternative(
+            render_to_string('emails/notificacion_aprobacion.html', context), 'text/html'
+        )
+        return mensaje
+
     def __str__(self):
-        return f"Aprobación #{self.id} - {self.get_estado_display()}"
\ No newline at end of file
+        return f"Notificación #{self.id} - {self.get_estado_display()}"
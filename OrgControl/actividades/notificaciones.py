@@ -0,0 +1,97 @@
+"""
+Despacho de la bandeja de salida de correos (NotificacionCorreo).
+
+Cada lote se reclama con select_for_update(skip_locked=True), de modo que
+varios procesos pueden vaciar la cola a la vez sin enviar dos veces el mismo
+correo. Todos los mensajes de un lote salen por una única conexión SMTP.
+
+Si no se puede abrir la conexión, el lote se aplaza sin consumir intentos:
+la caída del servidor no es culpa de los correos y no debe llevarlos a
+Fallido.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import NotificacionCorreo
+
+logger = logging.getLogger(__name__)
+
+MAX_INTENTOS = getattr(settings, 'NOTIFICACIONES_MAX_INTENTOS', 5)
+BACKOFF_BASE = getattr(settings, 'NOTIFICACIONES_BACKOFF_BASE', 60)
+BACKOFF_MAXIMO = getattr(settings, 'NOTIFICACIONES_BACKOFF_MAXIMO', 60 * 60)
+
+
+def calcular_espera(intentos):
+    """Segundos hasta el siguiente reintento (backoff exponencial con tope)"""
+    return min(BACKOFF_BASE * 2 ** (intentos - 1), BACKOFF_MAXIMO)
+
+
+def despachar_lote(lote=50, max_intentos=MAX_INTENTOS, connection=None):
+    """
+    Envía hasta `lote` notificaciones vencidas.
+
+    Devuelve un diccionario con cuántas se enviaron, cuántas quedaron para
+    reintento, cuántas pasaron a Fallido (dead letter) y cuántas se aplazaron
+    porque no se pudo conectar con el servidor.
+    """
+    resultado = {'enviadas': 0, 'reintentos': 0, 'fallidas': 0, 'aplazadas': 0}
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        pendientes = list(
+            NotificacionCorreo.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('aprobacion__aprobador', 'aprobacion__actividad__responsable')
+            .filter(estado='P', proximo_intento__lte=ahora)
+            .order_by('proximo_intento')[:lote]
+        )
+        if not pendientes:
+            return resultado
+
+        connection = connection or get_connection()
+        try:
+            connection.open()
+        except OSError as exc:
+            # Incluye smtplib.SMTPException y los errores de red
+            logger.warning("No se pudo conectar con el servidor de correo: %s", exc)
+            for notificacion in pendientes:
+                notificacion.ultimo_error = f"{exc.__class__.__name__}: {exc}"
+                notificacion.proximo_intento = ahora + timedelta(seconds=BACKOFF_BASE)
+            NotificacionCorreo.objects.bulk_update(pendientes, ['proximo_intento', 'ultimo_error'])
+            resultado['aplazadas'] = len(pendientes)
+            return resultado
+
+        try:
+            for notificacion in pendientes:
+                try:
+                    connection.send_messages([notificacion.construir_mensaje(connection)])
+                except Exception as exc:
+                    notificacion.intentos += 1
+                    notificacion.ultimo_error = f"{exc.__class__.__name__}: {exc}"
+                    if notificacion.intentos >= max_intentos:
+                        notificacion.estado = 'F'
+                        resultado['fallidas'] += 1
+                    else:
+                        notificacion.proximo_intento = ahora + timedelta(
+                            seconds=calcular_espera(notificacion.intentos)
+                        )
+                        resultado['reintentos'] += 1
+                else:
+                    notificacion.estado = 'E'
+                    notificacion.intentos += 1
+                    notificacion.fecha_envio = timezone.now()
+                    notificacion.ultimo_error = ''
+                    resultado['enviadas'] += 1
+        finally:
+            connection.close()
+
+        NotificacionCorreo.objects.bulk_update(
+            pendientes,
+            ['estado', 'intentos', 'proximo_intento', 'ultimo_error', 'fecha_envio']
+        )
+
+    return resultado
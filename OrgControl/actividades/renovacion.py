@@ -0,0 +1,140 @@
+"""
+Renovación anual: copia planes a otro año junto con sus actividades.
+
+Las actividades se copian con las fechas desplazadas al año destino (el 29
+de febrero pasa al 28 si el año destino no es bisiesto), en estado Pendiente
+y sin avance, con las mismas aprobaciones y el mismo estado inicial del flujo
+que generaría la señal configurar_flujo_aprobacion. Todo se inserta con
+bulk_create por lotes dentro de una sola transacción: si algo falla no se
+renueva ningún plan.
+
+Se omiten los planes cuyo nivel ya tiene plan en el año destino (restricción
+unique_plan_anual) o cuyo año destino no está en PlanAnual.YEAR_CHOICES, y
+las actividades cuyo responsable está inactivo o ya no pertenece al nivel
+del plan, la misma regla que ActividadPlanAnual.clean().
+"""
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from users.models import ApprovalFlow
+from . import eventos, flujo, resumen
+from .models import PlanAnual, ActividadPlanAnual, Aprobacion
+
+User = get_user_model()
+
+TAMANO_LOTE = 500
+
+
+class ResultadoRenovacion:
+    def __init__(self):
+        # [(plan de origen, plan nuevo)]
+        self.planes = []
+        # [(plan de origen, motivo)]
+        self.omitidos = []
+        self.actividades = 0
+        self.aprobaciones = 0
+        # Actividades no copiadas por su responsable
+        self.actividades_omitidas = 0
+
+
+def desplazar(fecha, anios):
+    """`fecha` movida `anios` años; el 29 de febrero pasa al 28 en años no bisiestos"""
+    try:
+        return fecha.replace(year=fecha.year + anios)
+    except ValueError:
+        return fecha.replace(year=fecha.year + anios, day=28)
+
+
+def renovar(planes, usuario, year=None, tamano_lote=TAMANO_LOTE, progreso=None):
+    """
+    Copia cada plan de `planes` a `year` o, si no se indica, al año
+    siguiente al suyo. Los planes nuevos quedan a nombre de `usuario` y sin
+    aprobar. `progreso(plan_nuevo, actividades)` se invoca al terminar cada
+    plan.
+    """
+    resultado = ResultadoRenovacion()
+    anios_validos = {anio for anio, _etiqueta in PlanAnual.YEAR_CHOICES}
+    planes = list(planes)
+
+    with transaction.atomic():
+        destinos = {plan.pk: year or plan.year + 1 for plan in planes}
+        ocupados = set(PlanAnual.objects.filter(
+            organization_level_id__in={plan.organization_level_id for plan in planes},
+            year__in=set(destinos.values())
+        ).values_list('organization_level_id', 'year'))
+
+        copias = []
+        for plan in planes:
+            destino = destinos[plan.pk]
+            if destino not in anios_validos:
+                resultado.omitidos.append((plan, f"el año {destino} no está disponible"))
+            elif destino == plan.year:
+                resultado.omitidos.append((plan, 'el plan ya es de ese año'))
+            elif (plan.organization_level_id, destino) in ocupados:
+                resultado.omitidos.append((plan, f"el nivel ya tiene plan para {destino}"))
+            else:
+                # También evita copiar dos planes del mismo nivel al mismo año
+                ocupados.add((plan.organization_level_id, destino))
+                copias.append((plan, PlanAnual(
+                    year=destino,
+                    organization_level_id=plan.organization_level_id,
+                    created_by=usuario
+                )))
+
+        # bulk_create no dispara las señales de PlanAnual; un plan nuevo no tiene resumen que mover
+        PlanAnual.objects.bulk_create([nuevo for _origen, nuevo in copias])
+        for origen, nuevo in copias:
+            actividades = _copiar_actividades(origen, nuevo, resultado, tamano_lote)
+            resultado.planes.append((origen, nuevo))
+            if progreso:
+                progreso(nuevo, actividades)
+    return resultado
+
+
+def _copiar_actividades(origen, nuevo, resultado, tamano_lote):
+    """Inserta en `nuevo` las actividades de `origen` por lotes; devuelve cuántas copió"""
+    aprobadores = origen.organization_level.get_approver_ids(ApprovalFlow.Module.ANNUAL_PLAN)
+    responsables = set(User.objects.filter(
+        organization_level_id=origen.organization_level_id, is_active=True
+    ).values_list('pk', flat=True))
+    anios = nuevo.year - origen.year
+
+    filas = ActividadPlanAnual.objects.filter(plan=origen).order_by('fecha_inicio', 'pk').values_list(
+        'nombre', 'descripcion', 'responsable_id', 'fecha_inicio', 'fecha_fin'
+    ).iterator(chunk_size=tamano_lote)
+
+    copiadas = 0
+    while lote := list(islice(filas, tamano_lote)):
+        actividades, aprobaciones = [], []
+        for nombre, descripcion, responsable_id, fecha_inicio, fecha_fin in lote:
+            if responsable_id not in responsables:
+                resultado.actividades_omitidas += 1
+                continue
+            actividad = ActividadPlanAnual(
+                plan=nuevo,
+                nombre=nombre,
+                descripcion=descripcion,
+                responsable_id=responsable_id,
+                fecha_inicio=desplazar(fecha_inicio, anios),
+                fecha_fin=desplazar(fecha_fin, anios)
+            )
+            propias = actividad.construir_aprobaciones(aprobadores)
+            flujo.preparar(actividad, propias)
+            actividades.append(actividad)
+            aprobaciones += propias
+
+        ActividadPlanAnual.objects.bulk_create(actividades)
+        # Las aprobaciones toman el id de su actividad al insertarse
+        Aprobacion.objects.bulk_create(aprobaciones, batch_size=tamano_lote)
+        resumen.registrar_nuevas(nuevo, actividades)
+        eventos.avisar_bandejas(
+            aprobacion.aprobador_id for aprobacion in aprobaciones
+            if aprobacion.orden == aprobacion.actividad.orden_pendiente
+        )
+        copiadas += len(actividades)
+        resultado.aprobaciones += len(aprobaciones)
+
+    resultado.actividades += copiadas
+    return copiadas
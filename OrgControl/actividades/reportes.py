@@ -0,0 +1,199 @@
+"""
+Generación de reportes de planes anuales.
+
+Las actividades se leen en bloques con .iterator() (cursor del lado del
+servidor en PostgreSQL) y solo con las columnas necesarias, de modo que la
+memoria usada no depende del tamaño del plan. El CSV se lee con
+.aiterator() y se envía en streaming a medida que llegan los bloques.
+
+Los PDF se generan una sola vez por revisión del plan (PlanAnual.revision) y
+se guardan en REPORTES_ROOT/plan_<id>/ con un nombre derivado de esa
+revisión; las descargas siguientes se sirven directamente desde el archivo.
+Al generar una revisión se borran las anteriores del mismo plan, y al
+eliminar el plan su carpeta (ver actividades/signald.py).
+"""
+import csv
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from openpyxl import Workbook
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+from .models import ActividadPlanAnual
+
+TAMANO_BLOQUE = 2000
+# Por encima de este tamaño el archivo temporal pasa de memoria a disco
+MEMORIA_MAXIMA_ARCHIVO = 8 * 1024 * 1024
+
+CONTENT_TYPE_EXCEL = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Incrementar al cambiar el diseño del PDF para descartar los archivos ya generados
+VERSION_PDF = 1
+_NOMBRE_PDF = re.compile(r'r(\d+)_v(\d+)\.pdf')
+MARGEN = 50
+INTERLINEADO = 18
+FUENTE = 'Helvetica'
+TAMANO_FUENTE = 9
+
+
+CAMPOS_REPORTE = ('nombre', 'responsable__first_name', 'responsable__last_name', 'estado', 'avance')
+
+
+def consulta_reporte(plan):
+    return ActividadPlanAnual.objects.filter(plan=plan).order_by('fecha_inicio', 'pk').values_list(
+        *CAMPOS_REPORTE
+    )
+
+
+def filas_actividades(plan):
+    """(nombre, responsable, estado, avance) de cada actividad del plan, en bloques"""
+    estados = dict(ActividadPlanAnual.ESTADO_CHOICES)
+    filas = consulta_reporte(plan).iterator(chunk_size=TAMANO_BLOQUE)
+
+    for nombre, first_name, last_name, estado, avance in filas:
+        yield nombre, f"{first_name} {last_name}".strip(), str(estados.get(estado, estado)), avance
+
+
+class _Eco:
+    """Archivo de solo escritura que devuelve lo escrito, para csv.writer en streaming"""
+    def write(self, valor):
+        return valor
+
+
+async def lineas_csv(plan, using=DEFAULT_DB_ALIAS):
+    """Líneas CSV de las actividades del plan, para un StreamingHttpResponse asíncrono"""
+    estados = dict(ActividadPlanAnual.ESTADO_CHOICES)
+    escritor = csv.writer(_Eco())
+    # La marca BOM hace que Excel abra el archivo como UTF-8
+    yield '\ufeff' + escritor.writerow(['Actividad', 'Responsable', 'Estado', 'Avance'])
+
+    # El alias se fija aquí porque la respuesta se consume después de salir de la vista.
+    # values() y no values_list(): el iterador de values_list() ejecuta la consulta al
+    # crearse, y aiterator() lo crea en el bucle de eventos
+    filas = consulta_reporte(plan).values(*CAMPOS_REPORTE).using(using).aiterator(
+        chunk_size=TAMANO_BLOQUE
+    )
+    async for fila in filas:
+        responsable = f"{fila['responsable__first_name']} {fila['responsable__last_name']}".strip()
+        yield escritor.writerow([
+            fila['nombre'], responsable, str(estados.get(fila['estado'], fila['estado'])), fila['avance']
+        ])
+
+
+def escribir_excel(plan, destino):
+    """Escribe el plan en `destino` (ruta o archivo binario) usando el modo write-only de openpyxl"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=f"Plan {plan.pk}")
+
+    # Cabecera
+    ws.append(['Plan Anual', plan.year, plan.organization_level.name])
+    ws.append([])
+    ws.append(['Actividad', 'Responsable', 'Estado', 'Avance'])
+    # Datos
+    for nombre, responsable, estado, avance in filas_actividades(plan):
+        ws.append([nombre, responsable, estado, f"{avance}%"])
+
+    wb.save(destino)
+
+
+def _recortar(texto, ancho):
+    if stringWidth(texto, FUENTE, TAMANO_FUENTE) <= ancho:
+        return texto
+    while texto and stringWidth(texto + '…', FUENTE, TAMANO_FUENTE) > ancho:
+        texto = texto[:-1]
+    return texto + '…'
+
+
+def escribir_pdf(plan, destino):
+    """Dibuja el plan en `destino` paginando cuando la página se llena"""
+    p = canvas.Canvas(destino, pagesize=A4)
+    ancho, alto = A4
+    columnas = (MARGEN, 300, 430, ancho - MARGEN)
+    pagina = 0
+
+    def nueva_pagina():
+        nonlocal pagina
+        if pagina:
+            p.showPage()
+        pagina += 1
+
+        # Cabecera
+        p.setFont('Helvetica-Bold', 14)
+        p.drawString(MARGEN, alto - MARGEN, f"Plan Anual {plan.year}")
+        p.setFont(FUENTE, 10)
+        p.drawString(MARGEN, alto - MARGEN - 16, f"Nivel: {plan.organization_level}")
+        p.drawRightString(ancho - MARGEN, MARGEN / 2, f"Página {pagina}")
+
+        y = alto - MARGEN - 44
+        p.setFont('Helvetica-Bold', TAMANO_FUENTE)
+        p.drawString(columnas[0], y, 'Actividad')
+        p.drawString(columnas[1], y, 'Responsable')
+        p.drawString(columnas[2], y, 'Estado')
+        p.drawRightString(columnas[3], y, 'Avance')
+        p.line(MARGEN, y - 4, ancho - MARGEN, y - 4)
+        p.setFont(FUENTE, TAMANO_FUENTE)
+        return y - INTERLINEADO
+
+    y = nueva_pagina()
+    for nombre, responsable, estado, avance in filas_actividades(plan):
+        if y < MARGEN:
+            y = nueva_pagina()
+        p.drawString(columnas[0], y, _recortar(nombre, columnas[1] - columnas[0] - 10))
+        p.drawString(columnas[1], y, _recortar(responsable, columnas[2] - columnas[1] - 10))
+        p.drawString(columnas[2], y, estado)
+        p.drawRightString(columnas[3], y, f"{avance}%")
+        y -= INTERLINEADO
+
+    p.showPage()
+    p.save()
+
+
+def ruta_pdf(plan):
+    """Ruta del PDF para la revisión actual del plan"""
+    return Path(settings.REPORTES_ROOT) / f"plan_{plan.pk}" / f"r{plan.revision}_v{VERSION_PDF}.pdf"
+
+
+def _descartar_anteriores(plan):
+    """Borra los PDF del plan de revisiones anteriores o de otra versión del diseño"""
+    for archivo in ruta_pdf(plan).parent.glob('r*.pdf'):
+        coincidencia = _NOMBRE_PDF.fullmatch(archivo.name)
+        if coincidencia and (int(coincidencia[1]) < plan.revision or int(coincidencia[2]) != VERSION_PDF):
+            archivo.unlink(missing_ok=True)
+
+
+def descartar_pdfs(plan_id):
+    """Borra todos los PDF de un plan (al eliminarlo)"""
+    shutil.rmtree(Path(settings.REPORTES_ROOT) / f"plan_{plan_id}", ignore_errors=True)
+
+
+def abrir_pdf(plan):
+    """
+    Devuelve el PDF del plan abierto en modo binario, generándolo solo si esta
+    revisión aún no existe. Se abre aquí y no en la vista para que la limpieza
+    de otra petición no lo borre entre comprobarlo y abrirlo.
+    """
+    ruta = ruta_pdf(plan)
+    try:
+        return open(ruta, 'rb')
+    except FileNotFoundError:
+        pass
+
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    # Se escribe a un temporal y se renombra para que nunca se sirva un PDF a medias
+    with tempfile.NamedTemporaryFile(dir=ruta.parent, suffix='.tmp', delete=False) as temporal:
+        try:
+            escribir_pdf(plan, temporal)
+        except Exception:
+            os.unlink(temporal.name)
+            raise
+    archivo = open(temporal.name, 'rb')
+    os.replace(temporal.name, ruta)
+    _descartar_anteriores(plan)
+    return archivo
@@ -0,0 +1,146 @@
+"""
+Mantenimiento incremental de ResumenActividades.
+
+Cada cambio en una actividad se traduce en diferencias por clave
+(nivel, año, estado) que se suman a la fila correspondiente con F(), sin
+recorrer el resto de actividades. reconstruir() recalcula la tabla desde
+cero para corregir cualquier desviación.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import PlanAnual, ActividadPlanAnual, ResumenActividades
+
+
+def nuevo_delta():
+    """Diferencias acumuladas: {(nivel, año, estado): [total, suma_avance]}"""
+    return defaultdict(lambda: [0, 0])
+
+
+def clave_plan(plan_id):
+    return PlanAnual.objects.values_list('organization_level_id', 'year').get(pk=plan_id)
+
+
+def aplicar(delta):
+    for (nivel_id, year, estado), (total, suma_avance) in delta.items():
+        if not total and not suma_avance:
+            continue
+        filtro = {'organization_level_id': nivel_id, 'year': year, 'estado': estado}
+        cambios = {'total': F('total') + total, 'suma_avance': F('suma_avance') + suma_avance}
+        if ResumenActividades.objects.filter(**filtro).update(**cambios):
+            continue
+        try:
+            with transaction.atomic():
+                ResumenActividades.objects.create(total=total, suma_avance=suma_avance, **filtro)
+        except IntegrityError:
+            # Otro proceso creó la fila entre el update y el create
+            ResumenActividades.objects.filter(**filtro).update(**cambios)
+
+
+def registrar_guardado(actividad, originales):
+    """Aplica el efecto de guardar `actividad`; `originales` es {} si es nueva"""
+    registrar_guardados([(actividad, originales)])
+
+
+def registrar_guardados(cambios):
+    """
+    Como registrar_guardado para varias actividades a la vez (por ejemplo,
+    tras un bulk_update); `cambios` es una lista de (actividad, originales).
+    """
+    plan_ids = {actividad.plan_id for actividad, _ in cambios}
+    plan_ids |= {originales['plan_id'] for _, originales in cambios if originales}
+    claves = {
+        pk: (nivel_id, year)
+        for pk, nivel_id, year in PlanAnual.objects.filter(pk__in=plan_ids).values_list(
+            'pk', 'organization_level_id', 'year'
+        )
+    }
+
+    delta = nuevo_delta()
+    for actividad, originales in cambios:
+        if originales:
+            fila = delta[(*claves[originales['plan_id']], originales['estado'])]
+            fila[0] -= 1
+            fila[1] -= originales['avance']
+        fila = delta[(*claves[actividad.plan_id], actividad.estado)]
+        fila[0] += 1
+        fila[1] += actividad.avance
+    aplicar(delta)
+
+
+def registrar_borrado(plan_id, estado, avance):
+    delta = nuevo_delta()
+    nivel_id, year = clave_plan(plan_id)
+    delta[(nivel_id, year, estado)] = [-1, -avance]
+    aplicar(delta)
+
+
+def descartar_plan(plan):
+    """
+    Quita los totales de un plan que se va a borrar. Hay un plan por nivel y
+    año, así que sus filas son las de esa clave.
+    """
+    originales = plan.valores_originales()
+    ResumenActividades.objects.filter(
+        organization_level_id=originales['organization_level_id'], year=originales['year']
+    ).delete()
+
+
+def registrar_nuevas(plan, actividades):
+    """Suma actividades insertadas con bulk_create (que no dispara señales)"""
+    delta = nuevo_delta()
+    for actividad in actividades:
+        fila = delta[(plan.organization_level_id, plan.year, actividad.estado)]
+        fila[0] += 1
+        fila[1] += actividad.avance
+    aplicar(delta)
+
+
+def mover_plan(plan_id, clave_anterior, clave_nueva):
+    """Traslada los totales de un plan cuyo nivel o año cambió"""
+    delta = nuevo_delta()
+    por_estado = ActividadPlanAnual.objects.filter(plan_id=plan_id).values('estado').annotate(
+        total=Count('pk'), suma_avance=Sum('avance')
+    ).order_by()
+    for fila in por_estado:
+        for clave, signo in ((clave_anterior, -1), (clave_nueva, 1)):
+            acumulado = delta[(*clave, fila['estado'])]
+            acumulado[0] += signo * fila['total']
+            acumulado[1] += signo * (fila['suma_avance'] or 0)
+    aplicar(delta)
+
+
+def calcular():
+    """Totales esperados a partir de las actividades: {(nivel, año, estado): (total, suma_avance)}"""
+    filas = ActividadPlanAnual.objects.values(
+        'plan__organization_level_id', 'plan__year', 'estado'
+    ).annotate(total=Count('pk'), suma_avance=Sum('avance')).order_by()
+    return {
+        (f['plan__organization_level_id'], f['plan__year'], f['estado']): (f['total'], f['suma_avance'] or 0)
+        for f in filas
+    }
+
+
+def reconstruir():
+    """Reemplaza la tabla con los totales recalculados; devuelve cuántas claves diferían"""
+    with transaction.atomic():
+        esperado = calcular()
+        actual = {
+            (r.organization_level_id, r.year, r.estado): (r.total, r.suma_avance)
+            for r in ResumenActividades.objects.select_for_update()
+            if r.total or r.suma_avance
+        }
+        diferencias = sum(1 for clave in esperado.keys() | actual.keys()
+                          if esperado.get(clave) != actual.get(clave))
+
+        ResumenActividades.objects.all().delete()
+        ResumenActividades.objects.bulk_create([
+            ResumenActividades(
+                organization_level_id=nivel_id, year=year, estado=estado,
+                total=total, suma_avance=suma_avance
+            )
+            for (nivel_id, year, estado), (total, suma_avance) in esperado.items()
+        ])
+    return diferencias
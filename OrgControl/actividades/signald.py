@@ -1,17 +1,135 @@
-from django.db.models.signals import post_save
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import pre_delete, pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import ActividadPlanAnual, Aprobacion
+from users.models import OrganizationLevel
+from . import eventos, flujo, reportes, resumen
+from .models import PlanAnual, ActividadPlanAnual, Aprobacion
+
+User = get_user_model()
+# Campos del usuario que se muestran como responsable en fragmentos y reportes
+CAMPOS_NOMBRE = ('first_name', 'last_name')
+
+
+def borrado_de_planes(origin):
+    """
+    Si el borrado partió de planes (instancia o queryset), sus actividades
+    caen en cascada: las señales de PlanAnual se ocupan del plan completo y
+    las de cada actividad no tienen nada que hacer.
+    """
+    modelo = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return modelo is PlanAnual
 
 
 @receiver(post_save, sender=ActividadPlanAnual)
 def configurar_flujo_aprobacion(sender, instance, created, **kwargs):
     if created:
-        # Obtener la jerarquía de aprobación basada en la organización
-        aprobadores = instance.plan.organization_level.get_approvers()
-
-        for orden, aprobador in enumerate(aprobadores, start=1):
-            Aprobacion.objects.create(
-                actividad=instance,
-                aprobador=aprobador,
-                orden=orden
-            )
\ No newline at end of file
+        # La jerarquía de aprobación se resuelve por módulo y nivel (ver users/cache.py)
+        aprobaciones = Aprobacion.objects.bulk_create(instance.construir_aprobaciones())
+        flujo.iniciar(instance, aprobaciones)
+        eventos.avisar_bandejas(
+            aprobacion.aprobador_id for aprobacion in aprobaciones
+            if aprobacion.orden == instance.orden_pendiente
+        )
+
+
+@receiver(post_save, sender=ActividadPlanAnual)
+def incrementar_revision_plan(sender, instance, **kwargs):
+    # Si la actividad cambió de plan, lo cacheado del plan anterior también quedó obsoleto
+    plan_anterior = getattr(instance, '_previos', {}).get('plan_id', instance.plan_id)
+    PlanAnual.incrementar_revision(*{plan_anterior, instance.plan_id})
+
+
+@receiver(post_delete, sender=ActividadPlanAnual)
+def incrementar_revision_plan_baja(sender, instance, origin=None, **kwargs):
+    if not borrado_de_planes(origin):
+        PlanAnual.incrementar_revision(instance.plan_id)
+
+
+@receiver(post_save, sender=ActividadPlanAnual)
+def avisar_cambios_actividad(sender, instance, created, **kwargs):
+    previos = getattr(instance, '_previos', {})
+    plan_anterior = previos.get('plan_id', instance.plan_id)
+    if created or plan_anterior != instance.plan_id:
+        for plan_id in {plan_anterior, instance.plan_id}:
+            eventos.avisar_recarga(plan_id)
+    elif any(previos.get(campo) != getattr(instance, campo) for campo in ('estado', 'avance')):
+        eventos.avisar_actividades([instance])
+
+
+@receiver(post_delete, sender=ActividadPlanAnual)
+def avisar_baja_actividad(sender, instance, origin=None, **kwargs):
+    if not borrado_de_planes(origin):
+        eventos.avisar_recarga(instance.plan_id)
+
+
+@receiver(post_save, sender=OrganizationLevel)
+def incrementar_revision_planes_nivel(sender, instance, created, **kwargs):
+    # El nombre del nivel aparece en los fragmentos cacheados y en los reportes
+    if not created:
+        PlanAnual.objects.filter(organization_level=instance).update(revision=F('revision') + 1)
+
+
+@receiver(pre_save, sender=User)
+def recordar_nombre_responsable(sender, instance, update_fields=None, **kwargs):
+    # Los inicios de sesión guardan solo last_login: no hace falta consultar
+    if instance._state.adding or (update_fields is not None and not set(update_fields) & set(CAMPOS_NOMBRE)):
+        instance._nombre_previo = None
+    else:
+        instance._nombre_previo = User._base_manager.filter(pk=instance.pk).values_list(*CAMPOS_NOMBRE).first()
+
+
+@receiver(post_save, sender=User)
+def incrementar_revision_planes_responsable(sender, instance, created, **kwargs):
+    # El nombre del responsable aparece en los fragmentos cacheados y en los reportes
+    previo = getattr(instance, '_nombre_previo', None)
+    if previo is not None and previo != tuple(getattr(instance, campo) for campo in CAMPOS_NOMBRE):
+        PlanAnual.objects.filter(
+            pk__in=ActividadPlanAnual.objects.filter(responsable=instance).values('plan_id')
+        ).update(revision=F('revision') + 1)
+
+
+@receiver(post_delete, sender=PlanAnual)
+def descartar_pdfs_plan(sender, instance, **kwargs):
+    plan_id = instance.pk
+    transaction.on_commit(lambda: reportes.descartar_pdfs(plan_id), robust=True)
+    eventos.avisar_recarga(plan_id)
+
+
+@receiver(pre_save, sender=PlanAnual)
+@receiver(pre_save, sender=ActividadPlanAnual)
+def recordar_valores_originales(sender, instance, **kwargs):
+    instance._previos = {} if instance._state.adding else instance.valores_originales()
+
+
+@receiver(post_save, sender=PlanAnual)
+def mover_resumen_plan(sender, instance, created, **kwargs):
+    previos = getattr(instance, '_previos', {})
+    anterior = (previos.get('organization_level_id'), previos.get('year'))
+    actual = (instance.organization_level_id, instance.year)
+    if not created and previos and anterior != actual:
+        resumen.mover_plan(instance.pk, anterior, actual)
+    instance.guardar_originales()
+
+
+@receiver(post_save, sender=ActividadPlanAnual)
+def actualizar_resumen(sender, instance, created, **kwargs):
+    resumen.registrar_guardado(instance, getattr(instance, '_previos', {}))
+    instance.guardar_originales()
+
+
+@receiver(pre_delete, sender=PlanAnual)
+def descartar_resumen_plan(sender, instance, origin=None, **kwargs):
+    # Una sola consulta en lugar de descontar cada actividad de la cascada
+    if borrado_de_planes(origin):
+        resumen.descartar_plan(instance)
+
+
+@receiver(post_delete, sender=ActividadPlanAnual)
+def descontar_resumen(sender, instance, origin=None, **kwargs):
+    if borrado_de_planes(origin):
+        return
+    valores = {campo: getattr(instance, campo) for campo in instance.CAMPOS_SEGUIDOS}
+    valores.update(getattr(instance, '_originales', {}))
+    resumen.registrar_borrado(valores['plan_id'], valores['estado'], valores['avance'])
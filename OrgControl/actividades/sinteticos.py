@@ -0,0 +1,174 @@
+"""
+Generación de una organización sintética para pruebas de carga y benchmarks.
+
+Crea una Oficina Central con `arcs` ARC y `uebs` UEB, un director por
+nivel, especialistas con cadenas de jefes, los flujos de aprobación y un
+plan anual por nivel con sus actividades y aprobaciones. Las actividades se
+insertan con importar_filas(), así que pasan por la misma validación, flujo
+inicial y resumen que una importación real. Con la misma semilla se obtiene
+la misma organización.
+"""
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+
+from users.directory import build_search_document
+from users.models import ApprovalFlow, ApproverRole, OrganizationLevel, UserProfile
+from . import flujo
+from .importacion import importar_filas
+from .models import Aprobacion, PlanAnual
+
+User = get_user_model()
+
+# Cada cuántos especialistas se reinicia la cadena de jefes desde el director
+PROFUNDIDAD_JEFES = 4
+
+
+class Organizacion:
+    def __init__(self):
+        self.central = None
+        self.niveles = []
+        self.directores = {}
+        self.usuarios = []
+        self.planes = []
+        self.actividades = 0
+        self.aprobaciones = 0
+        self.decididas = 0
+
+
+def _crear_usuarios(prefijo, datos):
+    """bulk_create de usuarios con sus perfiles (que la señal no crearía)"""
+    clave = make_password(None)
+    usuarios = User.objects.bulk_create([
+        User(username=f"{prefijo}_{username}", password=clave, **campos)
+        for username, campos in datos
+    ])
+    perfiles = [UserProfile(user=usuario) for usuario in usuarios]
+    for perfil in perfiles:
+        perfil.search_document = build_search_document(perfil)
+    UserProfile.objects.bulk_create(perfiles)
+    return usuarios
+
+
+def _nivel(prefijo, nombre, tipo, director, padre=None):
+    nivel = OrganizationLevel(
+        name=f"{prefijo} {nombre}", level_type=tipo, director=director, parent=padre
+    )
+    nivel.save()
+    director.organization_level = nivel
+    director.save(update_fields=['organization_level'])
+    return nivel
+
+
+def _especialistas(prefijo, nivel, director, cantidad, posicion, rng):
+    datos = [
+        (f"{nivel.pk}_esp{i}", {
+            'first_name': rng.choice(NOMBRES),
+            'last_name': f"{rng.choice(APELLIDOS)} {i}",
+            'position': posicion,
+            'organization_level': nivel,
+        })
+        for i in range(cantidad)
+    ]
+    usuarios = _crear_usuarios(prefijo, datos)
+    for i, usuario in enumerate(usuarios):
+        usuario.boss = director if i % PROFUNDIDAD_JEFES == 0 else usuarios[i - 1]
+    User.objects.bulk_update(usuarios, ['boss'])
+    return usuarios
+
+
+def _flujos(auditor):
+    for modulo in ApprovalFlow.Module.values:
+        ApprovalFlow.objects.get_or_create(module=modulo)
+    plan_anual = ApprovalFlow.objects.get(module=ApprovalFlow.Module.ANNUAL_PLAN)
+    ultimo = ApproverRole.objects.filter(flow=plan_anual).aggregate(orden=Max('approval_order'))['orden']
+    ApproverRole.objects.create(
+        flow=plan_anual, user=auditor, role_name='Auditoría', approval_order=(ultimo or 0) + 1
+    )
+
+
+def _filas(especialistas, year, cantidad, rng):
+    inicio = date(year, 1, 1)
+    for i in range(cantidad):
+        dia = rng.randrange(300)
+        yield {
+            'nombre': f"{rng.choice(ACCIONES)} {rng.choice(OBJETOS)} {i}",
+            'descripcion': 'Actividad sintética',
+            'responsable': especialistas[i % len(especialistas)].username,
+            'fecha_inicio': inicio + timedelta(days=dia),
+            'fecha_fin': inicio + timedelta(days=dia + rng.randrange(1, 60)),
+        }
+
+
+@transaction.atomic
+def generar(arcs=5, uebs=20, especialistas=10, actividades=100, year=None,
+            proporcion_aprobada=0.3, prefijo='sint', semilla=1):
+    """
+    Crea la organización y devuelve un resumen con lo creado.
+
+    `proporcion_aprobada` es la fracción de actividades de cada plan que el
+    director del nivel ya aprobó, para que las bandejas tengan variedad.
+    """
+    rng = random.Random(semilla)
+    year = year or date.today().year
+    organizacion = Organizacion()
+
+    dg, auditor = _crear_usuarios(prefijo, [
+        ('dg', {'first_name': 'Directora', 'last_name': 'General', 'position': 'DG'}),
+        ('auditor', {'first_name': 'Auditor', 'last_name': 'Interno', 'position': 'ADMIN'}),
+    ])
+    organizacion.central = _nivel(prefijo, 'Oficina Central', OrganizationLevel.LevelType.CENTRAL, dg)
+    organizacion.directores[organizacion.central.pk] = dg
+    organizacion.usuarios += [dg, auditor]
+    _flujos(auditor)
+
+    tipos = [('ARC', 'DIR_ARC', 'ESP_ARC', i) for i in range(arcs)]
+    tipos += [('UEB', 'DIR_UEB', 'ESP_UEB', i) for i in range(uebs)]
+    for tipo, cargo_director, cargo_especialista, i in tipos:
+        director, = _crear_usuarios(prefijo, [(f"dir_{tipo.lower()}{i}", {
+            'first_name': rng.choice(NOMBRES),
+            'last_name': rng.choice(APELLIDOS),
+            'position': cargo_director,
+            'boss': dg,
+        })])
+        nivel = _nivel(prefijo, f"{tipo} {i}", tipo, director, organizacion.central)
+        organizacion.niveles.append(nivel)
+        organizacion.directores[nivel.pk] = director
+        organizacion.usuarios.append(director)
+        organizacion.usuarios += _especialistas(
+            prefijo, nivel, director, especialistas, cargo_especialista, rng
+        )
+
+    por_nivel = {}
+    for usuario in organizacion.usuarios:
+        if usuario.position.startswith('ESP_'):
+            por_nivel.setdefault(usuario.organization_level_id, []).append(usuario)
+
+    for nivel in organizacion.niveles:
+        plan = PlanAnual.objects.create(year=year, organization_level=nivel, created_by=dg)
+        organizacion.planes.append(plan)
+        resultado = importar_filas(plan, list(_filas(por_nivel[nivel.pk], year, actividades, rng)))
+        if not resultado.correcto:
+            raise ValueError(f"Filas sintéticas inválidas: {resultado.errores[:3]}")
+        organizacion.actividades += resultado.actividades
+        organizacion.aprobaciones += resultado.aprobaciones
+
+        director = organizacion.directores[nivel.pk]
+        en_turno = list(Aprobacion.objects.filter(
+            actividad__plan=plan, aprobador=director, orden=1
+        ).values_list('pk', flat=True))
+        elegidas = rng.sample(en_turno, int(len(en_turno) * proporcion_aprobada))
+        for inicio in range(0, len(elegidas), flujo.LOTE_MAXIMO):
+            lote = flujo.decidir_en_lote(elegidas[inicio:inicio + flujo.LOTE_MAXIMO], director, 'A')
+            organizacion.decididas += len(lote.aplicadas)
+    return organizacion
+
+
+NOMBRES = ('Ana', 'Luis', 'María', 'Carlos', 'Elena', 'Jorge', 'Lucía', 'Pedro', 'Rosa', 'Miguel')
+APELLIDOS = ('García', 'Pérez', 'Rodríguez', 'González', 'Fernández', 'López', 'Martínez', 'Sánchez')
+ACCIONES = ('Revisar', 'Auditar', 'Capacitar', 'Actualizar', 'Inspeccionar', 'Planificar')
+OBJETOS = ('procedimientos', 'inventario', 'contratos', 'indicadores', 'riesgos', 'expedientes')
@@ -0,0 +1,83 @@
+"""
+Caché de fragmentos de plantilla por revisión del plan.
+
+    {% load fragmentos %}
+    {% fragmento 'estadisticas' plan %} ... {% endfragmento %}
+
+La clave lleva el id y la revisión del plan (PlanAnual.revision), que se
+incrementa con cada cambio del plan, de sus actividades o de sus
+aprobaciones y al modificar su nivel organizacional. Un cambio hace que
+solo se dejen de leer los fragmentos de ese plan; las entradas viejas no se
+borran, expiran solas. Los argumentos después del plan se agregan a la
+clave.
+
+Antes de un bucle, {% precargar_fragmentos 'fila' planes %} lee de una vez
+(get_many) los fragmentos de todos los planes de la lista.
+"""
+from django import template
+from django.core.cache import cache
+
+from OrgControl import metrics
+
+register = template.Library()
+
+TIEMPO_FRAGMENTOS = 60 * 60 * 24
+_PRECARGADOS = 'fragmentos_precargados'
+
+LECTURAS = metrics.contador(
+    'orgcontrol_fragment_cache_total',
+    'Lecturas de la caché de fragmentos de plantilla', ('fragment', 'result')
+)
+
+
+def clave(nombre, plan, variantes=()):
+    partes = [str(nombre), str(plan.pk), str(plan.revision), *(str(variante) for variante in variantes)]
+    return 'fragmento:' + ':'.join(partes)
+
+
+class FragmentoNode(template.Node):
+    def __init__(self, nodelist, nombre, plan, variantes):
+        self.nodelist = nodelist
+        self.nombre = nombre
+        self.plan = plan
+        self.variantes = variantes
+
+    def render(self, context):
+        nombre = self.nombre.resolve(context)
+        llave = clave(nombre, self.plan.resolve(context), [v.resolve(context) for v in self.variantes])
+        precargados = context.render_context.get(_PRECARGADOS, {})
+        contenido = precargados[llave] if llave in precargados else cache.get(llave)
+        if contenido is None:
+            LECTURAS.incrementar(nombre, 'miss')
+            contenido = self.nodelist.render(context)
+            cache.set(llave, contenido, TIEMPO_FRAGMENTOS)
+        else:
+            LECTURAS.incrementar(nombre, 'hit')
+        return contenido
+
+
+@register.tag('fragmento')
+def do_fragmento(parser, token):
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' requiere un nombre y un plan")
+    nodelist = parser.parse(('endfragmento',))
+    parser.delete_first_token()
+    return FragmentoNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]]
+    )
+
+
+@register.simple_tag(takes_context=True)
+def precargar_fragmentos(context, nombre, planes):
+    """Lee en una sola operación los fragmentos `nombre` (sin variantes) de `planes`"""
+    claves = [clave(nombre, plan) for plan in planes]
+    encontrados = cache.get_many(claves)
+    # Los que faltan quedan en None para no volver a consultarlos uno por uno
+    context.render_context.setdefault(_PRECARGADOS, {}).update(
+        {llave: encontrados.get(llave) for llave in claves}
+    )
+    return ''
@@ -1,3 +1,808 @@
-from django.test import TestCase
+import io
+import json
+import re
+import shutil
+import tempfile
+from datetime import date, timedelta
+from smtplib import SMTPException
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from OrgControl import consultas_calientes, eventos as eventos_sse
+from users.models import ApprovalFlow, OrganizationLevel
+from . import bandeja, eventos, flujo, notificaciones, renovacion, resumen, sinteticos
+from .busqueda import Consulta
+from .importacion import importar_archivo, importar_filas
+from .management.commands.benchmark_vistas import PRESUPUESTOS, PRESUPUESTOS_EN_FRIO, escenarios
+from .management.commands.explicar_consultas import UMBRAL
+from .models import ActividadPlanAnual, Aprobacion, NotificacionCorreo, PlanAnual, ResumenActividades
+from .templatetags.fragmentos import LECTURAS as LECTURAS_FRAGMENTOS
+
+User = get_user_model()
+
+YEAR = 2025
+
+
+async def _agotar(contenido):
+    async for _parte in contenido:
+        pass
+
+
+class ReportesTemporalesMixin:
+    """Los PDF se cachean en disco; cada clase usa su propio directorio"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._reportes = tempfile.mkdtemp()
+        cls._ajustes = override_settings(REPORTES_ROOT=cls._reportes, REPLICA_ALIAS=None)
+        cls._ajustes.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._ajustes.disable()
+        shutil.rmtree(cls._reportes, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+
+class ConsultasPorVistaTests(ReportesTemporalesMixin, TestCase):
+    """
+    Cada vista hace un número fijo de consultas, sin importar cuántas
+    actividades tengan los planes, tanto con la caché vacía como servida
+    desde ella. Los topes son los presupuestos de benchmark_vistas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizaciones = [
+            sinteticos.generar(arcs=1, uebs=2, especialistas=4, actividades=actividades,
+                               year=YEAR, prefijo=f"q{actividades}", semilla=actividades)
+            for actividades in (5, 60)
+        ]
+        cls.admin = User.objects.create(username='q_admin', is_superuser=True, is_staff=True)
+
+    def _consultas(self, usuario, url, parametros):
+        self.client.force_login(usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url, parametros)
+            if respuesta.streaming and respuesta.is_async:
+                async_to_sync(_agotar)(respuesta.streaming_content)
+            elif respuesta.streaming:
+                b''.join(respuesta.streaming_content)
+        self.assertEqual(respuesta.status_code, 200, url)
+        return len(consultas)
+
+    def _medir(self, organizacion):
+        """{vista: (consultas en frío, consultas con la caché caliente)}"""
+        medidas = {}
+        for vista, usuario, url, parametros in escenarios(organizacion, self.admin):
+            cache.clear()
+            frio = self._consultas(usuario, url, parametros)
+            medidas[vista] = (frio, self._consultas(usuario, url, parametros))
+        return medidas
+
+    def test_consultas_no_crecen_con_el_volumen(self):
+        chica, grande = (self._medir(organizacion) for organizacion in self.organizaciones)
+        self.assertEqual(chica.keys(), grande.keys())
+        for vista, (frio, caliente) in grande.items():
+            with self.subTest(vista=vista):
+                self.assertEqual((frio, caliente), chica[vista])
+                self.assertLessEqual(caliente, PRESUPUESTOS[vista][0])
+                self.assertLessEqual(frio, PRESUPUESTOS_EN_FRIO[vista][0])
+
+    def test_vistas_principales_cubiertas(self):
+        vistas = {vista for vista, *_resto in escenarios(self.organizaciones[0], self.admin)}
+        self.assertLessEqual({
+            'dashboard', 'plan_anual_list', 'plan_anual_detail', 'plan_actividades_data',
+            'aprobaciones_pendientes', 'aprobaciones_pendientes_data', 'generar_reporte_pdf',
+            'generar_reporte_excel', 'users:staff_directory',
+        }, vistas)
+
+
+class ConsultasCalientesMixin:
+    """
+    Ninguna consulta registrada en consultas_calientes recorre completa una
+    tabla de más de UMBRAL filas, el mismo criterio que explicar_consultas,
+    sobre una organización sintética con estadísticas recientes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        sinteticos.generar(arcs=3, uebs=10, especialistas=10, actividades=100, year=YEAR, prefijo='plan')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_sin_recorridos_completos(self):
+        for consulta in consultas_calientes.registradas():
+            with self.subTest(consulta=consulta.nombre):
+                queryset = consulta.queryset()
+                self.assertIsNotNone(queryset, 'Sin datos de muestra')
+                plan = consultas_calientes.explicar(queryset)
+                grandes = [
+                    tabla for tabla in plan.recorridas
+                    if consultas_calientes.filas(tabla, plan.using) > UMBRAL
+                ]
+                self.assertEqual(grandes, [], '\n'.join(plan.lineas))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Los planes se revisan contra PostgreSQL, la base de producción')
+class ConsultasCalientesTests(ConsultasCalientesMixin, TestCase):
+    pass
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Variante para la base de desarrollo')
+class ConsultasCalientesSqliteTests(ConsultasCalientesMixin, TestCase):
+
+    def _recorridas(self, sql):
+        with connection.cursor() as cursor:
+            return consultas_calientes._explicar_sqlite(cursor, sql, [])[1]
+
+    def test_recorrer_un_indice_es_un_recorrido_completo(self):
+        tabla = PlanAnual._meta.db_table
+        # Sin filtro SQLite prefiere el índice del orden y lo recorre entero
+        self.assertEqual(self._recorridas(f'SELECT id FROM {tabla} ORDER BY organization_level_id'), [tabla])
+        self.assertEqual(self._recorridas(f'SELECT id FROM {tabla} ORDER BY organization_level_id LIMIT 5'), [])
+        self.assertEqual(self._recorridas(f'SELECT id FROM {tabla} ORDER BY revision LIMIT 5'), [tabla])
+        self.assertEqual(self._recorridas(f'SELECT id FROM {tabla} WHERE id = 1'), [])
+
+
+class OrganizacionMixin:
+    """Un ARC con su plan de YEAR, sin actividades decididas"""
+    actividades = 3
+    arcs = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organizacion = sinteticos.generar(
+            arcs=cls.arcs, uebs=0, especialistas=4, actividades=cls.actividades,
+            proporcion_aprobada=0, year=YEAR, prefijo=cls.__name__.lower()
+        )
+        cls.director_general = cls.organizacion.directores[cls.organizacion.central.pk]
+        cls.nivel = cls.organizacion.niveles[0]
+        cls.director = cls.organizacion.directores[cls.nivel.pk]
+        cls.plan = cls.organizacion.planes[0]
+        cls.aprobadores = list(cls.nivel.get_approver_ids(ApprovalFlow.Module.ANNUAL_PLAN))
+        cls.especialista = User.objects.filter(organization_level=cls.nivel, position='ESP_ARC').first()
+
+    def setUp(self):
+        cache.clear()
+
+    def _actividades(self):
+        return ActividadPlanAnual.objects.filter(plan=self.plan).order_by('pk')
+
+    def _aprobacion(self, actividad, aprobador_id):
+        return Aprobacion.objects.get(actividad=actividad, aprobador_id=aprobador_id)
+
+
+class BandejaTests(OrganizacionMixin, TestCase):
+    actividades = 30
+    parametros = {'draw': 1, 'start': 0, 'length': 10}
+
+    def _pagina(self, usuario=None, **parametros):
+        self.client.force_login(usuario or self.director)
+        respuesta = self.client.get(reverse('aprobaciones_pendientes_data'), {**self.parametros, **parametros})
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        datos['ids'] = [int(re.search(r'value="(\d+)"', fila['seleccion']).group(1)) for fila in datos['data']]
+        return datos
+
+    def _en_turno(self):
+        return list(bandeja.pendientes_en_turno(self.director).order_by(*bandeja.CLAVES).values_list('pk', flat=True))
+
+    def test_solo_las_que_estan_en_turno(self):
+        self.assertEqual(self._pagina()['recordsTotal'], self.actividades)
+        self.assertEqual(self._pagina(self.director_general)['recordsTotal'], 0)
+        flujo.decidir_en_lote(self._en_turno()[:2], self.director, 'A')
+        self.assertEqual(self._pagina()['recordsTotal'], self.actividades - 2)
+        self.assertEqual(self._pagina(self.director_general)['recordsTotal'], 2)
+
+    def test_paginas_por_cursor(self):
+        en_turno = self._en_turno()
+        vistas, parametros = [], {}
+        while True:
+            with CaptureQueriesContext(connection) as consultas:
+                pagina = self._pagina(**parametros)
+            if parametros:
+                self.assertFalse(any('OFFSET' in consulta['sql'] for consulta in consultas.captured_queries))
+            vistas += pagina['ids']
+            if 'siguiente' not in pagina:
+                break
+            parametros = {'start': pagina['siguiente']['inicio'], 'despues': pagina['siguiente']['cursor']}
+        self.assertEqual(vistas, en_turno)
+
+    def test_el_cursor_no_salta_filas_decididas_mientras_tanto(self):
+        en_turno = self._en_turno()
+        primera = self._pagina()
+        flujo.decidir_en_lote(primera['ids'][:3], self.director, 'A')
+
+        siguiente = self._pagina(start=10, despues=primera['siguiente']['cursor'])
+        self.assertEqual(siguiente['ids'], en_turno[10:20])
+        # Con OFFSET las filas que subieron de página se perderían
+        self.assertEqual(self._pagina(start=10)['ids'], en_turno[13:23])
+
+    def test_sin_cursor_valido_o_en_otro_orden_usa_offset(self):
+        en_turno = self._en_turno()
+        self.assertEqual(self._pagina(start=10, despues='x-1')['ids'], en_turno[10:20])
+        self.assertEqual(self._pagina(start=10, despues='1')['ids'], en_turno[10:20])
+        otro_orden = self._pagina(**{'order[0][column]': 0, 'order[0][dir]': 'desc',
+                                     'columns[0][data]': 'actividad'})
+        self.assertNotIn('siguiente', otro_orden)
+
+    def test_consulta_desde_un_cursor(self):
+        en_turno = self._en_turno()
+        ultima = Aprobacion.objects.get(pk=en_turno[9])
+        pagina = list(bandeja.consulta(self.director, (ultima.orden, ultima.pk), tamano=10))
+        self.assertEqual([aprobacion.pk for aprobacion in pagina], en_turno[10:21])
+
+
+def _evento(texto):
+    """(nombre, datos) de un evento SSE"""
+    nombre, datos = re.fullmatch(r'event: (\w+)\ndata: (.*)\n\n', texto).groups()
+    return nombre, json.loads(datos)
+
+
+class EventosTests(OrganizacionMixin, TestCase):
+    """Flujos SSE de los planes y de la bandeja con MemoriaBackend"""
+
+    def setUp(self):
+        super().setUp()
+        # Las lecturas del flujo cerrarían la conexión de la transacción de la prueba
+        cerrar = mock.patch.object(eventos_sse.connections, 'close_all')
+        cerrar.start()
+        self.addCleanup(cerrar.stop)
+
+    async def _conectar(self, flujo_sse):
+        """Primer evento del flujo, tras el intervalo de reconexión"""
+        await anext(flujo_sse)
+        return _evento(await anext(flujo_sse))
+
+    def _decidir(self, aprobador, estado):
+        ids = list(bandeja.pendientes_en_turno(aprobador).values_list('pk', flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            flujo.decidir_en_lote(ids, aprobador, estado)
+
+    async def test_flujo_del_plan(self):
+        flujo_sse = eventos.flujo_plan(self.plan.pk)
+        revision = await sync_to_async(lambda: PlanAnual.objects.get(pk=self.plan.pk).revision)()
+        self.assertEqual(await self._conectar(flujo_sse), ('plan', {'revision': revision}))
+
+        await sync_to_async(self._decidir)(self.director, 'R')
+        nombre, datos = _evento(await anext(flujo_sse))
+        self.assertEqual(nombre, 'actividades')
+        self.assertEqual(
+            sorted((cambio['id'], cambio['estado']) for cambio in datos['actividades']),
+            await sync_to_async(lambda: [(actividad.pk, 'R') for actividad in self._actividades()])()
+        )
+
+        # Un lote que no cupo en la cola o en un NOTIFY obliga a recargar
+        eventos_sse.publicar(eventos.canal_plan(self.plan.pk), eventos_sse.DESBORDE.evento)
+        self.assertEqual(_evento(await anext(flujo_sse)), ('recargar', {}))
+        await flujo_sse.aclose()
+
+    async def test_flujo_de_la_bandeja(self):
+        flujo_sse = eventos.flujo_bandeja(self.director_general)
+        self.assertEqual(await self._conectar(flujo_sse), ('bandeja', {'pendientes': 0, 'elementos': [], 'nuevas': []}))
+
+        await sync_to_async(self._decidir)(self.director, 'A')
+        nombre, datos = _evento(await anext(flujo_sse))
+        self.assertEqual(nombre, 'bandeja')
+        self.assertEqual(datos['pendientes'], self.actividades)
+        self.assertEqual(datos['nuevas'], datos['elementos'])
+        await flujo_sse.aclose()
+
+    def test_sin_asgi_no_hay_flujo(self):
+        self.client.force_login(self.director)
+        self.assertEqual(self.client.get(reverse('plan_eventos', args=[self.plan.pk])).status_code, 204)
+        self.assertEqual(self.client.get(reverse('aprobaciones_eventos')).status_code, 204)
+
+
+class RevisionTests(OrganizacionMixin, TestCase):
+    arcs = 2
+
+    def _revisiones(self, *planes):
+        return [PlanAnual.objects.get(pk=plan.pk).revision for plan in planes]
+
+    def test_editar_actividad_incrementa_su_plan(self):
+        otro = self.organizacion.planes[1]
+        antes = self._revisiones(self.plan, otro)
+        actividad = self._actividades().first()
+        actividad.avance = 50
+        actividad.save()
+        self.assertEqual(self._revisiones(self.plan, otro), [antes[0] + 1, antes[1]])
+
+    def test_mover_actividad_incrementa_ambos_planes(self):
+        otro = self.organizacion.planes[1]
+        antes = self._revisiones(self.plan, otro)
+        actividad = self._actividades().first()
+        actividad.plan = otro
+        actividad.save()
+        self.assertEqual(self._revisiones(self.plan, otro), [antes[0] + 1, antes[1] + 1])
+
+        # Y al borrarla, solo el plan donde quedó
+        actividad.delete()
+        self.assertEqual(self._revisiones(self.plan, otro), [antes[0] + 1, antes[1] + 2])
+
+
+class ResumenTests(OrganizacionMixin, TestCase):
+    """El resumen incremental coincide con el que calcula reconstruir_resumen"""
+    arcs = 2
+
+    def assertResumenAlDia(self):
+        actual = {
+            (fila.organization_level_id, fila.year, fila.estado): (fila.total, fila.suma_avance)
+            for fila in ResumenActividades.objects.all() if fila.total or fila.suma_avance
+        }
+        self.assertEqual(actual, resumen.calcular())
+
+    def test_altas_cambios_y_bajas(self):
+        self.assertResumenAlDia()
+        actividades = list(self._actividades())
+        actividades[0].avance = 40
+        actividades[0].estado = 'E'
+        actividades[0].save()
+        self.assertResumenAlDia()
+        actividades[1].plan = self.organizacion.planes[1]
+        actividades[1].save()
+        self.assertResumenAlDia()
+        actividades[2].delete()
+        self.assertResumenAlDia()
+        flujo.decidir_en_lote(list(bandeja.pendientes_en_turno(self.director).values_list('pk', flat=True)),
+                              self.director, 'R')
+        self.assertResumenAlDia()
+
+    def test_cambiar_nivel_o_year_del_plan(self):
+        plan = PlanAnual.objects.get(pk=self.plan.pk)
+        plan.year = YEAR + 1
+        plan.save()
+        self.assertResumenAlDia()
+
+    def test_borrar_plan_no_descuenta_actividad_por_actividad(self):
+        grande = sinteticos.generar(arcs=1, uebs=0, especialistas=2, actividades=30, proporcion_aprobada=0.5,
+                                    year=YEAR, prefijo='resumen_grande').planes[0]
+        with CaptureQueriesContext(connection) as consultas:
+            PlanAnual.objects.get(pk=grande.pk).delete()
+        self.assertResumenAlDia()
+        # Borrar la fila del plan en el resumen, sin actualizaciones por actividad
+        # (los DELETE de aprobaciones se agrupan en lotes según la base de datos)
+        self.assertLess(len(consultas), 30)
+        sentencias = [consulta['sql'] for consulta in consultas.captured_queries]
+        self.assertEqual(sum(ResumenActividades._meta.db_table in sql for sql in sentencias), 1)
+        self.assertFalse(any(sql.startswith('UPDATE') for sql in sentencias))
+
+        PlanAnual.objects.filter(pk__in=[self.plan.pk, self.organizacion.planes[1].pk]).delete()
+        self.assertResumenAlDia()
+
+
+class ServidorCaido(EmailBackend):
+    def open(self):
+        raise ConnectionRefusedError('Conexión rechazada')
+
+
+class EnvioRechazado(EmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException('Buzón lleno')
+
+
+class NotificacionesTests(OrganizacionMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        flujo.decidir_en_lote(
+            Aprobacion.objects.filter(aprobador=self.director).values_list('pk', flat=True), self.director, 'A'
+        )
+
+    def _vencer(self):
+        NotificacionCorreo.objects.update(proximo_intento=timezone.now() - timedelta(seconds=1))
+
+    def test_envia_las_pendientes(self):
+        resultado = notificaciones.despachar_lote()
+        self.assertEqual(resultado['enviadas'], self.actividades)
+        self.assertEqual(len(mail.outbox), self.actividades)
+        self.assertEqual(set(NotificacionCorreo.objects.values_list('estado', 'intentos')), {('E', 1)})
+        self.assertEqual(notificaciones.despachar_lote()['enviadas'], 0)
+
+    def test_servidor_caido_aplaza_sin_consumir_intentos(self):
+        with self.assertLogs('actividades.notificaciones', 'WARNING'):
+            resultado = notificaciones.despachar_lote(connection=ServidorCaido())
+        self.assertEqual(resultado['aplazadas'], self.actividades)
+        self.assertEqual(mail.outbox, [])
+        for notificacion in NotificacionCorreo.objects.all():
+            self.assertEqual((notificacion.estado, notificacion.intentos), ('P', 0))
+            self.assertGreater(notificacion.proximo_intento, timezone.now())
+            self.assertIn('ConnectionRefusedError', notificacion.ultimo_error)
+        # Aplazadas no vuelven a intentarse hasta que venza la espera
+        self.assertEqual(notificaciones.despachar_lote()['enviadas'], 0)
+
+    def test_envio_rechazado_reintenta_y_termina_en_fallido(self):
+        resultado = notificaciones.despachar_lote(max_intentos=2, connection=EnvioRechazado())
+        self.assertEqual(resultado['reintentos'], self.actividades)
+        self._vencer()
+        resultado = notificaciones.despachar_lote(max_intentos=2, connection=EnvioRechazado())
+        self.assertEqual(resultado['fallidas'], self.actividades)
+        self.assertEqual(set(NotificacionCorreo.objects.values_list('estado', 'intentos')), {('F', 2)})
+
+    def test_calcular_espera(self):
+        self.assertEqual(notificaciones.calcular_espera(1), notificaciones.BACKOFF_BASE)
+        self.assertEqual(notificaciones.calcular_espera(2), 2 * notificaciones.BACKOFF_BASE)
+        self.assertEqual(notificaciones.calcular_espera(100), notificaciones.BACKOFF_MAXIMO)
+
+
+class ImportacionTests(OrganizacionMixin, TestCase):
+    actividades = 0
+    arcs = 2
+
+    def _csv(self, *filas):
+        texto = 'Nombre,Descripcion,Responsable,Fecha_Inicio,Fecha_Fin\n' + ''.join(
+            f"{','.join(fila)}\n" for fila in filas
+        )
+        return io.BytesIO(texto.encode('utf-8'))
+
+    def test_importa_csv(self):
+        resultado = importar_archivo(self.plan, self._csv(
+            ('Revisar inventario', 'Almacén central', self.especialista.username, f"{YEAR}-02-01", f"{YEAR}-02-10"),
+            ('Auditar contratos', '', self.especialista.username, f"05/03/{YEAR}", f"20/03/{YEAR}"),
+        ), 'plan.csv')
+        self.assertTrue(resultado.correcto, resultado.errores)
+        self.assertEqual(resultado.actividades, 2)
+        self.assertEqual(resultado.aprobaciones, 2 * len(self.aprobadores))
+        self.assertEqual(
+            list(self._actividades().values_list('fecha_inicio', flat=True)),
+            [date(YEAR, 2, 1), date(YEAR, 3, 5)]
+        )
+        self.assertEqual(set(self._actividades().values_list('orden_pendiente', flat=True)), {1})
+
+    def test_importa_xlsx(self):
+        from openpyxl import Workbook
+
+        libro = Workbook()
+        libro.active.append(['nombre', 'responsable', 'fecha_inicio', 'fecha_fin'])
+        libro.active.append(['Capacitar personal', self.especialista.username, date(YEAR, 4, 1), date(YEAR, 4, 2)])
+        archivo = io.BytesIO()
+        libro.save(archivo)
+        archivo.seek(0)
+
+        resultado = importar_archivo(self.plan, archivo, 'plan.xlsx')
+        self.assertTrue(resultado.correcto, resultado.errores)
+        self.assertEqual(self._actividades().get().nombre, 'Capacitar personal')
+
+    def test_una_fila_invalida_no_importa_nada(self):
+        otro_nivel = User.objects.filter(position='ESP_ARC').exclude(organization_level=self.nivel).first()
+        resultado = importar_archivo(self.plan, self._csv(
+            ('Revisar inventario', '', self.especialista.username, f"{YEAR}-02-01", f"{YEAR}-02-10"),
+            ('Sin responsable', '', 'nadie', f"{YEAR}-02-01", f"{YEAR}-02-10"),
+            ('De otro nivel', '', otro_nivel.username, f"{YEAR}-02-01", f"{YEAR}-02-10"),
+            ('Fechas invertidas', '', self.especialista.username, f"{YEAR}-02-10", f"{YEAR}-02-01"),
+            ('Fecha ilegible', '', self.especialista.username, 'mañana', f"{YEAR}-02-01"),
+            ('', '', self.especialista.username, f"{YEAR}-02-01", f"{YEAR}-02-10"),
+        ), 'plan.csv')
+        self.assertEqual([fila for fila, _mensaje in resultado.errores], [3, 4, 5, 6, 7])
+        self.assertFalse(self._actividades().exists())
+
+    def test_archivos_ilegibles(self):
+        for contenido, nombre in (
+            (b'no es un libro', 'plan.xlsx'),
+            (b'PK\x03\x04 zip truncado', 'plan.xlsx'),
+            # Campo por encima de csv.field_size_limit()
+            (b'nombre\n' + b'x' * 200_000, 'plan.csv'),
+            (b'\xff\xfe\x00', 'plan.csv'),
+            (b'nombre,responsable\n', 'plan.txt'),
+        ):
+            with self.subTest(nombre=nombre, contenido=contenido):
+                resultado = importar_archivo(self.plan, io.BytesIO(contenido), nombre)
+                self.assertFalse(resultado.correcto)
+                self.assertEqual(resultado.errores[0][0], 0)
+        self.assertFalse(self._actividades().exists())
+
+
+class FlujoTests(OrganizacionMixin, TestCase):
+
+    def test_cadena_de_aprobadores(self):
+        self.assertEqual(self.aprobadores[:2], [self.director.pk, self.director_general.pk])
+        actividad = self._actividades().first()
+        self.assertEqual(
+            list(actividad.aprobaciones.order_by('orden').values_list('aprobador_id', flat=True)),
+            self.aprobadores
+        )
+        self.assertEqual(actividad.orden_pendiente, 1)
+        self.assertEqual(actividad.faltan_en_paso, 1)
+
+    def test_aprobar_avanza_al_paso_siguiente(self):
+        actividad = self._actividades().first()
+        actividad = flujo.registrar_decision(
+            self._aprobacion(actividad, self.director.pk), self.director, 'A'
+        )
+        self.assertEqual(actividad.estado, 'P')
+        self.assertEqual(actividad.aprobaciones_aprobadas, 1)
+        self.assertEqual(actividad.orden_pendiente, self._aprobacion(actividad, self.director_general.pk).orden)
+
+    def test_aprobacion_de_toda_la_cadena_aprueba_la_actividad(self):
+        actividad = self._actividades().first()
+        for aprobador_id in self.aprobadores:
+            actividad = flujo.registrar_decision(
+                self._aprobacion(actividad, aprobador_id), User(pk=aprobador_id), 'A'
+            )
+        self.assertEqual(actividad.estado, 'A')
+        self.assertIsNone(actividad.orden_pendiente)
+        self.assertEqual(actividad.aprobaciones_aprobadas, len(self.aprobadores))
+
+    def test_rechazo_cierra_el_flujo(self):
+        actividad = self._actividades().first()
+        actividad = flujo.registrar_decision(
+            self._aprobacion(actividad, self.director.pk), self.director, 'R', 'Fuera de alcance'
+        )
+        self.assertEqual(actividad.estado, 'R')
+        self.assertIsNone(actividad.orden_pendiente)
+        with self.assertRaises(ValidationError):
+            flujo.registrar_decision(
+                self._aprobacion(actividad, self.director_general.pk), self.director_general, 'A'
+            )
+
+    def test_decisiones_no_permitidas(self):
+        actividad = self._actividades().first()
+        propia = self._aprobacion(actividad, self.director.pk)
+        with self.assertRaises(ValidationError):
+            flujo.registrar_decision(propia, self.director, 'X')
+        with self.assertRaises(ValidationError):
+            flujo.registrar_decision(propia, self.director_general, 'A')
+        with self.assertRaises(ValidationError):
+            # Aún no es el turno del director general
+            flujo.registrar_decision(
+                self._aprobacion(actividad, self.director_general.pk), self.director_general, 'A'
+            )
+
+    def test_lote_aplica_las_que_estan_en_turno(self):
+        revision = PlanAnual.objects.get(pk=self.plan.pk).revision
+        en_turno = list(Aprobacion.objects.filter(
+            actividad__plan=self.plan, aprobador=self.director
+        ).values_list('pk', flat=True))
+        ajena = Aprobacion.objects.filter(aprobador=self.director_general).first().pk
+
+        resultado = flujo.decidir_en_lote([*en_turno, ajena], self.director, 'A')
+        self.assertEqual(sorted(resultado.aplicadas), sorted(en_turno))
+        self.assertEqual(resultado.omitidas, {ajena: 'no_encontrada'})
+        self.assertEqual(NotificacionCorreo.objects.count(), len(en_turno))
+        self.assertFalse(self._actividades().filter(orden_pendiente=1).exists())
+        self.assertEqual(PlanAnual.objects.get(pk=self.plan.pk).revision, revision + 1)
+
+        repetido = flujo.decidir_en_lote(en_turno, self.director, 'A')
+        self.assertEqual(repetido.aplicadas, [])
+        self.assertEqual(set(repetido.omitidas.values()), {'fuera_de_turno'})
+
+    def test_lote_maximo(self):
+        with self.assertRaises(ValidationError):
+            flujo.decidir_en_lote(range(flujo.LOTE_MAXIMO + 1), self.director, 'A')
+
+    def test_endpoint_de_decision_en_lote(self):
+        en_turno = list(bandeja.pendientes_en_turno(self.director).values_list('pk', flat=True))
+        self.client.force_login(self.director)
+        respuesta = self.client.post(reverse('decidir_aprobaciones'), {'ids': [*en_turno, 0], 'estado': 'R'},
+                                     content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(sorted(respuesta.json()['aplicadas']), sorted(en_turno))
+        self.assertEqual(respuesta.json()['omitidas'], [{'id': 0, 'motivo': 'no_encontrada'}])
+        self.assertEqual(set(self._actividades().values_list('estado', flat=True)), {'R'})
+
+        for cuerpo in ('no es json', {'ids': ['x'], 'estado': 'A'}, {'ids': [1], 'estado': 'X'}):
+            with self.subTest(cuerpo=cuerpo):
+                respuesta = self.client.post(reverse('decidir_aprobaciones'), cuerpo, content_type='application/json')
+                self.assertEqual(respuesta.status_code, 400)
+
+
+class FragmentosTests(OrganizacionMixin, TestCase):
+    plantilla = Template("{% load fragmentos %}{% fragmento 'prueba' plan variante %}{{ valor }}{% endfragmento %}")
+
+    def _plan(self):
+        return PlanAnual.objects.get(pk=self.plan.pk)
+
+    def _render(self, plan, valor, variante='a'):
+        return self.plantilla.render(Context({'plan': plan, 'valor': valor, 'variante': variante}))
+
+    def _estadisticas(self):
+        self.client.force_login(self.director)
+        respuesta = self.client.get(reverse('plan_anual_detail', args=[self.plan.pk]))
+        return [int(n) for n in re.search(r'data: \[\s*(\d+),\s*(\d+),\s*(\d+),\s*(\d+)', respuesta.content.decode()).groups()]
+
+    def test_se_cachea_por_revision_y_variante(self):
+        plan = self._plan()
+        self.assertEqual(self._render(plan, 1), '1')
+        self.assertEqual(self._render(plan, 2), '1')
+        self.assertEqual(self._render(plan, 2, variante='b'), '2')
+        PlanAnual.incrementar_revision(plan.pk)
+        self.assertEqual(self._render(self._plan(), 3), '3')
+
+    def test_cambios_de_actividades_invalidan_el_detalle(self):
+        self.assertEqual(self._estadisticas(), [self.actividades, 0, 0, 0])
+        flujo.decidir_en_lote(list(bandeja.pendientes_en_turno(self.director).values_list('pk', flat=True)),
+                              self.director, 'R')
+        self.assertEqual(self._estadisticas(), [0, 0, self.actividades, 0])
+        actividad = self._actividades().first()
+        actividad.estado = 'E'
+        actividad.save()
+        self.assertEqual(self._estadisticas(), [0, 0, self.actividades - 1, 1])
+
+    def test_renombrar_el_nivel_invalida_la_lista(self):
+        self.client.force_login(self.director)
+        self.assertContains(self.client.get(reverse('plan_anual_list')), str(self.nivel))
+        nivel = OrganizationLevel.objects.get(pk=self.nivel.pk)
+        nivel.name = 'ARC Renombrado'
+        nivel.save()
+        self.assertContains(self.client.get(reverse('plan_anual_list')), 'ARC Renombrado')
+
+    def test_la_lista_lee_las_filas_de_una_vez(self):
+        self.client.force_login(self.director)
+        self.client.get(reverse('plan_anual_list'))
+        aciertos = LECTURAS_FRAGMENTOS.series.get(('fila_plan', 'hit'), 0)
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            self.assertContains(self.client.get(reverse('plan_anual_list')), str(self.nivel))
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(LECTURAS_FRAGMENTOS.series[('fila_plan', 'hit')], aciertos + 1)
+
+
+class CalendarioTests(OrganizacionMixin, TestCase):
+    arcs = 2
+    rango = {'desde': f"{YEAR}-01-01", 'hasta': f"{YEAR}-12-31"}
+
+    def _get(self, usuario=None, etag=None, **parametros):
+        self.client.force_login(usuario or self.director)
+        cabeceras = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('calendario_actividades'), {**self.rango, **parametros}, **cabeceras)
+
+    def test_columnas_de_lo_visible(self):
+        datos = self._get().json()
+        actividades = list(self._actividades().order_by('fecha_inicio', 'pk'))
+        self.assertEqual(datos['total'], len(actividades))
+        self.assertEqual(datos['columnas']['id'], [actividad.pk for actividad in actividades])
+        self.assertEqual(datos['columnas']['inicio'][0], (actividades[0].fecha_inicio - date(YEAR, 1, 1)).days)
+        self.assertEqual(set(datos['columnas']['plan']), {self.plan.pk})
+        self.assertEqual(set(map(int, datos['responsables'])), {actividad.responsable_id for actividad in actividades})
+        self.assertEqual(self._get(self.director_general).json()['total'], self.actividades * self.arcs)
+
+    def test_etag_y_304(self):
+        respuesta = self._get()
+        etag = respuesta['ETag']
+        self.assertIn('no-cache', respuesta['Cache-Control'])
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self._get(etag=etag).status_code, 304)
+        self.assertFalse(any(ActividadPlanAnual._meta.db_table in consulta['sql']
+                             for consulta in consultas.captured_queries))
+
+        # Un cambio en un plan que el usuario no ve no cambia la ETag
+        otra = ActividadPlanAnual.objects.filter(plan=self.organizacion.planes[1]).first()
+        otra.avance = 10
+        otra.save()
+        self.assertEqual(self._get(etag=etag).status_code, 304)
+
+        actividad = self._actividades().first()
+        actividad.avance = 30
+        actividad.save()
+        respuesta = self._get(etag=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_sacar_una_actividad_del_plan_cambia_la_etag(self):
+        etag = self._get(self.director_general, plan=self.plan.pk)['ETag']
+        actividad = self._actividades().first()
+        actividad.plan = self.organizacion.planes[1]
+        actividad.save()
+        respuesta = self._get(self.director_general, etag=etag, plan=self.plan.pk)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn(actividad.pk, respuesta.json()['columnas']['id'])
+
+    def test_parametros_invalidos(self):
+        for parametros in ({'desde': ''}, {'hasta': 'ayer'}, {'desde': f"{YEAR}-12-31", 'hasta': f"{YEAR}-01-01"},
+                           {'hasta': f"{YEAR + 2}-01-01"}, {'plan': 'x'}):
+            with self.subTest(parametros=parametros):
+                self.assertEqual(self._get(**parametros).status_code, 400)
+
+
+class RenovacionTests(OrganizacionMixin, TestCase):
+
+    def test_desplazar(self):
+        self.assertEqual(renovacion.desplazar(date(2024, 2, 29), 1), date(2025, 2, 28))
+        self.assertEqual(renovacion.desplazar(date(2025, 3, 1), 1), date(2026, 3, 1))
+
+    def test_renueva_al_anio_siguiente(self):
+        flujo.decidir_en_lote(
+            Aprobacion.objects.filter(aprobador=self.director).values_list('pk', flat=True), self.director, 'A'
+        )
+        resultado = renovacion.renovar([self.plan], self.director_general)
+        (origen, nuevo), = resultado.planes
+        self.assertEqual((origen, nuevo.year), (self.plan, YEAR + 1))
+        self.assertEqual(resultado.actividades, self.actividades)
+        self.assertEqual(resultado.aprobaciones, self.actividades * len(self.aprobadores))
+
+        copias = ActividadPlanAnual.objects.filter(plan=nuevo).order_by('fecha_inicio', 'pk')
+        originales = self._actividades().order_by('fecha_inicio', 'pk')
+        for copia, original in zip(copias, originales):
+            self.assertEqual(copia.fecha_inicio, renovacion.desplazar(original.fecha_inicio, 1))
+            self.assertEqual((copia.estado, copia.avance, copia.orden_pendiente), ('P', 0, 1))
+            self.assertEqual(copia.aprobaciones.filter(estado='P').count(), len(self.aprobadores))
+
+    def test_omite_planes_que_no_se_pueden_renovar(self):
+        renovacion.renovar([self.plan], self.director_general)
+        resultado = renovacion.renovar([self.plan], self.director_general)
+        self.assertEqual(resultado.planes, [])
+        self.assertEqual(resultado.omitidos, [(self.plan, f"el nivel ya tiene plan para {YEAR + 1}")])
+
+        resultado = renovacion.renovar([self.plan], self.director_general, year=2031)
+        self.assertEqual(resultado.omitidos, [(self.plan, 'el año 2031 no está disponible')])
+
+    def test_omite_actividades_de_responsables_inactivos(self):
+        responsable_id = self._actividades().first().responsable_id
+        User.objects.filter(pk=responsable_id).update(is_active=False)
+        omitidas = self._actividades().filter(responsable_id=responsable_id).count()
+
+        resultado = renovacion.renovar([self.plan], self.director_general)
+        self.assertEqual(resultado.actividades_omitidas, omitidas)
+        self.assertEqual(resultado.actividades, self.actividades - omitidas)
+
+
+class BusquedaTests(OrganizacionMixin, TestCase):
+    actividades = 0
+    arcs = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.otro_plan = cls.organizacion.planes[1]
+        otro_especialista = User.objects.filter(
+            organization_level=cls.otro_plan.organization_level, position='ESP_ARC'
+        ).first()
+        for plan, especialista, filas in (
+            (cls.plan, cls.especialista, (('Revisar inventario', 'Almacén'),
+                                          ('Auditar contratos', 'Revisión de anexos'))),
+            (cls.otro_plan, otro_especialista, (('Revisar contratos', ''),)),
+        ):
+            resultado = importar_filas(plan, [
+                {'nombre': nombre, 'descripcion': descripcion, 'responsable': especialista.username,
+                 'fecha_inicio': date(YEAR, 5, 1), 'fecha_fin': date(YEAR, 5, 2)}
+                for nombre, descripcion in filas
+            ])
+            assert resultado.correcto, resultado.errores
+
+    def _nombres(self, usuario, texto, **filtros):
+        actividades, _hay_mas = Consulta(usuario, texto, filtros).pagina()
+        return [actividad.nombre for actividad in actividades]
+
+    def test_solo_devuelve_lo_visible(self):
+        self.assertEqual(self._nombres(self.director, 'revis'), ['Revisar inventario', 'Auditar contratos'])
+        self.assertEqual(
+            sorted(self._nombres(self.director_general, 'revisar')), ['Revisar contratos', 'Revisar inventario']
+        )
+        sin_nivel = User.objects.create(username='sin_nivel')
+        self.assertEqual(self._nombres(sin_nivel, 'revisar'), [])
+
+    def test_todos_los_terminos_y_filtros(self):
+        self.assertEqual(self._nombres(self.director_general, 'revisar contratos'), ['Revisar contratos'])
+        self.assertEqual(self._nombres(self.director_general, 'contratos', nivel=self.nivel.pk),
+                         ['Auditar contratos'])
+        self.assertEqual(self._nombres(self.director_general, 'revisar', estado='A'), [])
+        self.assertEqual(self._nombres(self.director_general, 'revisar', year=YEAR + 1), [])
+
+    def test_el_indice_sigue_las_modificaciones(self):
+        actividad = self._actividades().get(nombre='Revisar inventario')
+        actividad.nombre = 'Inspeccionar inventario'
+        actividad.save()
+        self.assertEqual(self._nombres(self.director, 'inspeccionar'), ['Inspeccionar inventario'])
+        self.assertEqual(self._nombres(self.director, 'inventario revisar'), [])
+
+    def test_paginacion(self):
+        consulta = Consulta(self.director_general, 'revisar')
+        self.assertEqual(consulta.siguiente(False), None)
+        self.assertEqual(consulta.siguiente(True), 25)
+        self.assertEqual(Consulta(self.director_general, 'revisar', desde=480).siguiente(True), None)
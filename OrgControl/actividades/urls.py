@@ -3,7 +3,21 @@ from .views import (
     PlanAnualCreateView,
     ActividadCreateView,
     PlanAnualDetailView,
-    PlanAnualListView
+    PlanAnualListView,
+    ImportarActividadesView,
+    ActividadesPlanDataView,
+    AprobacionesPendientesListView,
+    AprobacionesPendientesDataView,
+    DecidirAprobacionesView,
+    BandejaEventosView,
+    PlanEventosView,
+    CalendarioActividadesView,
+    BuscarActividadesView,
+    BuscarActividadesDataView,
+    AprobarActividadView,
+    GenerarReportePDF,
+    GenerarReporteExcel,
+    GenerarReporteCSV
 )
 
 
@@ -13,5 +27,19 @@ urlpatterns = [
     path('planes/', PlanAnualListView.as_view(), name='plan_anual_list'),
     path('planes/nuevo/', PlanAnualCreateView.as_view(), name='plan_anual_create'),
     path('planes/<int:pk>/', PlanAnualDetailView.as_view(), name='plan_anual_detail'),
+    path('planes/<int:pk>/eventos/', PlanEventosView.as_view(), name='plan_eventos'),
     path('planes/<int:plan_id>/actividad/nueva/', ActividadCreateView.as_view(), name='actividad_create'),
+    path('planes/<int:plan_id>/actividades/datos/', ActividadesPlanDataView.as_view(), name='plan_actividades_data'),
+    path('planes/<int:plan_id>/importar/', ImportarActividadesView.as_view(), name='actividades_importar'),
+    path('planes/<int:plan_id>/reporte/pdf/', GenerarReportePDF.as_view(), name='generar_reporte_pdf'),
+    path('planes/<int:plan_id>/reporte/excel/', GenerarReporteExcel.as_view(), name='generar_reporte_excel'),
+    path('planes/<int:plan_id>/reporte/csv/', GenerarReporteCSV.as_view(), name='generar_reporte_csv'),
+    path('actividades/calendario/', CalendarioActividadesView.as_view(), name='calendario_actividades'),
+    path('actividades/buscar/', BuscarActividadesView.as_view(), name='buscar_actividades'),
+    path('actividades/buscar/datos/', BuscarActividadesDataView.as_view(), name='buscar_actividades_data'),
+    path('aprobaciones/', AprobacionesPendientesListView.as_view(), name='aprobaciones_pendientes'),
+    path('aprobaciones/datos/', AprobacionesPendientesDataView.as_view(), name='aprobaciones_pendientes_data'),
+    path('aprobaciones/eventos/', BandejaEventosView.as_view(), name='aprobaciones_eventos'),
+    path('aprobaciones/decidir/', DecidirAprobacionesView.as_view(), name='decidir_aprobaciones'),
+    path('aprobaciones/<int:pk>/aprobar/', AprobarActividadView.as_view(), name='aprobar_actividad'),
 ]
\ No newline at end of file
@@ -1,25 +1,59 @@
-from http.client import HTTPResponse
+import json
+import tempfile
 
-from django.views.generic import CreateView, UpdateView, ListView, DetailView
-from django.urls import reverse_lazy
+from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import condition
+from django.utils.html import escape, format_html
+from django.views.generic import CreateView, UpdateView, ListView, DetailView, FormView, TemplateView
+from django.urls import reverse, reverse_lazy
+from OrgControl.datatables import Columna, DataTablesView
+from OrgControl.eventos import respuesta_sse
+from OrgControl.asincrono import LoginRequiredAsyncMixin
+from OrgControl.routers import ReplicaMixin, alias_lectura
 from django.contrib.auth.mixins import LoginRequiredMixin
-from .models import PlanAnual, ActividadPlanAnual
-from .forms import PlanAnualForm, ActividadPlanAnualForm
-from openpyxl import Workbook
+from . import bandeja, busqueda, calendario, eventos, flujo
+from .models import PlanAnual, ActividadPlanAnual, Aprobacion
+from .forms import PlanAnualForm, ActividadPlanAnualForm, ImportarActividadesForm, DecisionAprobacionForm
+from .importacion import importar_archivo
+from .reportes import CONTENT_TYPE_EXCEL, MEMORIA_MAXIMA_ARCHIVO, escribir_excel, lineas_csv, abrir_pdf
 from django.views import View
+from users import scope
 
-class PlanAnualListView(LoginRequiredMixin, ListView):
+User = get_user_model()
+
+
+def planes_visibles(user):
+    """Planes de los niveles organizacionales que `user` puede ver"""
+    return scope.restrict(PlanAnual.objects.select_related('organization_level'), user)
+
+
+def puede_gestionar(user, plan):
+    """Crear planes e importar actividades queda para el director del nivel"""
+    return user.is_superuser or plan.organization_level.director_id == user.pk
+
+
+class PlanAnualListView(LoginRequiredAsyncMixin, ReplicaMixin, ListView):
     model = PlanAnual
     template_name = 'actividades/plan_anual_list.html'
     context_object_name = 'planes'
 
+    async def get(self, request, *args, **kwargs):
+        # El alcance del usuario se resuelve (caché o base de datos) antes de armar la consulta
+        await sync_to_async(scope.visible_level_ids)(request.user)
+        self.object_list = [plan async for plan in self.get_queryset()]
+        return self.render_to_response(self.get_context_data())
+
     def get_queryset(self):
-        queryset = super().get_queryset()
-        if not self.request.user.is_superuser:
-            queryset = queryset.filter(
-                organization_level__director=self.request.user
-            )
-        return queryset.select_related('organization_level', 'created_by')
+        return planes_visibles(self.request.user).select_related('created_by')
 
 class PlanAnualCreateView(LoginRequiredMixin, CreateView):
     model = PlanAnual
@@ -40,99 +74,349 @@ class PlanAnualDetailView(LoginRequiredMixin, DetailView):
     template_name = 'actividades/plan_anual_detail.html'
     context_object_name = 'plan'
 
+    def get_queryset(self):
+        return planes_visibles(self.request.user)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['actividades'] = self.object.actividades.all()
+        context['puede_importar'] = puede_gestionar(self.request.user, self.object)
+        # Las filas de la tabla las entrega ActividadesPlanDataView. Las
+        # estadísticas solo se calculan si el fragmento no está en caché
+        context['estadisticas'] = SimpleLazyObject(lambda: self.object.actividades.aggregate(
+            pendientes=Count('pk', filter=Q(estado='P')),
+            aprobadas=Count('pk', filter=Q(estado='A')),
+            rechazadas=Count('pk', filter=Q(estado='R')),
+            en_progreso=Count('pk', filter=Q(estado='E'))
+        ))
         return context
 
+
+class ActividadesPlanDataView(LoginRequiredMixin, DataTablesView):
+    columnas = (
+        Columna('nombre', orden='nombre', busqueda='nombre__icontains'),
+        Columna('responsable', orden=('responsable__last_name', 'responsable__first_name'),
+                busqueda=('responsable__first_name__icontains', 'responsable__last_name__icontains')),
+        Columna('fechas', orden=('fecha_inicio', 'fecha_fin')),
+        Columna('estado', orden='estado'),
+        Columna('avance', orden='avance'),
+        Columna('acciones'),
+    )
+
+    def version_cache(self):
+        # Las filas no dependen del usuario, solo de que pueda ver el plan
+        return planes_visibles(self.request.user).filter(
+            pk=self.kwargs['plan_id']
+        ).values_list('revision', flat=True).first()
+
+    def get_queryset(self):
+        return scope.restrict(
+            ActividadPlanAnual.objects.filter(plan_id=self.kwargs['plan_id']),
+            self.request.user,
+            'plan__organization_level'
+        ).select_related('responsable')
+
+    def fila(self, actividad):
+        color = {'A': 'success', 'R': 'danger'}.get(actividad.estado, 'warning')
+        return {
+            # Para ubicar la fila al recibir cambios en vivo (ver PlanEventosView)
+            'DT_RowId': f"actividad-{actividad.pk}",
+            'nombre': escape(actividad.nombre),
+            'responsable': escape(actividad.responsable.get_full_name()),
+            'fechas': f"{actividad.fecha_inicio:%d/%m/%Y} - {actividad.fecha_fin:%d/%m/%Y}",
+            'estado': format_html('<span class="badge bg-{}">{}</span>', color, actividad.get_estado_display()),
+            'avance': format_html(
+                '<div class="progress" style="height: 20px;">'
+                '<div class="progress-bar" role="progressbar" style="width: {0}%" aria-valuenow="{0}" '
+                'aria-valuemin="0" aria-valuemax="100">{0}%</div></div>',
+                actividad.avance
+            ),
+            'acciones': format_html(
+                '<div class="btn-group btn-group-sm">'
+                '<a href="#" class="btn btn-primary" title="Editar"><i class="fas fa-edit"></i></a>'
+                '<a href="#" class="btn btn-info" title="Aprobaciones"><i class="fas fa-check-double"></i></a>'
+                '</div>'
+            ),
+        }
+
 class ActividadCreateView(LoginRequiredMixin, CreateView):
     model = ActividadPlanAnual
     form_class = ActividadPlanAnualForm
     template_name = 'actividades/actividad_form.html'
 
+    def dispatch(self, request, *args, **kwargs):
+        self.plan = get_object_or_404(planes_visibles(request.user), pk=kwargs['plan_id'])
+        return super().dispatch(request, *args, **kwargs)
+
     def get_success_url(self):
-        return reverse_lazy('plan_anual_detail', kwargs={'pk': self.kwargs['plan_id']})
+        return reverse_lazy('plan_anual_detail', kwargs={'pk': self.plan.pk})
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
-        kwargs['plan_id'] = self.kwargs['plan_id']
+        kwargs['plan'] = self.plan
         return kwargs
 
+
+class ImportarActividadesView(LoginRequiredMixin, FormView):
+    form_class = ImportarActividadesForm
+    template_name = 'actividades/importar_actividades.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        self.plan = get_object_or_404(planes_visibles(request.user), pk=kwargs['plan_id'])
+        if not puede_gestionar(request.user, self.plan):
+            raise PermissionDenied
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['plan'] = self.plan
+        return context
+
+    def get_success_url(self):
+        return reverse_lazy('plan_anual_detail', kwargs={'pk': self.plan.pk})
+
     def form_valid(self, form):
-        plan = PlanAnual.object.get(id=self.kwargs['plan_id'])
-        form.instance.plan = plan
+        archivo = form.cleaned_data['archivo']
+        resultado = importar_archivo(self.plan, archivo, archivo.name)
+        if not resultado.correcto:
+            for fila, mensaje in resultado.errores[:50]:
+                form.add_error('archivo', f"Fila {fila}: {mensaje}" if fila else mensaje)
+            return self.form_invalid(form)
+
+        messages.success(
+            self.request,
+            f"Se importaron {resultado.actividades} actividades "
+            f"y {resultado.aprobaciones} aprobaciones"
+        )
         return super().form_valid(form)
 
 
-class AprobacionesPendientesListView(LoginRequiredMixin, ListView):
-    model = Aprobacion
+class AprobacionesPendientesListView(LoginRequiredMixin, TemplateView):
+    # Las filas las entrega AprobacionesPendientesDataView página a página
     template_name = 'actividades/aprobaciones_pendientes.html'
-    context_object_name = 'aprobaciones'
+
+
+class AprobacionesPendientesDataView(LoginRequiredMixin, DataTablesView):
+    columnas = (
+        Columna('seleccion'),
+        Columna('actividad', orden='actividad__nombre', busqueda='actividad__nombre__icontains'),
+        Columna('plan', orden=('actividad__plan__year', 'actividad__plan__organization_level__name'),
+                busqueda='actividad__plan__organization_level__name__icontains'),
+        Columna('responsable', orden=('actividad__responsable__last_name', 'actividad__responsable__first_name'),
+                busqueda=('actividad__responsable__first_name__icontains',
+                          'actividad__responsable__last_name__icontains')),
+        Columna('fechas', orden=('actividad__fecha_inicio', 'actividad__fecha_fin')),
+        Columna('acciones', orden='orden'),
+    )
+    # En el orden de los turnos se pagina por conjunto de claves (ver bandeja.py)
+    claves = bandeja.CLAVES
 
     def get_queryset(self):
-        return self.request.user.aprobaciones_pendientes.filter(estado='P')
+        return bandeja.pendientes_en_turno(self.request.user).select_related(
+            'actividad__plan__organization_level',
+            'actividad__responsable'
+        )
+
+    def fila(self, aprobacion):
+        actividad = aprobacion.actividad
+        return {
+            'seleccion': format_html(
+                '<input type="checkbox" class="form-check-input seleccion-aprobacion" value="{}">',
+                aprobacion.pk
+            ),
+            'actividad': escape(actividad.nombre),
+            'plan': escape(actividad.plan),
+            'responsable': escape(actividad.responsable.get_full_name()),
+            'fechas': f"{actividad.fecha_inicio:%d/%m/%Y} - {actividad.fecha_fin:%d/%m/%Y}",
+            'acciones': format_html(
+                '<a href="{}" class="btn btn-sm btn-success" title="Revisar">'
+                '<i class="fas fa-clipboard-check"></i> Revisar</a>',
+                reverse('aprobar_actividad', args=[aprobacion.pk])
+            ),
+        }
+
+
+class BandejaEventosView(LoginRequiredAsyncMixin, View):
+    """Flujo SSE con el total y las primeras aprobaciones en turno del usuario"""
+    async def get(self, request):
+        return respuesta_sse(request, eventos.flujo_bandeja(request.user))
+
+
+class DecidirAprobacionesView(LoginRequiredMixin, View):
+    """
+    Decisión en lote. Recibe JSON {"ids": [...], "estado": "A"|"R",
+    "comentarios": "..."} y responde con las aprobaciones aplicadas y las
+    omitidas con su motivo.
+    """
+    def post(self, request):
+        try:
+            datos = json.loads(request.body)
+            ids = [int(pk) for pk in datos.get('ids', [])]
+            estado = str(datos.get('estado', ''))
+            comentarios = str(datos.get('comentarios', ''))
+        except (ValueError, TypeError, AttributeError):
+            return JsonResponse({'error': 'Solicitud inválida'}, status=400)
+
+        try:
+            resultado = flujo.decidir_en_lote(ids, request.user, estado, comentarios)
+        except ValidationError as error:
+            return JsonResponse({'error': ' '.join(error.messages)}, status=400)
+
+        return JsonResponse({
+            'aplicadas': resultado.aplicadas,
+            'omitidas': [{'id': pk, 'motivo': motivo} for pk, motivo in resultado.omitidas.items()],
+        })
+
+
+class PlanEventosView(LoginRequiredAsyncMixin, View):
+    """Flujo SSE con los cambios de estado y avance de las actividades del plan"""
+    async def get(self, request, pk):
+        await sync_to_async(scope.visible_level_ids)(request.user)
+        if not await planes_visibles(request.user).filter(pk=pk).aexists():
+            raise Http404
+        return respuesta_sse(request, eventos.flujo_plan(pk))
+
+
+def _etag_calendario(request, *args, **kwargs):
+    try:
+        request.calendario = calendario.leer(request)
+    except ValidationError:
+        return None
+    return calendario.etag(request.calendario)
+
+
+class CalendarioActividadesView(LoginRequiredMixin, View):
+    """
+    Actividades que se superponen con ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD,
+    opcionalmente de un plan, nivel o responsable (ver actividades/calendario.py).
+    Responde 304 si ningún plan consultado cambió desde la ETag recibida.
+    """
+    @method_decorator(condition(etag_func=_etag_calendario))
+    def get(self, request):
+        consulta = getattr(request, 'calendario', None)
+        if consulta is None:
+            try:
+                consulta = calendario.leer(request)
+            except ValidationError as error:
+                return JsonResponse({'error': ' '.join(error.messages)}, status=400)
+        response = JsonResponse(calendario.datos(consulta))
+        # El navegador guarda la respuesta pero la revalida con la ETag en cada sondeo
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class BuscarActividadesView(LoginRequiredMixin, ReplicaMixin, TemplateView):
+    template_name = 'actividades/buscar_actividades.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        user = self.request.user
+        context['years'] = PlanAnual.YEAR_CHOICES
+        context['niveles'] = scope.visible_levels(user).order_by('path')
+        context['estados'] = ActividadPlanAnual.ESTADO_CHOICES
+        context['responsables'] = scope.restrict(
+            User.objects.filter(is_active=True), user
+        ).order_by('last_name', 'first_name')
+        if 'q' not in self.request.GET:
+            return context
+        try:
+            consulta = busqueda.leer(self.request)
+        except ValidationError as error:
+            context['error'] = ' '.join(error.messages)
+            return context
+        context['actividades'], hay_mas = consulta.pagina()
+        siguiente = consulta.siguiente(hay_mas)
+        if siguiente is not None:
+            parametros = self.request.GET.copy()
+            parametros['desde'] = siguiente
+            context['siguiente'] = parametros.urlencode()
+        return context
+
+
+class BuscarActividadesDataView(LoginRequiredMixin, ReplicaMixin, View):
+    """
+    Búsqueda en JSON: ?q=texto y, opcionalmente, year, nivel, estado,
+    responsable y desde (ver actividades/busqueda.py).
+    """
+    def get(self, request):
+        try:
+            consulta = busqueda.leer(request)
+        except ValidationError as error:
+            return JsonResponse({'error': ' '.join(error.messages)}, status=400)
+        actividades, hay_mas = consulta.pagina()
+        return JsonResponse({
+            'resultados': [busqueda.resultado(actividad) for actividad in actividades],
+            'siguiente': consulta.siguiente(hay_mas),
+        })
 
 
 class AprobarActividadView(LoginRequiredMixin, UpdateView):
     model = Aprobacion
-    fields = ['estado', 'comentarios']
+    form_class = DecisionAprobacionForm
     template_name = 'actividades/aprobar_actividad.html'
 
+    def get_queryset(self):
+        # Solo las aprobaciones propias a las que ya les toca el turno
+        return bandeja.pendientes_en_turno(self.request.user).select_related(
+            'actividad__plan__organization_level',
+            'actividad__responsable'
+        )
+
     def get_success_url(self):
         return reverse_lazy('aprobaciones_pendientes')
 
     def form_valid(self, form):
-        response = super().form_valid(form)
-        self.object.actividad.verificar_estado_aprobacion()
-        return response
+        try:
+            flujo.registrar_decision(
+                self.object,
+                self.request.user,
+                form.cleaned_data['estado'],
+                form.cleaned_data['comentarios']
+            )
+        except ValidationError as error:
+            form.add_error(None, error)
+            return self.form_invalid(form)
+        return redirect(self.get_success_url())
 
 
-class GenerarReportePDF(View):
+class GenerarReportePDF(LoginRequiredMixin, ReplicaMixin, View):
     def get(self, request, plan_id):
-        response = HTTPResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="plan_{plan_id}.pdf"'
+        plan = get_object_or_404(planes_visibles(request.user), pk=plan_id)
+        return FileResponse(
+            abrir_pdf(plan),
+            as_attachment=True,
+            filename=f"plan_{plan_id}.pdf",
+            content_type='application/pdf'
+        )
 
-        p = canvas.Canvas(response)
-        plan = PlanAnual.objects.get(id=plan_id)
 
-        # Cabecera
-        p.drawString(100, 800, f"Plan Anual {plan.year}")
-        p.drawString(100, 780, f"Nivel: {plan.organization_level}")
+class GenerarReporteExcel(LoginRequiredMixin, ReplicaMixin, View):
+    def get(self, request, plan_id):
+        plan = get_object_or_404(planes_visibles(request.user), pk=plan_id)
 
-        # Contenido
-        y = 750
-        for actividad in plan.actividades.all():
-            p.drawString(100, y, f"- {actividad.nombre} ({actividad.get_estado_display()})")
-            y -= 20
+        # El libro se escribe en un archivo temporal que solo pasa a disco si crece
+        archivo = tempfile.SpooledTemporaryFile(max_size=MEMORIA_MAXIMA_ARCHIVO)
+        escribir_excel(plan, archivo)
+        archivo.seek(0)
 
-        p.showPage()
-        p.save()
-        return response
+        return FileResponse(
+            archivo,
+            as_attachment=True,
+            filename=f"plan_{plan_id}.xlsx",
+            content_type=CONTENT_TYPE_EXCEL
+        )
 
 
-class GenerarReporteExcel(View):
-    def get(self, request, plan_id):
-        response = HTTPResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = f'attachment; filename="plan_{plan_id}.xlsx"'
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = f"Plan {plan_id}"
-
-        plan = PlanAnual.objects.get(id=plan_id)
-
-        # Cabecera
-        ws.append(['Plan Anual', plan.year, plan.organization_level.name])
-        ws.append([])
-        ws.append(['Actividad', 'Responsable', 'Estado', 'Avance'])
-        # Datos
-        for actividad in plan.actividades.all():
-            ws.append([
-                actividad.nombre,
-                actividad.responsable.get_full_name(),
-                actividad.get_estado_display(),
-                f"{actividad.avance}%"
-            ])
-
-        wb.save(response)
-        return response
\ No newline at end of file
+class GenerarReporteCSV(LoginRequiredAsyncMixin, ReplicaMixin, View):
+    async def get(self, request, plan_id):
+        await sync_to_async(scope.visible_level_ids)(request.user)
+        try:
+            plan = await planes_visibles(request.user).aget(pk=plan_id)
+        except PlanAnual.DoesNotExist:
+            raise Http404
+
+        response = StreamingHttpResponse(
+            lineas_csv(plan, using=alias_lectura()),
+            content_type='text/csv; charset=utf-8'
+        )
+        response['Content-Disposition'] = f'attachment; filename="plan_{plan_id}.csv"'
+        return response
@@ -7,3 +7,5 @@ class UsersConfig(AppConfig):
 
     def ready(self):
         import users.signals
+        from users.cache import require_shared_cache
+        require_shared_cache()
@@ -0,0 +1,100 @@
+"""
+Caché de la configuración organizacional que casi nunca cambia.
+
+Las entradas se guardan bajo una versión; al modificar la configuración
+(ver users/signals.py) basta con incrementar la versión para que todas las
+entradas anteriores dejen de leerse, sin tener que borrar clave por clave.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+
+from OrgControl import metrics
+
+APPROVERS_VERSION_KEY = 'users:approvers:version'
+APPROVERS_TIMEOUT = 60 * 60 * 24
+# Backends cuyo contenido no ven los demás procesos
+PER_PROCESS_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+LOOKUPS = metrics.contador(
+    'orgcontrol_approver_cache_total',
+    'Lecturas de la caché de cadenas de aprobadores', ('module', 'result')
+)
+
+
+def require_shared_cache():
+    """
+    Sin DEBUG exige una caché compartida: con una por proceso, el
+    incremento de versión de un proceso no llega a los demás, que seguirían
+    usando cadenas de aprobadores y alcances obsoletos hasta que expiren.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if not settings.DEBUG and backend in PER_PROCESS_BACKENDS:
+        raise ImproperlyConfigured(
+            f"La caché 'default' ({backend}) no se comparte entre procesos; "
+            "configure ORGCONTROL_REDIS_URL o un backend compartido en CACHES."
+        )
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Se parte de una marca de tiempo para no reutilizar versiones antiguas
+        # si la clave fue expulsada de la caché
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def get_approver_ids(module, organization_level_id):
+    """
+    Ids de los aprobadores de `module` para un nivel organizacional, en orden.
+
+    La cadena se compone de los directores del nivel hacia la raíz, seguidos
+    de los roles de ApprovalFlow por `approval_order`, sin repetir usuarios.
+    """
+    key = f"users:approvers:{get_version(APPROVERS_VERSION_KEY)}:{module}:{organization_level_id}"
+    approver_ids = cache.get(key)
+    if approver_ids is not None:
+        LOOKUPS.incrementar(module, 'hit')
+        return approver_ids
+
+    LOOKUPS.incrementar(module, 'miss')
+    approver_ids = _resolve_approver_ids(module, organization_level_id)
+    cache.set(key, approver_ids, APPROVERS_TIMEOUT)
+    return approver_ids
+
+
+def invalidate_approvers():
+    bump_version(APPROVERS_VERSION_KEY)
+
+
+def _resolve_approver_ids(module, organization_level_id):
+    from .models import ApproverRole, OrganizationLevel
+
+    # De la primaria aunque la petición lea de la réplica: la cadena se
+    # comparte en la caché bajo la versión vigente (ver users/scope.py)
+    levels = OrganizationLevel.objects.using(DEFAULT_DB_ALIAS)
+    chain = []
+    if organization_level_id is not None:
+        level = levels.only('pk', 'path').get(pk=organization_level_id)
+        chain += levels.ancestors_of(level).filter(
+            director__isnull=False
+        ).values_list('director_id', flat=True)
+
+    chain += ApproverRole.objects.using(DEFAULT_DB_ALIAS).filter(
+        flow__module=module,
+        approval_order__gt=0
+    ).order_by('approval_order').values_list('user_id', flat=True)
+
+    return tuple(dict.fromkeys(chain))
@@ -0,0 +1,29 @@
+"""
+Consultas frecuentes de usuarios, revisadas por explicar_consultas.
+"""
+from OrgControl.consultas_calientes import registrar
+from . import directory
+from .models import CustomUser, OrganizationLevel
+
+
+@registrar('users.directory')
+def directory_page():
+    """Primera página del directorio, por apellido y nombre"""
+    return directory.page_queryset()
+
+
+@registrar('users.user_list')
+def user_list():
+    """Primera página de la tabla de usuarios, por apellido y nombre"""
+    return CustomUser.objects.select_related('organization_level', 'boss').order_by(
+        'last_name', 'first_name', 'pk'
+    )[:25]
+
+
+@registrar('users.descendants')
+def descendants():
+    """Niveles que cuelgan de un nivel (alcance de visibilidad de un director)"""
+    level = OrganizationLevel.objects.filter(parent__isnull=True).first()
+    if level is None:
+        return None
+    return OrganizationLevel.objects.descendants_of(level).values_list('pk', flat=True)
@@ -0,0 +1,115 @@
+"""
+Directorio de personal.
+
+Cada UserProfile guarda en `search_document` el texto buscable (nombre,
+usuario, cargo, nivel organizacional, teléfono y dirección), recalculado al
+guardar el perfil, el usuario o el nivel. Sobre esa columna:
+
+- PostgreSQL: índice GIN con gin_trgm_ops (pg_trgm), que resuelve los
+  ILIKE '%término%' sin recorrer la tabla.
+- SQLite: tabla virtual FTS5 users_directory_fts con contenido externo,
+  mantenida por triggers (ver la migración 0004).
+
+Los resultados se paginan por conjunto de claves (apellidos, nombre, id),
+apoyado en el índice de CustomUser sobre esas columnas.
+"""
+import base64
+import binascii
+import json
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import UserProfile
+
+PAGE_SIZE = 25
+FTS_TABLE = 'users_directory_fts'
+
+
+class DirectoryPage:
+    def __init__(self, profiles, next_cursor=None):
+        self.profiles = profiles
+        self.next_cursor = next_cursor
+
+
+def build_search_document(profile):
+    user = profile.user
+    level = user.organization_level
+    parts = (
+        user.first_name,
+        user.last_name,
+        user.username,
+        user.get_position_display(),
+        level.name if level else '',
+        profile.phone,
+        profile.address,
+    )
+    return ' '.join(' '.join(str(part).split()) for part in parts if part)
+
+
+def refresh_search_documents(profiles):
+    """Recalcula `search_document` de varios perfiles con un solo UPDATE"""
+    changed = []
+    for profile in profiles:
+        document = build_search_document(profile)
+        if document != profile.search_document:
+            profile.search_document = document
+            changed.append(profile)
+    UserProfile.objects.bulk_update(changed, ['search_document'], batch_size=500)
+    return len(changed)
+
+
+def _fts_query(terms):
+    # Cada término entre comillas (sin operadores FTS5) y como prefijo
+    return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+
+def search(query):
+    """Perfiles cuyo documento contiene todos los términos de `query`"""
+    queryset = UserProfile.objects.select_related('user__organization_level')
+    terms = query.split()
+    if not terms:
+        return queryset
+    if connection.vendor == 'sqlite':
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (_fts_query(terms),)
+        ))
+    for term in terms:
+        queryset = queryset.filter(search_document__icontains=term)
+    return queryset
+
+
+def read_cursor(text):
+    """Decodifica el cursor de la página siguiente; devuelve None si no es válido"""
+    try:
+        last_name, first_name, user_id = json.loads(base64.urlsafe_b64decode((text or '').encode()))
+        return str(last_name), str(first_name), int(user_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+
+
+def _make_cursor(profile):
+    key = [profile.user.last_name, profile.user.first_name, profile.user_id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def page_queryset(query='', after=None, size=PAGE_SIZE):
+    """Queryset de una página; se pide un perfil de más para saber si hay otra"""
+    queryset = search(query).order_by('user__last_name', 'user__first_name', 'user_id')
+    if after:
+        last_name, first_name, user_id = after
+        queryset = queryset.filter(
+            Q(user__last_name__gt=last_name)
+            | Q(user__last_name=last_name, user__first_name__gt=first_name)
+            | Q(user__last_name=last_name, user__first_name=first_name, user_id__gt=user_id)
+        )
+    return queryset[:size + 1]
+
+
+def page(query='', after=None, size=PAGE_SIZE):
+    profiles = list(page_queryset(query, after, size))
+    if len(profiles) <= size:
+        return DirectoryPage(profiles)
+    profiles = profiles[:size]
+    return DirectoryPage(profiles, _make_cursor(profiles[-1]))
@@ -0,0 +1,169 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    OrganizationLevel = apps.get_model('users', 'OrganizationLevel')
+    parents = dict(OrganizationLevel.objects.values_list('pk', 'parent_id'))
+
+    def build(pk):
+        chain = []
+        while pk is not None:
+            chain.append(pk)
+            pk = parents.get(pk)
+        return ''.join(f"{node}/" for node in reversed(chain)), len(chain) - 1
+
+    for pk in parents:
+        path, depth = build(pk)
+        OrganizationLevel.objects.filter(pk=pk).update(path=path, depth=depth)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0002_userprofile'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='approverrole',
+            options={'ordering': ['approval_order'], 'verbose_name': 'Rol de Aprobación', 'verbose_name_plural': 'Roles de Aprobación'},
+        ),
+        migrations.AlterModelOptions(
+            name='customuser',
+            options={'ordering': ['last_name', 'first_name'], 'verbose_name': 'Usuario', 'verbose_name_plural': 'Usuarios'},
+        ),
+        migrations.AlterModelOptions(
+            name='organizationlevel',
+            options={'verbose_name': 'Nivel Organizacional', 'verbose_name_plural': 'Niveles Organizacionales'},
+        ),
+        migrations.AlterModelOptions(
+            name='userprofile',
+            options={'verbose_name': 'Perfil de Usuario', 'verbose_name_plural': 'Perfiles de Usuario'},
+        ),
+        migrations.AddField(
+            model_name='organizationlevel',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Profundidad'),
+        ),
+        migrations.AddField(
+            model_name='organizationlevel',
+            name='director',
+            field=models.ForeignKey(help_text='Usuario responsable de este nivel', limit_choices_to={'profile__position__in': ['DG', 'DIR_ARC', 'DIR_UEB']}, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='directed_levels', to=settings.AUTH_USER_MODEL, verbose_name='Director a cargo'),
+        ),
+        migrations.AddField(
+            model_name='organizationlevel',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, help_text="Ids de la raíz hasta este nivel, p. ej. '1/4/9/'", max_length=255, verbose_name='Ruta jerárquica'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='signature',
+            field=models.ImageField(blank=True, help_text='Firma escaneada para documentos oficiales', null=True, upload_to='signatures/', verbose_name='Firma Digital'),
+        ),
+        migrations.AlterField(
+            model_name='approvalflow',
+            name='approvers',
+            field=models.ManyToManyField(through='users.ApproverRole', to=settings.AUTH_USER_MODEL, verbose_name='Aprobadores'),
+        ),
+        migrations.AlterField(
+            model_name='approvalflow',
+            name='module',
+            field=models.CharField(choices=[('annual_plan', 'Plan Anual'), ('monthly_plan', 'Plan Mensual'), ('individual_plan', 'Plan Individual'), ('risks', 'Gestión de Riesgos'), ('non_conformity', 'No Conformidades')], max_length=20, unique=True, verbose_name='Módulo'),
+        ),
+        migrations.AlterField(
+            model_name='approverrole',
+            name='approval_order',
+            field=models.PositiveIntegerField(help_text='Orden en el que este usuario debe aprobar (1=primero)', verbose_name='Orden de Aprobación'),
+        ),
+        migrations.AlterField(
+            model_name='approverrole',
+            name='flow',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.approvalflow', verbose_name='Flujo'),
+        ),
+        migrations.AlterField(
+            model_name='approverrole',
+            name='role_name',
+            field=models.CharField(max_length=100, verbose_name='Nombre del Rol'),
+        ),
+        migrations.AlterField(
+            model_name='approverrole',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Usuario'),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='boss',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='subordinates', to=settings.AUTH_USER_MODEL, verbose_name='Supervisor Directo'),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='organization_level',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='members', to='users.organizationlevel', verbose_name='Nivel Organizacional'),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='position',
+            field=models.CharField(choices=[('DG', 'Director General'), ('DIR_ARC', 'Director de ARC'), ('DIR_UEB', 'Director de UEB'), ('ESP_ARC', 'Especialista de ARC'), ('ESP_UEB', 'Especialista de UEB'), ('ADMIN', 'Administrador del Sistema')], default='ESP_ARC', max_length=10, verbose_name='Cargo'),
+        ),
+        migrations.AlterField(
+            model_name='organizationlevel',
+            name='level_type',
+            field=models.CharField(choices=[('CENTRAL', 'Oficina Central'), ('ARC', 'Área de Regulación y Control'), ('UEB', 'Unidad Empresarial de Base')], help_text='Tipo de nivel en la jerarquía organizacional', max_length=10, verbose_name='Tipo de nivel'),
+        ),
+        migrations.AlterField(
+            model_name='organizationlevel',
+            name='name',
+            field=models.CharField(help_text='Nombre descriptivo del nivel organizacional', max_length=100, verbose_name='Nombre'),
+        ),
+        migrations.AlterField(
+            model_name='organizationlevel',
+            name='parent',
+            field=models.ForeignKey(blank=True, help_text='Nivel organizacional al que reporta', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='users.organizationlevel', verbose_name='Nivel superior'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='address',
+            field=models.TextField(blank=True, verbose_name='Dirección'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='phone',
+            field=models.CharField(blank=True, max_length=15, verbose_name='Teléfono'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, upload_to='profiles/', verbose_name='Foto de Perfil'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='approverrole',
+            constraint=models.UniqueConstraint(fields=('flow', 'user'), name='unique_approver_per_flow'),
+        ),
+        migrations.AddConstraint(
+            model_name='approverrole',
+            constraint=models.UniqueConstraint(fields=('flow', 'approval_order'), name='unique_order_per_flow'),
+        ),
+        migrations.AddConstraint(
+            model_name='customuser',
+            constraint=models.CheckConstraint(condition=models.Q(('boss', models.F('id')), _negated=True), name='user_cannot_be_own_boss'),
+        ),
+        migrations.AddConstraint(
+            model_name='organizationlevel',
+            constraint=models.UniqueConstraint(fields=('name', 'level_type'), name='unique_organization_level_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='organizationlevel',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('level_type', 'CENTRAL'), _negated=True), ('parent__isnull', True), _connector='OR'), name='central_cannot_have_parent'),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
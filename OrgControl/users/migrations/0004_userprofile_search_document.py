@@ -0,0 +1,117 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+POSITIONS = {
+    'DG': 'Director General',
+    'DIR_ARC': 'Director de ARC',
+    'DIR_UEB': 'Director de UEB',
+    'ESP_ARC': 'Especialista de ARC',
+    'ESP_UEB': 'Especialista de UEB',
+    'ADMIN': 'Administrador del Sistema',
+}
+
+SQLITE_FTS = [
+    """
+    CREATE VIRTUAL TABLE users_directory_fts USING fts5(
+        search_document, content='users_userprofile', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER users_directory_fts_ai AFTER INSERT ON users_userprofile BEGIN
+        INSERT INTO users_directory_fts(rowid, search_document) VALUES (new.id, new.search_document);
+    END
+    """,
+    """
+    CREATE TRIGGER users_directory_fts_ad AFTER DELETE ON users_userprofile BEGIN
+        INSERT INTO users_directory_fts(users_directory_fts, rowid, search_document)
+        VALUES ('delete', old.id, old.search_document);
+    END
+    """,
+    """
+    CREATE TRIGGER users_directory_fts_au AFTER UPDATE OF search_document ON users_userprofile BEGIN
+        INSERT INTO users_directory_fts(users_directory_fts, rowid, search_document)
+        VALUES ('delete', old.id, old.search_document);
+        INSERT INTO users_directory_fts(rowid, search_document) VALUES (new.id, new.search_document);
+    END
+    """,
+    "INSERT INTO users_directory_fts(users_directory_fts) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_DROP = [
+    'DROP TRIGGER IF EXISTS users_directory_fts_ai',
+    'DROP TRIGGER IF EXISTS users_directory_fts_ad',
+    'DROP TRIGGER IF EXISTS users_directory_fts_au',
+    'DROP TABLE IF EXISTS users_directory_fts',
+]
+
+POSTGRES_TRIGRAM = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX userprofile_search_trgm_idx ON users_userprofile '
+    'USING gin (search_document gin_trgm_ops)',
+]
+
+POSTGRES_TRIGRAM_DROP = ['DROP INDEX IF EXISTS userprofile_search_trgm_idx']
+
+
+def populate_search_documents(apps, schema_editor):
+    # Misma composición que users.directory.build_search_document
+    UserProfile = apps.get_model('users', 'UserProfile')
+    profiles = list(UserProfile.objects.select_related('user__organization_level'))
+    for profile in profiles:
+        user = profile.user
+        level = user.organization_level
+        parts = (
+            user.first_name,
+            user.last_name,
+            user.username,
+            POSITIONS.get(user.position, user.position),
+            level.name if level else '',
+            profile.phone,
+            profile.address,
+        )
+        profile.search_document = ' '.join(' '.join(str(part).split()) for part in parts if part)
+    UserProfile.objects.bulk_update(profiles, ['search_document'], batch_size=500)
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_FTS)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_TRIGRAM)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_FTS_DROP)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_TRIGRAM_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_organizationlevel_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False, help_text='Nombre, cargo, nivel, teléfono y dirección para el directorio', verbose_name='Texto de búsqueda'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['last_name', 'first_name', 'id'], name='user_directory_order_idx'),
+        ),
+        migrations.RunPython(populate_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
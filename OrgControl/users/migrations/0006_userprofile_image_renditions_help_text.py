@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_userprofile_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Miniaturas generadas para la foto de perfil (ver users/thumbnails.py)', verbose_name='Derivados de imagen'),
+        ),
+    ]
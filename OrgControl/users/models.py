@@ -1,10 +1,53 @@
-from django.db import models
+from django.db import connection, models
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Concat, Substr
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 
 
+class OrganizationLevelQuerySet(models.QuerySet):
+    def descendants_of(self, level, include_self=True):
+        """Niveles que cuelgan de `level` usando la ruta materializada"""
+        queryset = self.filter(path__startswith=level.path)
+        if not include_self:
+            queryset = queryset.exclude(pk=level.pk)
+        return queryset
+
+    def ancestors_of(self, level, include_self=True):
+        """Niveles superiores de `level`, del más cercano a la raíz"""
+        ids = [int(pk) for pk in level.path.split('/') if pk]
+        if not include_self:
+            ids = [pk for pk in ids if pk != level.pk]
+        return self.filter(pk__in=ids).order_by('-depth')
+
+    def build_tree(self):
+        """
+        Construye la jerarquía completa en una sola consulta.
+
+        Devuelve los nodos raíz; cada nodo trae su director, el total de
+        miembros en `member_count` y sus hijos ya resueltos en `tree_children`.
+        """
+        nodes = list(
+            self.select_related('director')
+            .annotate(member_count=Count('members'))
+            .order_by('depth', 'name')
+        )
+        by_id = {node.pk: node for node in nodes}
+        roots = []
+        for node in nodes:
+            node.tree_children = []
+        for node in nodes:
+            parent = by_id.get(node.parent_id)
+            if parent is None:
+                roots.append(node)
+            else:
+                parent.tree_children.append(node)
+        return roots
+
+
 class OrganizationLevel(models.Model):
     class LevelType(models.TextChoices):
         CENTRAL = 'CENTRAL', _('Oficina Central')
@@ -34,11 +77,28 @@ class OrganizationLevel(models.Model):
     director = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.PROTECT,
+        # Nulo solo en niveles anteriores a este campo, hasta que se les asigne director
+        null=True,
         related_name='directed_levels',
         verbose_name=_('Director a cargo'),
         help_text=_("Usuario responsable de este nivel"),
         limit_choices_to={'profile__position__in': ['DG', 'DIR_ARC', 'DIR_UEB']}
     )
+    path = models.CharField(
+        _('Ruta jerárquica'),
+        max_length=255,
+        db_index=True,
+        editable=False,
+        default='',
+        help_text=_("Ids de la raíz hasta este nivel, p. ej. '1/4/9/'")
+    )
+    depth = models.PositiveSmallIntegerField(
+        _('Profundidad'),
+        editable=False,
+        default=0
+    )
+
+    objects = OrganizationLevelQuerySet.as_manager()
 
     class Meta:
         verbose_name = _('Nivel Organizacional')
@@ -74,6 +134,46 @@ class OrganizationLevel(models.Model):
         if hasattr(self.director, 'profile') and self.director.profile.position != position_map[self.level_type]:
             raise ValidationError(_('El director asignado no tiene el cargo adecuado para este nivel'))
 
+        # Validación 4: Un nivel no puede colgar de sí mismo ni de sus descendientes
+        if self.path and self.parent is not None and self.parent.path.startswith(self.path):
+            raise ValidationError(_('Un nivel no puede reportar a uno de sus niveles subordinados'))
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._update_path()
+
+    def _update_path(self):
+        """Recalcula la ruta materializada y la propaga a los descendientes"""
+        parent_path, parent_depth = '', -1
+        if self.parent_id:
+            parent_path, parent_depth = OrganizationLevel.objects.filter(
+                pk=self.parent_id
+            ).values_list('path', 'depth').get()
+
+        old_path, old_depth = self.path, self.depth
+        new_path, new_depth = f"{parent_path}{self.pk}/", parent_depth + 1
+        if new_path == old_path:
+            return
+
+        OrganizationLevel.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+        if old_path:
+            OrganizationLevel.objects.filter(
+                path__startswith=old_path
+            ).exclude(pk=self.pk).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1),
+                            output_field=models.CharField()),
+                depth=F('depth') + (new_depth - old_depth)
+            )
+        self.path, self.depth = new_path, new_depth
+
+    def get_descendants(self, include_self=False):
+        return OrganizationLevel.objects.descendants_of(self, include_self=include_self)
+
+    def get_approver_ids(self, module):
+        """Ids de los aprobadores de `module` para este nivel, en orden de aprobación"""
+        from .cache import get_approver_ids
+        return get_approver_ids(module, self.pk)
+
     def __str__(self):
         return f"{self.get_level_type_display()}: {self.name}"
 
@@ -114,6 +214,10 @@ class CustomUser(AbstractUser):
         verbose_name = _('Usuario')
         verbose_name_plural = _('Usuarios')
         ordering = ['last_name', 'first_name']
+        indexes = [
+            # Paginación por conjunto de claves del directorio de personal
+            models.Index(fields=['last_name', 'first_name', 'id'], name='user_directory_order_idx')
+        ]
         constraints = [
             models.CheckConstraint(
                 check=~models.Q(boss=models.F('id')),
@@ -144,21 +248,56 @@ class CustomUser(AbstractUser):
         if self.position in ['ESP_ARC', 'ESP_UEB'] and self.boss is None:
             raise ValidationError(_('Los especialistas deben tener un supervisor directo asignado'))
 
-    def get_subordinates(self, include_indirect=True):
-        """Obtiene todos los subordinados"""
-        subordinates = list(self.subordinates.all())
-        if include_indirect:
-            for sub in subordinates:
-                subordinates += sub.get_subordinates()
-        return subordinates
+    def get_subordinates(self, include_indirect=True, max_depth=None):
+        """
+        Obtiene todos los subordinados como un queryset sin duplicados.
+
+        La cadena `boss` se resuelve en una sola consulta recursiva (CTE), por
+        lo que el resultado se puede seguir filtrando o usar en subconsultas.
+        `max_depth` limita los niveles de reporte (1 = solo directos); con 0
+        o menos no hay subordinados.
+        """
+        if not include_indirect:
+            max_depth = 1
+        if max_depth is not None and max_depth < 1:
+            return CustomUser.objects.none()
+        return CustomUser.objects.filter(
+            pk__in=self._subordinates_sql(max_depth)
+        ).exclude(pk=self.pk)
+
+    def _subordinates_sql(self, max_depth=None):
+        table = connection.ops.quote_name(self._meta.db_table)
+        boss = connection.ops.quote_name(self._meta.get_field('boss').column)
+        if max_depth is None:
+            # UNION descarta filas repetidas, lo que también corta posibles ciclos
+            sql = f"""
+                WITH RECURSIVE subordinados(id) AS (
+                    SELECT id FROM {table} WHERE {boss} = %s
+                    UNION
+                    SELECT u.id FROM {table} u JOIN subordinados s ON u.{boss} = s.id
+                )
+                SELECT id FROM subordinados
+            """
+            return RawSQL(sql, (self.pk,))
+        sql = f"""
+            WITH RECURSIVE subordinados(id, profundidad) AS (
+                SELECT id, 1 FROM {table} WHERE {boss} = %s
+                UNION
+                SELECT u.id, s.profundidad + 1 FROM {table} u
+                JOIN subordinados s ON u.{boss} = s.id
+                WHERE s.profundidad < %s
+            )
+            SELECT id FROM subordinados
+        """
+        return RawSQL(sql, (self.pk, max_depth))
 
     def get_approvers_for_module(self, module):
         """Obtiene los aprobadores para un módulo específico según jerarquía"""
-        from .models import ApprovalFlow
-        flow = ApprovalFlow.objects.get(module=module)
-        return flow.approvers.filter(
-            approverrole__approval_order__gt=0
-        ).order_by('approverrole__approval_order')
+        from .cache import get_approver_ids
+        approver_ids = get_approver_ids(module, self.organization_level_id)
+        return CustomUser.objects.filter(pk__in=approver_ids).order_by(
+            Case(*[When(pk=pk, then=Value(order)) for order, pk in enumerate(approver_ids)])
+        )
 
 
 class UserProfile(models.Model):
@@ -189,6 +328,19 @@ class UserProfile(models.Model):
         blank=True,
         help_text=_('Firma escaneada para documentos oficiales')
     )
+    search_document = models.TextField(
+        _('Texto de búsqueda'),
+        blank=True,
+        editable=False,
+        help_text=_('Nombre, cargo, nivel, teléfono y dirección para el directorio')
+    )
+    image_renditions = models.JSONField(
+        _('Derivados de imagen'),
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text=_('Miniaturas generadas para la foto de perfil (ver users/thumbnails.py)')
+    )
 
     class Meta:
         verbose_name = _('Perfil de Usuario')
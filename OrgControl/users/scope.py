@@ -0,0 +1,91 @@
+"""
+Alcance de visibilidad de cada usuario sobre la jerarquía organizacional.
+
+Un usuario ve su propio nivel, los niveles que dirige y todos los que
+cuelgan de estos últimos. El conjunto de ids se calcula una vez por
+petición (queda guardado en el objeto usuario) y se comparte entre
+procesos en la caché bajo la versión de la jerarquía, que se incrementa al
+modificar cualquier nivel (ver users/signals.py). Por eso la caché debe ser
+compartida (ver require_shared_cache en users/cache.py): con una por
+proceso, los demás seguirían aplicando el alcance anterior.
+
+Ver no da permiso para gestionar: crear planes e importar actividades
+sigue reservado al director del nivel.
+
+Los módulos filtran con restrict(), que se traduce en un único
+`campo IN (...)` en lugar de repetir los joins con la jerarquía.
+"""
+from functools import reduce
+from operator import or_
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+
+from .cache import bump_version, get_version
+from .models import OrganizationLevel
+
+HIERARCHY_VERSION_KEY = 'users:hierarchy:version'
+SCOPE_TIMEOUT = 60 * 60 * 24
+
+
+def visible_level_ids(user):
+    """
+    frozenset con los ids de los niveles visibles para `user`, o None si no
+    tiene restricción (superusuarios).
+    """
+    if user.is_superuser:
+        return None
+    if not user.is_authenticated:
+        return frozenset()
+    if hasattr(user, '_visible_level_ids'):
+        return user._visible_level_ids
+
+    # El nivel propio forma parte de la clave: si cambia, la entrada deja de usarse
+    key = (f"users:scope:{get_version(HIERARCHY_VERSION_KEY)}:"
+           f"{user.pk}:{user.organization_level_id}")
+    level_ids = cache.get(key)
+    if level_ids is None:
+        level_ids = _resolve_level_ids(user)
+        cache.set(key, level_ids, SCOPE_TIMEOUT)
+    user._visible_level_ids = level_ids
+    return level_ids
+
+
+def _resolve_level_ids(user):
+    # Siempre de la primaria, también en vistas que leen de la réplica: el
+    # resultado se comparte en la caché bajo la versión vigente y una réplica
+    # atrasada lo dejaría obsoleto para todas las peticiones
+    levels = OrganizationLevel.objects.using(DEFAULT_DB_ALIAS)
+    ids = set()
+    if user.organization_level_id:
+        ids.add(user.organization_level_id)
+    directed = list(levels.filter(director=user).values_list('path', flat=True))
+    if directed:
+        ids.update(levels.filter(
+            reduce(or_, (Q(path__startswith=path) for path in directed))
+        ).values_list('pk', flat=True))
+    return frozenset(ids)
+
+
+def restrict(queryset, user, lookup='organization_level'):
+    """
+    Filtra `queryset` a lo visible para `user`. `lookup` es el camino hasta
+    el nivel organizacional, p. ej. 'plan__organization_level'.
+    """
+    level_ids = visible_level_ids(user)
+    if level_ids is None:
+        return queryset
+    return queryset.filter(**{f"{lookup}_id__in": level_ids})
+
+
+def visible_levels(user):
+    """Queryset de los niveles visibles para `user`"""
+    level_ids = visible_level_ids(user)
+    if level_ids is None:
+        return OrganizationLevel.objects.all()
+    return OrganizationLevel.objects.filter(pk__in=level_ids)
+
+
+def invalidate_scopes():
+    bump_version(HIERARCHY_VERSION_KEY)
@@ -1,7 +1,12 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import UserProfile
+from .cache import invalidate_approvers
+from .directory import build_search_document, refresh_search_documents
+from . import thumbnails
+from .scope import invalidate_scopes
+from .models import UserProfile, OrganizationLevel, ApprovalFlow, ApproverRole
 
 CustomUser = get_user_model()
 
@@ -12,4 +17,50 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=CustomUser)
 def save_user_profile(sender, instance, **kwargs):
-    instance.userprofile.save()
\ No newline at end of file
+    if hasattr(instance, 'profile'):
+        instance.profile.save()
+
+def _invalidate_now_and_on_commit(invalidate):
+    """
+    Invalida ya, para quien lea dentro de la transacción, y otra vez al
+    confirmarla: mientras tanto otra petición puede haber leído la versión
+    nueva con los datos anteriores y guardado lo obsoleto bajo esa versión.
+    """
+    invalidate()
+    transaction.on_commit(invalidate)
+
+@receiver([post_save, post_delete], sender=ApprovalFlow)
+@receiver([post_save, post_delete], sender=ApproverRole)
+@receiver([post_save, post_delete], sender=OrganizationLevel)
+def invalidate_approver_cache(sender, **kwargs):
+    # Cambios de flujo, roles, director o jerarquía alteran la cadena de aprobación
+    _invalidate_now_and_on_commit(invalidate_approvers)
+
+@receiver([post_save, post_delete], sender=OrganizationLevel)
+def invalidate_scope_cache(sender, **kwargs):
+    # Director o jerarquía alteran qué niveles ve cada usuario
+    _invalidate_now_and_on_commit(invalidate_scopes)
+
+@receiver(pre_save, sender=UserProfile)
+def update_search_document(sender, instance, **kwargs):
+    instance.search_document = build_search_document(instance)
+
+@receiver(post_save, sender=OrganizationLevel)
+def refresh_member_search_documents(sender, instance, created, **kwargs):
+    # El nombre del nivel forma parte del documento de búsqueda de sus miembros
+    if not created:
+        refresh_search_documents(
+            UserProfile.objects.select_related('user__organization_level').filter(
+                user__organization_level=instance
+            )
+        )
+
+@receiver(post_save, sender=UserProfile)
+def generate_image_renditions(sender, instance, **kwargs):
+    # Solo si la foto cambió desde los derivados registrados
+    stale = [
+        name for name in thumbnails.RENDITIONS
+        if getattr(instance, thumbnails.RENDITIONS[name].field) and not thumbnails.current(instance, name)
+    ]
+    if stale:
+        transaction.on_commit(lambda: thumbnails.refresh(instance, stale))
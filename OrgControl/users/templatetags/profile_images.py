@@ -0,0 +1,11 @@
+from django import template
+
+from users import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def profile_image_url(profile, rendition='avatar'):
+    """URL de la miniatura de `profile`; cadena vacía si no tiene imagen"""
+    return thumbnails.url(profile, rendition)
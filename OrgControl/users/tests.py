@@ -1,3 +1,257 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from . import scope
+from .cache import APPROVERS_VERSION_KEY, LOOKUPS, get_approver_ids, get_version, require_shared_cache
+from .models import ApprovalFlow, ApproverRole, OrganizationLevel
+
+User = get_user_model()
+
+ANNUAL_PLAN = ApprovalFlow.Module.ANNUAL_PLAN
+
+
+class HierarchyMixin:
+    """Oficina Central con un ARC y una UEB, cada uno con su director"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.general_director = User.objects.create(username='dg', position='DG')
+        cls.arc_director = User.objects.create(username='dir_arc', position='DIR_ARC')
+        cls.ueb_director = User.objects.create(username='dir_ueb', position='DIR_UEB')
+        cls.central = OrganizationLevel.objects.create(
+            name='Oficina Central', level_type='CENTRAL', director=cls.general_director
+        )
+        cls.arc = OrganizationLevel.objects.create(
+            name='ARC Norte', level_type='ARC', director=cls.arc_director, parent=cls.central
+        )
+        cls.ueb = OrganizationLevel.objects.create(
+            name='UEB Norte', level_type='UEB', director=cls.ueb_director, parent=cls.central
+        )
+        for user, level in ((cls.general_director, cls.central), (cls.arc_director, cls.arc),
+                            (cls.ueb_director, cls.ueb)):
+            user.organization_level = level
+            user.save()
+        cls.specialist = User.objects.create(username='esp_arc', organization_level=cls.arc)
+        cls.auditor = User.objects.create(username='auditor', position='ADMIN')
+
+    def setUp(self):
+        cache.clear()
+
+    def fresh(self, user):
+        """Instancia nueva, sin el alcance guardado en el objeto"""
+        return User.objects.get(pk=user.pk)
+
+
+class TreeTests(HierarchyMixin, TestCase):
+
+    def fresh_level(self, level):
+        return OrganizationLevel.objects.get(pk=level.pk)
+
+    def test_build_tree_in_one_query(self):
+        with self.assertNumQueries(1):
+            roots = OrganizationLevel.objects.build_tree()
+            self.assertEqual([root.pk for root in roots], [self.central.pk])
+            central = roots[0]
+            self.assertEqual(central.director.username, 'dg')
+            self.assertEqual([child.name for child in central.tree_children], ['ARC Norte', 'UEB Norte'])
+            arc = central.tree_children[0]
+            # Director y especialista
+            self.assertEqual(arc.member_count, 2)
+            self.assertEqual(arc.director.username, 'dir_arc')
+            self.assertEqual(arc.tree_children, [])
+
+    def test_path_follows_reparenting(self):
+        ueb = OrganizationLevel.objects.get(pk=self.ueb.pk)
+        ueb.parent = self.arc
+        ueb.save()
+        ueb.refresh_from_db()
+        self.assertEqual(ueb.depth, 2)
+        self.assertEqual(ueb.path, f'{self.fresh_level(self.arc).path}{ueb.pk}/')
+        self.assertEqual(
+            set(OrganizationLevel.objects.descendants_of(self.fresh_level(self.arc)).values_list('pk', flat=True)),
+            {self.arc.pk, self.ueb.pk}
+        )
+
+    def test_structure_page_queries_do_not_grow_with_levels(self):
+        self.client.force_login(self.general_director)
+        self.client.get(reverse('users:organization_structure'))
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('users:organization_structure'))
+        for number in range(5):
+            OrganizationLevel.objects.create(name=f'UEB {number}', level_type='UEB', parent=self.arc)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('users:organization_structure'))
+        self.assertContains(response, 'UEB 4')
+        self.assertEqual(len(large), len(small))
+
+
+class ScopeTests(HierarchyMixin, TestCase):
+
+    def test_visible_levels(self):
+        self.assertEqual(scope.visible_level_ids(self.fresh(self.general_director)),
+                         {self.central.pk, self.arc.pk, self.ueb.pk})
+        self.assertEqual(scope.visible_level_ids(self.fresh(self.arc_director)), {self.arc.pk})
+        self.assertEqual(scope.visible_level_ids(self.fresh(self.specialist)), {self.arc.pk})
+        self.assertEqual(scope.visible_level_ids(User.objects.create(username='sin_nivel')), frozenset())
+        self.assertEqual(scope.visible_level_ids(AnonymousUser()), frozenset())
+        self.assertIsNone(scope.visible_level_ids(User.objects.create(username='root', is_superuser=True)))
+
+    def test_restrict(self):
+        self.assertEqual(
+            set(scope.restrict(User.objects.all(), self.fresh(self.specialist))),
+            {self.arc_director, self.specialist}
+        )
+        self.assertEqual(
+            set(scope.restrict(OrganizationLevel.objects.all(), self.fresh(self.arc_director), 'parent')), set()
+        )
+        self.assertEqual(
+            set(scope.visible_levels(self.fresh(self.general_director))), {self.central, self.arc, self.ueb}
+        )
+
+    def test_scope_is_cached(self):
+        scope.visible_level_ids(self.fresh(self.general_director))
+        user = self.fresh(self.general_director)
+        with self.assertNumQueries(0):
+            scope.visible_level_ids(user)
+            scope.visible_level_ids(user)
+
+    def test_hierarchy_change_invalidates_scope(self):
+        scope.visible_level_ids(self.fresh(self.arc_director))
+        ueb = OrganizationLevel.objects.get(pk=self.ueb.pk)
+        ueb.parent = self.arc
+        ueb.save()
+        self.assertEqual(scope.visible_level_ids(self.fresh(self.arc_director)), {self.arc.pk, self.ueb.pk})
+
+    def test_own_level_change_invalidates_scope(self):
+        scope.visible_level_ids(self.fresh(self.specialist))
+        User.objects.filter(pk=self.specialist.pk).update(organization_level=self.ueb)
+        self.assertEqual(scope.visible_level_ids(self.fresh(self.specialist)), {self.ueb.pk})
+
+    def test_scope_cached_during_the_transaction_is_dropped_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ueb = OrganizationLevel.objects.get(pk=self.ueb.pk)
+            ueb.parent = self.arc
+            ueb.save()
+            # Una petición concurrente aún ve la jerarquía anterior y la guarda bajo la versión nueva
+            director = self.fresh(self.arc_director)
+            cache.set(f"users:scope:{get_version(scope.HIERARCHY_VERSION_KEY)}:"
+                      f"{director.pk}:{director.organization_level_id}", frozenset({self.arc.pk}))
+        self.assertEqual(scope.visible_level_ids(self.fresh(self.arc_director)), {self.arc.pk, self.ueb.pk})
+
+
+class ApproverCacheTests(HierarchyMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        flow, _created = ApprovalFlow.objects.get_or_create(module=ANNUAL_PLAN)
+        ApproverRole.objects.filter(flow=flow).delete()
+        ApproverRole.objects.create(flow=flow, user=cls.auditor, role_name='Auditoría', approval_order=1)
+        # Ya figura en la cadena como director de la Oficina Central
+        ApproverRole.objects.create(flow=flow, user=cls.general_director, role_name='DG', approval_order=2)
+
+    def test_chain_order(self):
+        self.assertEqual(get_approver_ids(ANNUAL_PLAN, self.ueb.pk),
+                         (self.ueb_director.pk, self.general_director.pk, self.auditor.pk))
+        self.assertEqual(get_approver_ids(ANNUAL_PLAN, None), (self.auditor.pk, self.general_director.pk))
+
+    def test_chain_is_cached(self):
+        get_approver_ids(ANNUAL_PLAN, self.ueb.pk)
+        with self.assertNumQueries(0):
+            get_approver_ids(ANNUAL_PLAN, self.ueb.pk)
+
+    def test_lookups_are_counted(self):
+        before = {result: LOOKUPS.series.get((ANNUAL_PLAN, result), 0) for result in ('hit', 'miss')}
+        for _lookup in range(3):
+            get_approver_ids(ANNUAL_PLAN, self.ueb.pk)
+        self.assertEqual(LOOKUPS.series[ANNUAL_PLAN, 'miss'], before['miss'] + 1)
+        self.assertEqual(LOOKUPS.series[ANNUAL_PLAN, 'hit'], before['hit'] + 2)
+
+        self.client.force_login(User.objects.create(username='metrics', is_staff=True))
+        response = self.client.get(reverse('metricas'))
+        self.assertContains(response, f'orgcontrol_approver_cache_total{{module="{ANNUAL_PLAN}",result="hit"}}')
+
+    def test_director_change_invalidates_chain(self):
+        get_approver_ids(ANNUAL_PLAN, self.ueb.pk)
+        replacement = User.objects.create(username='dir_ueb_2', position='DIR_UEB')
+        ueb = OrganizationLevel.objects.get(pk=self.ueb.pk)
+        ueb.director = replacement
+        ueb.save()
+        self.assertEqual(get_approver_ids(ANNUAL_PLAN, self.ueb.pk)[0], replacement.pk)
+
+    def test_role_change_invalidates_chain(self):
+        get_approver_ids(ANNUAL_PLAN, self.arc.pk)
+        ApproverRole.objects.filter(user=self.auditor).delete()
+        self.assertEqual(get_approver_ids(ANNUAL_PLAN, self.arc.pk),
+                         (self.arc_director.pk, self.general_director.pk))
+
+    def test_levels_without_director_are_skipped(self):
+        level = OrganizationLevel.objects.create(name='UEB Sur', level_type='UEB', parent=self.central)
+        self.assertEqual(get_approver_ids(ANNUAL_PLAN, level.pk),
+                         (self.general_director.pk, self.auditor.pk))
+
+    def test_chain_cached_during_the_transaction_is_dropped_on_commit(self):
+        replacement = User.objects.create(username='dir_ueb_2', position='DIR_UEB')
+        with self.captureOnCommitCallbacks(execute=True):
+            ueb = OrganizationLevel.objects.get(pk=self.ueb.pk)
+            ueb.director = replacement
+            ueb.save()
+            # Una petición concurrente aún ve al director anterior y lo guarda bajo la versión nueva
+            cache.set(f"users:approvers:{get_version(APPROVERS_VERSION_KEY)}:{ANNUAL_PLAN}:{self.ueb.pk}",
+                      (self.ueb_director.pk,))
+        self.assertEqual(get_approver_ids(ANNUAL_PLAN, self.ueb.pk)[0], replacement.pk)
+
+
+class SubordinatesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # director -> jefe -> (especialista_1, especialista_2) -> auxiliar
+        cls.director = User.objects.create(username='director')
+        cls.chief = User.objects.create(username='jefe', boss=cls.director)
+        cls.specialists = [User.objects.create(username=f'especialista_{n}', boss=cls.chief) for n in (1, 2)]
+        cls.assistant = User.objects.create(username='auxiliar', boss=cls.specialists[0])
+
+    def subordinates(self, **kwargs):
+        return sorted(self.director.get_subordinates(**kwargs).values_list('username', flat=True))
+
+    def test_depth_limit(self):
+        everyone = ['auxiliar', 'especialista_1', 'especialista_2', 'jefe']
+        self.assertEqual(self.subordinates(), everyone)
+        self.assertEqual(self.subordinates(max_depth=1), ['jefe'])
+        self.assertEqual(self.subordinates(include_indirect=False), ['jefe'])
+        self.assertEqual(self.subordinates(max_depth=2), ['especialista_1', 'especialista_2', 'jefe'])
+        self.assertEqual(self.subordinates(max_depth=10), everyone)
+        for depth in (0, -1):
+            with self.assertNumQueries(0):
+                self.assertEqual(self.subordinates(max_depth=depth), [])
+
+    def test_cycles_do_not_repeat_users(self):
+        # Un ciclo en la cadena `boss` no repite filas ni incluye al propio usuario
+        User.objects.filter(pk=self.director.pk).update(boss=self.assistant)
+        for depth in (None, 10):
+            with self.subTest(max_depth=depth), self.assertNumQueries(1):
+                names = list(self.director.get_subordinates(max_depth=depth).values_list('username', flat=True))
+            self.assertEqual(sorted(names), ['auxiliar', 'especialista_1', 'especialista_2', 'jefe'])
+
+
+class SharedCacheTests(TestCase):
+    locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                          'LOCATION': 'redis://localhost:6379/0'}}
+
+    def test_per_process_cache_rejected_without_debug(self):
+        with override_settings(DEBUG=False, CACHES=self.locmem):
+            with self.assertRaises(ImproperlyConfigured):
+                require_shared_cache()
+
+    def test_allowed_cases(self):
+        for debug, caches in ((True, self.locmem), (False, self.shared)):
+            with self.subTest(debug=debug), override_settings(DEBUG=debug, CACHES=caches):
+                require_shared_cache()
@@ -0,0 +1,159 @@
+"""
+Derivados de las fotos de perfil.
+
+Cada derivado (rendition) tiene tamaño y formato fijos y se guarda en
+MEDIA_ROOT/thumbnails con un nombre derivado del contenido del original, por
+lo que un archivo ya generado nunca cambia y se puede servir con caché de
+larga duración. UserProfile.image_renditions recuerda qué derivado
+corresponde a cada original; si falta o está desactualizado se genera al
+pedirlo por primera vez.
+
+Los derivados se generan al subir la imagen (ver users/signals.py) o, si
+no existen, en la primera petición (ver ProfileImageView).
+"""
+import hashlib
+import re
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import UserProfile
+
+THUMBNAIL_DIR = 'thumbnails'
+# Incrementar al cambiar cómo se generan los derivados para descartar los existentes
+VERSION = 1
+CHUNK_SIZE = 64 * 1024
+# Un año: el nombre cambia con el contenido, así que nunca hay que revalidar
+MAX_AGE = 60 * 60 * 24 * 365
+
+
+class Rendition:
+    """
+    `field` es el campo de UserProfile de origen. Con `crop` la imagen se
+    recorta para llenar `size` exactamente; sin él se reduce conservando
+    la proporción hasta caber en `size`.
+    """
+    def __init__(self, field, size, image_format, crop=False, quality=80):
+        self.field = field
+        self.size = size
+        self.format = image_format
+        self.crop = crop
+        self.quality = quality
+
+    @property
+    def extension(self):
+        return {'WEBP': 'webp', 'JPEG': 'jpg', 'PNG': 'png'}[self.format]
+
+    @property
+    def content_type(self):
+        return f"image/{self.format.lower()}"
+
+
+RENDITIONS = {
+    # Al doble del tamaño mostrado para pantallas de alta densidad
+    'avatar': Rendition('profile_picture', (200, 200), 'WEBP', crop=True),
+    'avatar_small': Rendition('profile_picture', (80, 80), 'WEBP', crop=True),
+}
+
+NAME_PATTERN = re.compile(r'^(?P<rendition>[a-z_]+)/[0-9a-f]{2}/[0-9a-f]{64}\.(webp|jpg|png)$')
+
+
+def _content_hash(source, rendition_name):
+    digest = hashlib.sha256(f"{rendition_name}:v{VERSION}:".encode())
+    source.open('rb')
+    try:
+        for chunk in source.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+    finally:
+        source.close()
+    return digest.hexdigest()
+
+
+def _render(source, rendition):
+    source.open('rb')
+    try:
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            if rendition.crop:
+                image = ImageOps.fit(image, rendition.size, Image.Resampling.LANCZOS)
+            else:
+                image.thumbnail(rendition.size, Image.Resampling.LANCZOS)
+
+            if rendition.format == 'JPEG':
+                image = image.convert('RGB')
+            elif image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+
+            output = BytesIO()
+            options = {} if rendition.format == 'PNG' else {'quality': rendition.quality}
+            image.save(output, rendition.format, optimize=True, **options)
+    finally:
+        source.close()
+    return output.getvalue()
+
+
+def generate(profile, rendition_name):
+    """
+    Genera (si no existe) el derivado del original actual y devuelve su
+    nombre relativo a THUMBNAIL_DIR, o None si no hay original o no es una
+    imagen legible.
+    """
+    rendition = RENDITIONS[rendition_name]
+    source = getattr(profile, rendition.field)
+    if not source:
+        return None
+    try:
+        digest = _content_hash(source, rendition_name)
+        name = f"{rendition_name}/{digest[:2]}/{digest}.{rendition.extension}"
+        path = f"{THUMBNAIL_DIR}/{name}"
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(_render(source, rendition)))
+    except (OSError, UnidentifiedImageError):
+        return None
+    return name
+
+
+def current(profile, rendition_name):
+    """Nombre del derivado ya registrado para el original actual, sin leer archivos"""
+    source = getattr(profile, RENDITIONS[rendition_name].field)
+    entry = profile.image_renditions.get(rendition_name)
+    if source and entry and entry['source'] == source.name:
+        return entry['name']
+    return None
+
+
+def refresh(profile, rendition_names=None):
+    """Genera los derivados desactualizados y los registra sin disparar señales"""
+    renditions = dict(profile.image_renditions)
+    for rendition_name in rendition_names or RENDITIONS:
+        if current(profile, rendition_name):
+            continue
+        name = generate(profile, rendition_name)
+        if name:
+            source = getattr(profile, RENDITIONS[rendition_name].field)
+            renditions[rendition_name] = {'source': source.name, 'name': name}
+        else:
+            renditions.pop(rendition_name, None)
+
+    if renditions != profile.image_renditions:
+        profile.image_renditions = renditions
+        UserProfile.objects.filter(pk=profile.pk).update(image_renditions=renditions)
+    return renditions
+
+
+def url(profile, rendition_name):
+    """
+    URL del derivado: la definitiva si ya está generado o la de
+    generación diferida en caso contrario. Cadena vacía si no hay original.
+    """
+    rendition = RENDITIONS[rendition_name]
+    if not profile or not getattr(profile, rendition.field):
+        return ''
+    name = current(profile, rendition_name)
+    if name:
+        return reverse('users:thumbnail', args=[name])
+    return reverse('users:profile_image', args=[profile.pk, rendition_name])
+
@@ -1,8 +1,15 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.views.generic import ListView, UpdateView, DeleteView
-from django.urls import reverse_lazy
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
+from django.utils.cache import patch_cache_control
+from django.views import View
+from django.views.generic import TemplateView, UpdateView, DeleteView
+from django.urls import reverse, reverse_lazy
+from django.utils.html import escape, format_html
+from OrgControl.datatables import Columna, DataTablesView
+from . import directory, thumbnails
 from .models import CustomUser, OrganizationLevel, ApprovalFlow, ApproverRole, UserProfile
 from .forms import CustomUserCreationForm, OrganizationLevelForm, ApproverRoleForm, CustomUserChangeForm
 from .forms import UserProfileForm
@@ -25,11 +32,39 @@ def create_user(request):
     return render(request, 'users/user_form.html', {'form': form})
 
 
-class UserListView(LoginRequiredMixin, ListView):
-    model = CustomUser
+class UserListView(LoginRequiredMixin, TemplateView):
+    # Las filas las entrega UserListDataView página a página
     template_name = 'users/user_list.html'
-    context_object_name = 'users'
-    paginate_by = 20
+
+
+class UserListDataView(LoginRequiredMixin, DataTablesView):
+    columnas = (
+        Columna('nombre', orden=('last_name', 'first_name'),
+                busqueda=('first_name__icontains', 'last_name__icontains', 'username__icontains')),
+        Columna('cargo', orden='position'),
+        Columna('nivel', orden='organization_level__name', busqueda='organization_level__name__icontains'),
+        Columna('supervisor', orden=('boss__last_name', 'boss__first_name'),
+                busqueda=('boss__first_name__icontains', 'boss__last_name__icontains')),
+        Columna('estado', orden='is_active'),
+        Columna('acciones'),
+    )
+
+    def get_queryset(self):
+        return CustomUser.objects.select_related('organization_level', 'boss')
+
+    def fila(self, user):
+        return {
+            'nombre': escape(user.get_full_name()),
+            'cargo': escape(user.get_position_display()),
+            'nivel': escape(user.organization_level or '-'),
+            'supervisor': escape(user.boss.get_full_name() if user.boss else '-'),
+            'estado': format_html('<span class="badge bg-success">Activo</span>') if user.is_active
+            else format_html('<span class="badge bg-danger">Inactivo</span>'),
+            'acciones': format_html(
+                '<a href="{}" class="btn btn-primary btn-sm" title="Editar"><i class="fas fa-edit"></i></a>',
+                reverse('users:user_update', args=[user.pk])
+            ),
+        }
 
 
 class UserUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
@@ -51,10 +86,37 @@ class UserDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return self.request.user.is_superuser
 
 
+class ProfileImageView(LoginRequiredMixin, View):
+    """Genera el derivado si aún no existe y redirige a su URL definitiva"""
+    def get(self, request, pk, rendition):
+        if rendition not in thumbnails.RENDITIONS:
+            raise Http404
+        profile = get_object_or_404(UserProfile, pk=pk)
+        if rendition not in thumbnails.refresh(profile, [rendition]):
+            raise Http404
+        return redirect(thumbnails.url(profile, rendition))
+
+
+class ThumbnailView(LoginRequiredMixin, View):
+    """Sirve un derivado por su nombre con hash; el contenido no cambia nunca"""
+    def get(self, request, name):
+        match = thumbnails.NAME_PATTERN.match(name)
+        rendition = thumbnails.RENDITIONS.get(match['rendition']) if match else None
+        if rendition is None:
+            raise Http404
+        try:
+            image = default_storage.open(f"{thumbnails.THUMBNAIL_DIR}/{name}", 'rb')
+        except FileNotFoundError:
+            raise Http404
+        response = FileResponse(image, content_type=rendition.content_type)
+        patch_cache_control(response, private=True, max_age=thumbnails.MAX_AGE, immutable=True)
+        return response
+
+
 @login_required
 def organization_structure(request):
-    levels = OrganizationLevel.objects.all()
-    return render(request, 'users/organization_structure.html', {'levels': levels})
+    tree = OrganizationLevel.objects.build_tree()
+    return render(request, 'users/organization_structure.html', {'tree': tree})
 
 
 @login_required
@@ -107,7 +169,7 @@ def profile_view(request):
 @login_required
 def profile_edit(request):
     try:
-        profile = request.user.userprofile
+        profile = request.user.profile
     except UserProfile.DoesNotExist:
         profile = UserProfile(user=request.user)
 
@@ -115,7 +177,7 @@ def profile_edit(request):
         form = UserProfileForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
             form.save()
-            return redirect('profile_view')
+            return redirect('users:profile_view')
     else:
         form = UserProfileForm(instance=profile)
 
@@ -123,5 +185,10 @@ def profile_edit(request):
 
 @login_required
 def staff_directory(request):
-    profiles = UserProfile.objects.select_related('user', 'department').all()
-    return render(request, 'users/directory.html', {'profiles': profiles})
\ No newline at end of file
+    query = request.GET.get('q', '').strip()
+    page = directory.page(query, directory.read_cursor(request.GET.get('after')))
+    return render(request, 'users/directory.html', {
+        'profiles': page.profiles,
+        'next_cursor': page.next_cursor,
+        'query': query
+    })
\ No newline at end of file